@@ -0,0 +1,100 @@
+"""
+Measures sustained observation throughput of utilities.aio_client.AsyncAiClient.
+
+A minimal grpc.aio echo server runs in a separate process so that client and server
+do not share an event loop (or a core, if more than one is available).
+
+Run from the project root:
+    python -m benchmarks.bench_aio_client [num_observations] [max_concurrency]
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.aio_client import AsyncAiClient
+
+PORT = 50091
+
+
+class EchoServicer(nf_ai_comms_pb2_grpc.AiActionServiceServicer):
+    async def SendTaskObservation(self, request, context):
+        return nf_ai_comms_pb2.Action(observation_event_id=request.event_id, success=True)
+
+    async def SendTaskObservationBatch(self, request, context):
+        response = nf_ai_comms_pb2.ActionBatch()
+        for observation in request.observations:
+            response.actions.add(observation_event_id=observation.event_id, success=True)
+        return response
+
+
+def run_server(port, ready):
+    async def serve():
+        server = grpc.aio.server()
+        nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server(EchoServicer(), server)
+        server.add_insecure_port(f"localhost:{port}")
+        await server.start()
+        ready.set()
+        await server.wait_for_termination()
+    asyncio.run(serve())
+
+
+def make_observations(count):
+    return [
+        nf_ai_comms_pb2.TaskObservation(
+            event_id=f"bench_{i}", event_type="task_complete", pipeline_name="bench_pipeline",
+            process_name="bench_process", task_id_num=i, status="COMPLETED",
+        )
+        for i in range(count)
+    ]
+
+
+async def bench(count, max_concurrency):
+    observations = make_observations(count)
+    async with AsyncAiClient(f"localhost:{PORT}", max_concurrency=max_concurrency) as client:
+        await client.wait_for_ready(timeout=10)
+        await client.send_many(observations[:1000])  # Warm up
+
+        start = time.perf_counter()
+        actions = await client.send_many(observations)
+        elapsed = time.perf_counter() - start
+        assert len(actions) == count
+        print(f"send_many: {count} observations in {elapsed:.2f}s -> {count / elapsed:,.0f} obs/s")
+
+        start = time.perf_counter()
+        received = 0
+        async for _, result in client.stream(observations):
+            received += 1
+        elapsed = time.perf_counter() - start
+        print(f"stream:    {received} observations in {elapsed:.2f}s -> {received / elapsed:,.0f} obs/s")
+
+        for batch_size in (100, 500):
+            start = time.perf_counter()
+            actions = await client.send_many(observations, batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            assert len(actions) == count
+            print(f"send_many(batch_size={batch_size}): {count} observations in {elapsed:.2f}s "
+                  f"-> {count / elapsed:,.0f} obs/s")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    max_concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=run_server, args=(PORT, ready), daemon=True)
+    server.start()
+    try:
+        ready.wait(10)
+        print(f"{os.cpu_count()} CPU(s), max_concurrency={max_concurrency}")
+        asyncio.run(bench(count, max_concurrency))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
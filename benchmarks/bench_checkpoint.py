@@ -0,0 +1,78 @@
+"""
+Measures checkpoint overhead of the AiActionStreamer state against the size of that state.
+
+For each state size (tasks spread over pipelines of 10,000 tasks) it reports:
+    full ms / MB       - a full checkpoint: capture, encode, write and fsync
+    incr ms / KB       - an incremental checkpoint after 1% of the tasks changed
+    restore ms         - reading and replaying the base plus one journal record, i.e. the
+                         time a restarted actor spends before it can serve again
+    observe us         - SessionStore.observe() per call, change tracking included
+
+Run from the project root:
+    python -m benchmarks.bench_checkpoint [max_tasks]
+"""
+import asyncio
+import sys
+import tempfile
+import time
+
+from bioworkflowml.ai_action_streamer.state_checkpoint import StateCheckpointer
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.utilities.session_store import SessionStore
+
+TASKS_PER_PIPELINE = 10_000
+SIZES = (10_000, 100_000, 500_000)
+
+
+def make_observation(task, event_type):
+    return nf_ai_comms_pb2.TaskObservation(
+        event_type=event_type, pipeline_name=f"pipeline_{task // TASKS_PER_PIPELINE}", process_name=f"PROC_{task % 20}",
+        task_id_num=task + 1, task_hash=f"{task:08x}", status="COMPLETED", duration_ms=1000, realtime_ms=900,
+    )
+
+
+def fill(store, num_tasks):
+    starts = [make_observation(task, "task_start") for task in range(num_tasks)]
+    started = time.perf_counter()
+    for observation in starts:
+        store.observe(observation)
+    return (time.perf_counter() - started) / num_tasks * 1e6
+
+
+def measure(num_tasks, directory):
+    store = SessionStore(max_pipelines=10_000)
+    observe_us = fill(store, num_tasks)
+    checkpointer = StateCheckpointer(directory, store)
+
+    started = time.perf_counter()
+    full_bytes = checkpointer.checkpoint()
+    full_ms = (time.perf_counter() - started) * 1000
+
+    for task in range(0, num_tasks, 100):
+        store.observe(make_observation(task, "task_complete"))
+    started = time.perf_counter()
+    incremental_bytes = checkpointer.checkpoint()
+    incremental_ms = (time.perf_counter() - started) * 1000
+
+    restored = SessionStore(max_pipelines=10_000)
+    started = time.perf_counter()
+    records = asyncio.run(StateCheckpointer(directory, restored).restore())
+    restore_ms = (time.perf_counter() - started) * 1000
+    assert records == 2 and restored.stats()["tasks"] == num_tasks
+    return observe_us, full_ms, full_bytes, incremental_ms, incremental_bytes, restore_ms
+
+
+def main():
+    max_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1]
+    print(f"{'tasks':>10}{'observe us':>12}{'full ms':>10}{'full MB':>10}{'incr ms':>10}{'incr KB':>10}{'restore ms':>12}")
+    for num_tasks in SIZES:
+        if num_tasks > max_tasks:
+            break
+        with tempfile.TemporaryDirectory() as directory:
+            observe_us, full_ms, full_bytes, incremental_ms, incremental_bytes, restore_ms = measure(num_tasks, directory)
+        print(f"{num_tasks:>10,}{observe_us:>12.1f}{full_ms:>10.0f}{full_bytes / 1e6:>10.2f}"
+              f"{incremental_ms:>10.1f}{incremental_bytes / 1e3:>10.1f}{restore_ms:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
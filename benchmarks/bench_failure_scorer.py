@@ -0,0 +1,115 @@
+"""
+Measures FailureScorer cost per task_progress event, and how early it catches tasks that fail.
+
+Cost: RUNNING tasks each report progress every PROGRESS_INTERVAL_MS; events arrive round-robin
+and go through FailureScorer.observe(). Half the tasks carry a time limit, so the walltime check
+(against a recommender fed with WALLTIME_HISTORY completed tasks) runs on those past
+walltime_check_fraction of it. Reported: us/event and how many running tasks one core keeps up
+with at that reporting interval.
+
+Detection: a population of tasks with a memory limit of LIMIT_GB. Most plateau below it with
+noisy RSS; LEAKING_SHARE grow linearly at a random rate until they would be OOM-killed. Reported:
+the share of leaking tasks flagged before their OOM kill, the median and 10th percentile lead
+time (how long before the kill the flag came), and the share of healthy tasks flagged.
+
+Run from the project root:
+    python -m benchmarks.bench_failure_scorer [num_tasks]
+"""
+import random
+import statistics
+import sys
+import time
+
+from bioworkflowml.ai_action_streamer.failure_scorer import FailureScorer
+from bioworkflowml.ai_action_streamer.resource_recommender import ResourceRecommender
+from bioworkflowml.proto import nf_ai_comms_pb2
+
+GB = 1024 ** 3
+RUNNING = 5000
+PROGRESS_INTERVAL_MS = 5000
+WALLTIME_HISTORY = 10_000
+LIMIT_GB = 8
+LEAKING_SHARE = 0.1
+
+
+def progress(task_id_num, realtime_ms, rss_bytes, time_limit_ms=0):
+    return nf_ai_comms_pb2.TaskObservation(
+        event_type="task_progress", pipeline_name="p1", process_name="ALIGN", task_id_num=task_id_num,
+        realtime_ms=realtime_ms, rss_bytes=rss_bytes, memory_limit_bytes=LIMIT_GB * GB, time_limit_ms=time_limit_ms,
+    )
+
+
+def measure_cost(rounds):
+    rng = random.Random(1)
+    recommender = ResourceRecommender()
+    for _ in range(WALLTIME_HISTORY):
+        recommender.observe(nf_ai_comms_pb2.TaskObservation(
+            event_type="task_complete", status="COMPLETED", process_name="ALIGN", peak_rss_bytes=2 * GB,
+            realtime_ms=int(rng.lognormvariate(0, 0.3) * 600_000)))
+    scorer = FailureScorer(recommender)
+    # Healthy tasks with generous limits, so the cost measured is that of scoring, not of flagging,
+    # already past walltime_check_fraction of their limit, so half of the events run the walltime check.
+    events = [progress(task, 1_200_000 + step * PROGRESS_INTERVAL_MS, 2 * GB + rng.randrange(1 << 26),
+                       time_limit_ms=3_600_000 if task % 2 else 0)
+              for step in range(rounds) for task in range(RUNNING)]
+    started = time.perf_counter()
+    for event in events:
+        scorer.observe(event)
+    micros = (time.perf_counter() - started) / len(events) * 1e6
+    return micros, scorer.stats
+
+
+def simulate(num_tasks):
+    rng = random.Random(42)
+    scorer = FailureScorer()
+    lead_times = []
+    missed = false_positives = healthy = 0
+    for task in range(num_tasks):
+        base = rng.uniform(1, 5) * GB
+        leaking = rng.random() < LEAKING_SHARE
+        rate = rng.uniform(2, 50) * 1024 ** 2 / 1000 if leaking else 0.0  # Bytes per ms
+        duration_ms = rng.randint(60, 3600) * 1000
+        flagged_at = None
+        killed_at = None
+        for realtime_ms in range(0, duration_ms, PROGRESS_INTERVAL_MS):
+            rss = base * min(1.0, 0.5 + realtime_ms / 120_000) + rate * realtime_ms + rng.gauss(0, 0.02) * base
+            if rss >= LIMIT_GB * GB:
+                killed_at = realtime_ms
+                break
+            termination = scorer.observe(progress(task, realtime_ms, int(rss)))
+            if termination is not None and flagged_at is None:
+                flagged_at = realtime_ms
+        scorer.observe(nf_ai_comms_pb2.TaskObservation(event_type="task_complete", pipeline_name="p1",
+                                                       task_id_num=task))
+        if killed_at is not None:
+            if flagged_at is None:
+                missed += 1
+            else:
+                lead_times.append((killed_at - flagged_at) / 1000)
+        else:
+            healthy += 1
+            false_positives += flagged_at is not None
+    return lead_times, missed, healthy, false_positives
+
+
+def main():
+    num_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    micros, stats = measure_cost(20)
+    print(f"{RUNNING} running tasks, progress every {PROGRESS_INTERVAL_MS / 1000:.0f} s")
+    print(f"{'scoring':<24}{micros:>8.2f} us/event")
+    print(f"{'capacity':<24}{1e6 / micros * PROGRESS_INTERVAL_MS / 1000:>8.0f} running tasks per core")
+    print(f"{'flagged (healthy)':<24}{stats['flagged_memory'] + stats['flagged_walltime']:>8}")
+
+    lead_times, missed, healthy, false_positives = simulate(num_tasks)
+    caught = len(lead_times)
+    print(f"\n{num_tasks} tasks, {LIMIT_GB} GB limit: {caught + missed} OOM-killed, {healthy} healthy")
+    print(f"{'caught before OOM':<24}{caught / max(1, caught + missed):>8.1%}")
+    if lead_times:
+        lead_times.sort()
+        print(f"{'median lead time':<24}{statistics.median(lead_times):>8.0f} s")
+        print(f"{'p10 lead time':<24}{lead_times[len(lead_times) // 10]:>8.0f} s")
+    print(f"{'false positives':<24}{false_positives / max(1, healthy):>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
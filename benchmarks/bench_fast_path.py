@@ -0,0 +1,87 @@
+"""
+Measures what the fast path saves on a scatter-heavy stream through the AiActionStreamer servicer.
+
+A pipeline scatters SHARDS identical tasks of one process. Each sends task_submit, task_start,
+PROGRESS_EVENTS task_progress and task_complete, in batches of BATCH_SIZE. The servicer is set up
+like the actor's (session store, resource recommender, failure scorer, scheduling advisor) and
+processes the stream:
+    full        without a fast path: every observation is decided
+    aggregate   task_start aggregated
+    + sample    also task_progress sampled at 10% (the failure scorer then sees a tenth of them)
+Reported: us per observation, the share of observations that got a canned Action, and the cost
+of a canned Action on its own.
+
+Run from the project root:
+    python -m benchmarks.bench_fast_path [shards]
+"""
+import sys
+import time
+
+from bioworkflowml.ai_action_streamer.ai_action_streamer_server import AiActionServicer
+from bioworkflowml.ai_action_streamer.failure_scorer import FailureScorer
+from bioworkflowml.ai_action_streamer.resource_recommender import ResourceRecommender
+from bioworkflowml.ai_action_streamer.scheduling_advisor import SchedulingAdvisor
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.utilities.fast_path import FastPath
+from bioworkflowml.utilities.session_store import SessionStore
+
+PROGRESS_EVENTS = 3
+BATCH_SIZE = 500
+MODES = {
+    "full": None,
+    "aggregate": "task_start=aggregate",
+    "+ sample": "task_start=aggregate, task_progress=sample:0.1",
+}
+
+
+def scatter_stream(shards):
+    observations = []
+    for task_id in range(1, shards + 1):
+        fields = dict(pipeline_name="p1", process_name="SCATTER_SHARD", task_id_num=task_id)
+        observations.append(nf_ai_comms_pb2.TaskObservation(event_type="task_submit", cpus=1, **fields))
+        observations.append(nf_ai_comms_pb2.TaskObservation(event_type="task_start", status="RUNNING", **fields))
+        for reading in range(1, PROGRESS_EVENTS + 1):
+            observations.append(nf_ai_comms_pb2.TaskObservation(
+                event_type="task_progress", realtime_ms=reading * 5000, rss_bytes=reading << 20, **fields))
+        observations.append(nf_ai_comms_pb2.TaskObservation(
+            event_type="task_complete", status="COMPLETED", realtime_ms=20_000, peak_rss_bytes=3 << 20, **fields))
+    for index, observation in enumerate(observations):
+        observation.event_id = f"e{index}"
+    return observations
+
+
+def run(observations, spec):
+    recommender = ResourceRecommender()
+    fast_path = FastPath.from_spec(spec) if spec else None
+    servicer = AiActionServicer(session_store=SessionStore(), resource_recommender=recommender,
+                                failure_scorer=FailureScorer(recommender), scheduling_advisor=SchedulingAdvisor(),
+                                fast_path=fast_path)
+    started = time.perf_counter()
+    for start in range(0, len(observations), BATCH_SIZE):
+        servicer._process_batch(observations[start:start + BATCH_SIZE])
+    elapsed = time.perf_counter() - started
+    stats = fast_path.stats() if fast_path else {}
+    canned = stats.get("aggregated", 0) + stats.get("sampled_out", 0)
+    return elapsed / len(observations) * 1e6, canned / len(observations)
+
+
+def main():
+    shards = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    observations = scatter_stream(shards)
+    print(f"{shards} shards, {len(observations)} observations in batches of {BATCH_SIZE}")
+    print(f"{'mode':<12}{'us/obs':>8}{'canned':>8}{'speedup':>9}")
+    baseline = None
+    for mode, spec in MODES.items():
+        micros, canned = min(run(observations, spec) for _ in range(5))
+        baseline = baseline or micros
+        print(f"{mode:<12}{micros:>8.2f}{canned:>8.0%}{baseline / micros:>8.2f}x")
+
+    starts = [o for o in observations if o.event_type == "task_start"]
+    servicer = AiActionServicer(fast_path=FastPath.from_spec("task_start=aggregate"))
+    started = time.perf_counter()
+    servicer._process_batch(starts)
+    print(f"canned Action alone: {(time.perf_counter() - started) / len(starts) * 1e6:.2f} us/obs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Compares TCP, Unix domain socket and shared-memory transports between co-located processes.
+
+The server runs in a separate process, with the AiServer servicer (logging disabled) listening
+on TCP, on a Unix domain socket and on a shared-memory control socket at the same time.
+Reported:
+    unary latency      - sequential SendTaskObservation calls over TCP and UDS
+    batch latency      - sequential batches of BATCH_SIZE (TCP, UDS, shared memory)
+    batch throughput   - observations/s with batches pipelined (AsyncAiClient for gRPC,
+                         ShmBatchClient.send_many for shared memory)
+
+Run from the project root:
+    python -m benchmarks.bench_local_transport [num_observations]
+"""
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent import futures
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.aio_client import AsyncAiClient
+from bioworkflowml.utilities.shm_transport import ShmBatchClient, ShmBatchServer, batch_method_handler
+
+PORT = 50093
+BATCH_SIZE = 500
+UNARY_CALLS = 2000
+BATCH_CALLS = 200
+
+
+def serve(uds_path, shm_path, ready):
+    servicer = AiActionServiceServicer(lambda message: None)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server(servicer, server)
+    server.add_insecure_port(f"localhost:{PORT}")
+    server.add_insecure_port(f"unix:{uds_path}")
+    server.start()
+    ShmBatchServer(batch_method_handler(servicer)[1], shm_path).start()
+    ready.set()
+    server.wait_for_termination()
+
+
+def make_observations(count):
+    return [
+        nf_ai_comms_pb2.TaskObservation(
+            event_id=f"bench_{i}", event_type="task_complete", pipeline_name="bench_pipeline",
+            process_name="ALIGN", task_id_num=i, status="COMPLETED", duration_ms=1000,
+        )
+        for i in range(count)
+    ]
+
+
+def median_us(samples):
+    return statistics.median(samples) * 1e6
+
+
+def time_calls(call, requests):
+    samples = []
+    for request in requests:
+        start = time.perf_counter()
+        call(request)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def grpc_latencies(target, observations):
+    with grpc.insecure_channel(target) as channel:
+        stub = nf_ai_comms_pb2_grpc.AiActionServiceStub(channel)
+        grpc.channel_ready_future(channel).result(timeout=10)
+        unary = time_calls(stub.SendTaskObservation, observations[:UNARY_CALLS])
+        batches = [nf_ai_comms_pb2.TaskObservationBatch(observations=observations[:BATCH_SIZE])] * BATCH_CALLS
+        batch = time_calls(stub.SendTaskObservationBatch, batches)
+    return median_us(unary), median_us(batch)
+
+
+async def grpc_throughput(target, observations):
+    async with AsyncAiClient(target, max_concurrency=8) as client:
+        await client.wait_for_ready(timeout=10)
+        start = time.perf_counter()
+        actions = await client.send_many(observations, batch_size=BATCH_SIZE)
+        elapsed = time.perf_counter() - start
+    assert len(actions) == len(observations)
+    return len(observations) / elapsed
+
+
+def shm_measurements(shm_path, observations):
+    with ShmBatchClient(shm_path) as client:
+        batch = time_calls(client.send_batch, [observations[:BATCH_SIZE]] * BATCH_CALLS)
+        start = time.perf_counter()
+        actions = client.send_many(observations, batch_size=BATCH_SIZE)
+        elapsed = time.perf_counter() - start
+    assert len(actions) == len(observations)
+    return median_us(batch), len(observations) / elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    observations = make_observations(count)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        uds_path = os.path.join(tmp_dir, "ai.sock")
+        shm_path = os.path.join(tmp_dir, "ai.shm.sock")
+        ready = multiprocessing.Event()
+        server = multiprocessing.Process(target=serve, args=(uds_path, shm_path, ready), daemon=True)
+        server.start()
+        ready.wait(timeout=30)
+        try:
+            print(f"{os.cpu_count()} CPU(s), batch size {BATCH_SIZE}, {count} observations for throughput")
+            print(f"{'transport':<16}{'unary p50 us':>14}{'batch p50 us':>14}{'batch obs/s':>14}")
+            for name, target in (("tcp", f"localhost:{PORT}"), ("uds", f"unix:{uds_path}")):
+                unary, batch = grpc_latencies(target, observations)
+                throughput = asyncio.run(grpc_throughput(target, observations))
+                print(f"{name:<16}{unary:>14.0f}{batch:>14.0f}{throughput:>14,.0f}")
+            batch, throughput = shm_measurements(shm_path, observations)
+            print(f"{'shared memory':<16}{'-':>14}{batch:>14.0f}{throughput:>14,.0f}")
+        finally:
+            server.terminate()
+            server.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Measures ResourceRecommender cost per observation, and what its recommendations save.
+
+Cost: ResourceRecommender.observe() for task_complete observations (learning, including the
+periodic table refresh) and for other events (a table lookup).
+
+Savings: tasks of PROCESSES run one after another. Each process's peak memory is lognormal
+around its median. Two ways of requesting memory are compared:
+    static       - a fixed request per process of STATIC_FACTOR x its median, as hand-written
+                   Nextflow configs tend to be
+    recommended  - the recommender's memory_bytes once it has one, the static request before
+A task whose peak exceeds its request fails and is retried with twice the request. Reported:
+mean memory reserved per task (retries included), the share of tasks that failed at least once,
+and how many such tasks fit at once in a CLUSTER_GB cluster.
+
+Run from the project root:
+    python -m benchmarks.bench_resource_recommender [tasks_per_process]
+"""
+import random
+import sys
+import time
+
+from bioworkflowml.ai_action_streamer.resource_recommender import ResourceRecommender
+from bioworkflowml.proto import nf_ai_comms_pb2
+
+GB = 1024 ** 3
+CLUSTER_GB = 1024
+STATIC_FACTOR = 4.0
+# process_name: (median peak memory in GB, lognormal sigma)
+PROCESSES = {"FASTQC": (0.4, 0.2), "STAR_ALIGN": (28.0, 0.15), "SAMTOOLS_SORT": (3.0, 0.5),
+             "SALMON_QUANT": (6.0, 0.3), "MULTIQC": (1.5, 0.6)}
+
+
+def observation(process_name, peak_rss_bytes, event_type="task_complete", status="COMPLETED"):
+    return nf_ai_comms_pb2.TaskObservation(event_type=event_type, process_name=process_name, status=status,
+                                           peak_rss_bytes=peak_rss_bytes, cpu_percent="95.0%", realtime_ms=60_000)
+
+
+def measure_cost(count):
+    recommender = ResourceRecommender()
+    rng = random.Random(1)
+    completes = [observation("P%d" % (i % 50), int(rng.lognormvariate(21, 0.5))) for i in range(count)]
+    starts = [observation("P%d" % (i % 50), 0, event_type="task_start", status="RUNNING") for i in range(count)]
+    results = {}
+    for name, observations in (("learn (task_complete)", completes), ("lookup (other events)", starts)):
+        started = time.perf_counter()
+        for o in observations:
+            recommender.observe(o)
+        results[name] = (time.perf_counter() - started) / count * 1e6
+    return results
+
+
+def simulate(tasks_per_process, use_recommender):
+    rng = random.Random(42)
+    recommender = ResourceRecommender()
+    reserved = 0.0
+    failed_tasks = 0
+    for process_name, (median_gb, sigma) in PROCESSES.items():
+        static_request = median_gb * STATIC_FACTOR * GB
+        for _ in range(tasks_per_process):
+            peak = rng.lognormvariate(0, sigma) * median_gb * GB
+            recommendation = recommender.recommend(process_name) if use_recommender else None
+            request = recommendation.memory_bytes if recommendation is not None else static_request
+            reserved += request
+            if peak > request:
+                failed_tasks += 1
+                while peak > request:
+                    request *= 2
+                    reserved += request
+            recommender.observe(observation(process_name, int(peak)))
+    total = tasks_per_process * len(PROCESSES)
+    mean_reserved_gb = reserved / total / GB
+    return mean_reserved_gb, failed_tasks / total, CLUSTER_GB / mean_reserved_gb
+
+
+def main():
+    tasks_per_process = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for name, micros in measure_cost(100_000).items():
+        print(f"{name:<24}{micros:>8.2f} us/observation")
+    print(f"\n{tasks_per_process} tasks per process, {CLUSTER_GB} GB cluster")
+    print(f"{'requests':<14}{'GB/task':>10}{'failed':>9}{'tasks at once':>15}")
+    for name, use_recommender in (("static", False), ("recommended", True)):
+        mean_reserved_gb, failure_rate, concurrent = simulate(tasks_per_process, use_recommender)
+        print(f"{name:<14}{mean_reserved_gb:>10.2f}{failure_rate:>9.1%}{concurrent:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Evaluates SchedulingAdvisor on simulated workflow runs (state_simulation/cloudy/workflow_sim.py).
+
+Each workflow runs on a cluster too small to start all ready tasks at once, under:
+    fifo   - Nextflow's order: ready tasks as they became ready, skipping those that do not fit
+    cold   - the advisor's dispatch_order on a first run: no durations, and the process graph is
+             only learned as downstream tasks get submitted
+    warm   - the advisor's dispatch_order after it saw a previous run of the same workflow (same
+             shape, other task durations)
+The advisor only sees what Nextflow would send: task_submit (with cpus, memory_limit_bytes and
+upstream_processes), task_start and task_complete (with realtime_ms). Reported: the makespan
+under each, the improvement over fifo, and the advisor's cost per observation.
+
+Run from the project root:
+    python -m benchmarks.bench_scheduling_advisor [runs_per_workflow]
+"""
+import random
+import statistics
+import sys
+import time
+
+from bioworkflowml.ai_action_streamer.scheduling_advisor import SchedulingAdvisor
+from bioworkflowml.proto import nf_ai_comms_pb2
+from state_simulation.cloudy.workflow_sim import GB, FifoDispatcher, random_layered, rnaseq_like, simulate
+
+# name: (workflow factory taking (rng, shape seed), cluster cpus, cluster memory)
+WORKFLOWS = {
+    "rnaseq, 48 samples": (lambda rng, seed: rnaseq_like(48, rng), 64, 256 * GB),
+    "rnaseq, 200 samples": (lambda rng, seed: rnaseq_like(200, rng), 256, 1024 * GB),
+    "random DAG, 12 processes": (lambda rng, seed: random_layered(12, 40, rng, shape_seed=seed), 96, 384 * GB),
+    "random DAG, 20 processes": (lambda rng, seed: random_layered(20, 10, rng, layers=5, shape_seed=seed),
+                                 32, 128 * GB),
+    "random DAG, 30 processes": (lambda rng, seed: random_layered(30, 20, rng, layers=6, shape_seed=seed),
+                                 128, 512 * GB),
+}
+
+
+class AdvisorDispatcher:
+    """Turns simulator events into TaskObservations and starts tasks in the advisor's dispatch_order."""
+
+    def __init__(self, advisor, workflow, cpus, memory_bytes):
+        self.advisor = advisor
+        self.workflow = workflow
+        self.tasks = {task.task_id: task for task in workflow.tasks}
+        self.observe_s = 0.0
+        self.observations = 0
+        advisor.set_capacity(workflow.name, cpus=cpus, memory_bytes=memory_bytes)
+
+    def _observe(self, event_type, task, **fields):
+        observation = nf_ai_comms_pb2.TaskObservation(
+            event_type=event_type, pipeline_name=self.workflow.name, process_name=task.process_name,
+            task_id_num=task.task_id, **fields)
+        started = time.perf_counter()
+        self.advisor.observe(observation)
+        self.observe_s += time.perf_counter() - started
+        self.observations += 1
+
+    def ready(self, task, now):
+        self._observe("task_submit", task, cpus=task.cpus, memory_limit_bytes=task.memory_bytes,
+                      upstream_processes=sorted(self.workflow.upstream_processes[task.process_name]))
+
+    def started(self, task, now):
+        self._observe("task_start", task)
+
+    def completed(self, task, now):
+        self._observe("task_complete", task, status="COMPLETED", realtime_ms=task.duration_ms)
+
+    def pick(self, free_cpus, free_memory_bytes):
+        # The advice already accounts for the running tasks the advisor was told about
+        return [self.tasks[task_id] for task_id in self.advisor.advise(self.workflow.name)]
+
+
+def run_advised(workflow, cpus, memory_bytes, advisor):
+    dispatcher = AdvisorDispatcher(advisor, workflow, cpus, memory_bytes)
+    result = simulate(workflow, cpus, memory_bytes, dispatcher)
+    advisor.observe(nf_ai_comms_pb2.TaskObservation(event_type="workflow_complete", pipeline_name=workflow.name))
+    return result, dispatcher.observe_s / dispatcher.observations * 1e6
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"{runs} runs per workflow; makespan in minutes (mean), improvement over fifo (mean, worst)")
+    print(f"{'workflow':<28}{'fifo':>8}{'cold':>8}{'warm':>8}{'cold gain':>16}{'warm gain':>16}{'us/obs':>8}")
+    for name, (factory, cpus, memory_bytes) in WORKFLOWS.items():
+        makespans = {"fifo": [], "cold": [], "warm": []}
+        micros = []
+        for seed in range(runs):
+            previous = factory(random.Random(1000 + seed), seed)
+            workflow = factory(random.Random(seed), seed)
+            makespans["fifo"].append(simulate(workflow, cpus, memory_bytes, FifoDispatcher()).makespan_ms)
+            cold, cost = run_advised(workflow, cpus, memory_bytes, SchedulingAdvisor())
+            makespans["cold"].append(cold.makespan_ms)
+            micros.append(cost)
+            advisor = SchedulingAdvisor()
+            run_advised(previous, cpus, memory_bytes, advisor)  # Same workflow, different durations
+            warm, cost = run_advised(workflow, cpus, memory_bytes, advisor)
+            makespans["warm"].append(warm.makespan_ms)
+            micros.append(cost)
+        gains = {mode: [1 - m / f for m, f in zip(makespans[mode], makespans["fifo"])] for mode in ("cold", "warm")}
+        print(f"{name:<28}" + "".join(f"{statistics.mean(makespans[m]) / 60_000:>8.0f}" for m in makespans)
+              + "".join(f"{statistics.mean(gains[m]):>9.1%} ({min(gains[m]):>5.1%})" for m in gains)
+              + f"{statistics.mean(micros):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
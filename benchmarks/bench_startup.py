@@ -0,0 +1,102 @@
+"""
+Measures what a short-lived process (e.g. a Nextflow hook) pays before its first Action arrives.
+
+Each scenario runs in a fresh interpreter, several times, against a local AI server:
+    direct  - imports utilities.nf_client and calls send_task_observation()
+    daemon  - sends through a running utilities.client_daemon with utilities.daemon_client
+Import times of the heavy modules are reported alongside for reference.
+
+Run from the project root:
+    python -m benchmarks.bench_startup [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent import futures
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DIRECT = """
+from bioworkflowml.utilities.nf_client import send_task_observation
+send_task_observation({{"event_type": "task_start"}}, "{address}").result(timeout=10)
+"""
+
+DAEMON = """
+from bioworkflowml.utilities.daemon_client import send_observation
+send_observation({{"event_type": "task_start"}}, "{socket_path}")
+"""
+
+IMPORTS = {
+    "python (empty)": "pass",
+    "grpc": "import grpc",
+    "utilities.nf_client": "import bioworkflowml.utilities.nf_client",
+    "utilities.daemon_client": "import bioworkflowml.utilities.daemon_client",
+    "ai_action_streamer servicer": "import bioworkflowml.ai_action_streamer.ai_action_streamer_server",
+    "ray": "import ray",
+}
+
+
+def time_process(code, runs):
+    """Median and min wall time, in ms, of `python -c code` from launch to exit."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), min(samples)
+
+
+def wait_for_socket(path, timeout_s=10.0):
+    deadline = time.monotonic() + timeout_s
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Client daemon did not create {path}")
+        time.sleep(0.01)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server(AiActionServiceServicer(lambda message: None), server)
+    address = f"localhost:{server.add_insecure_port('localhost:0')}"
+    server.start()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = os.path.join(tmp_dir, "client.sock")
+        daemon = subprocess.Popen([sys.executable, "-m", "bioworkflowml.utilities.client_daemon", "--socket", socket_path,
+                                   "--server", address], cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL)
+        try:
+            wait_for_socket(socket_path)
+            print(f"Time to first Action from a fresh process ({runs} runs):")
+            print(f"{'scenario':<30}{'median ms':>12}{'min ms':>10}")
+            for name, code in (("direct (nf_client)", DIRECT.format(address=address)),
+                               ("via client daemon", DAEMON.format(socket_path=socket_path))):
+                median, fastest = time_process(code, runs)
+                print(f"{name:<30}{median:>12.1f}{fastest:>10.1f}")
+        finally:
+            daemon.terminate()
+            daemon.wait()
+    server.stop(0)
+
+    print("\nProcess start plus import:")
+    for name, code in IMPORTS.items():
+        try:
+            median, fastest = time_process(code, runs)
+        except subprocess.CalledProcessError:
+            print(f"{name:<30}{'not installed':>12}")
+            continue
+        print(f"{name:<30}{median:>12.1f}{fastest:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
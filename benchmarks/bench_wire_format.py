@@ -0,0 +1,130 @@
+"""
+Compares payload size and CPU cost of the wire formats for observation batches.
+
+Observations mimic a Nextflow run: every task reports task_submit, task_start and
+task_complete, with UUID event_ids, ISO timestamps, hashes, names and native job IDs.
+For each mode, over batches of BATCH_SIZE:
+    bytes/obs       - request bytes per observation on the wire. gRPC compresses with zlib at
+                      its default level, which is what is applied here.
+    encode us/obs   - client CPU to build and serialize the request (dedup encoding included),
+                      plus compression
+    call us/obs     - client and server CPU per observation for SendTaskObservationBatch /
+                      SendEncodedObservationBatch calls to an in-process server, with gRPC
+                      doing the (de)compression of the batch and, as the client names its
+                      compression in the call metadata, of the ActionBatch reply
+
+Run from the project root:
+    python -m benchmarks.bench_wire_format [num_observations]
+"""
+import datetime
+import gzip
+import sys
+import time
+import uuid
+import zlib
+from concurrent import futures
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.wire_format import compression_metadata, encode_batch
+
+BATCH_SIZE = 500
+PROCESSES = ["FASTQC", "TRIMGALORE", "STAR_ALIGN", "SAMTOOLS_SORT", "SALMON_QUANT", "MULTIQC"]
+
+# name: (dedup strings, grpc compression, size function)
+MODES = {
+    "none": (False, None, len),
+    "gzip": (False, grpc.Compression.Gzip, lambda data: len(gzip.compress(data))),
+    "deflate": (False, grpc.Compression.Deflate, lambda data: len(zlib.compress(data))),
+    "dedup": (True, None, len),
+    "dedup+gzip": (True, grpc.Compression.Gzip, lambda data: len(gzip.compress(data))),
+    "dedup+deflate": (True, grpc.Compression.Deflate, lambda data: len(zlib.compress(data))),
+}
+
+
+def make_observations(count):
+    start = datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+    observations = []
+    task = 0
+    while len(observations) < count:
+        task += 1
+        process = PROCESSES[task % len(PROCESSES)]
+        for step, (event_type, status) in enumerate((("task_submit", "SUBMITTED"), ("task_start", "RUNNING"),
+                                                      ("task_complete", "COMPLETED"))):
+            observation = nf_ai_comms_pb2.TaskObservation(
+                event_id=str(uuid.uuid4()), event_type=event_type,
+                timestamp_iso=(start + datetime.timedelta(milliseconds=task * 37 + step * 1500)).isoformat(),
+                pipeline_name="nf-core/rnaseq", process_name=process, task_id_num=task,
+                task_hash=f"{task * 2654435761 % 256:02x}/{task * 40503 % 16**6:06x}",
+                task_name=f"NFCORE_RNASEQ:RNASEQ:{process} (sample_{task % 48})", native_id=str(4_000_000 + task),
+                status=status,
+            )
+            if event_type == "task_complete":
+                observation.exit_code = 0
+                observation.duration_ms = 60_000 + task % 1000
+                observation.realtime_ms = 55_000 + task % 1000
+                observation.cpu_percent = f"{90 + task % 10}.{task % 10}%"
+                observation.peak_rss_bytes = 2_000_000_000 + task * 4096
+            observations.append(observation)
+    return observations[:count]
+
+
+def batches(observations):
+    return [observations[i:i + BATCH_SIZE] for i in range(0, len(observations), BATCH_SIZE)]
+
+
+def build_request(batch, dedup):
+    if dedup:
+        return encode_batch(batch)
+    return nf_ai_comms_pb2.TaskObservationBatch(observations=batch)
+
+
+def measure_encoding(chunks, dedup, size):
+    total_bytes = 0
+    started = time.process_time()
+    for batch in chunks:
+        total_bytes += size(build_request(batch, dedup).SerializeToString())
+    return total_bytes, time.process_time() - started
+
+
+def measure_calls(stub, chunks, dedup, compression):
+    call = stub.SendEncodedObservationBatch if dedup else stub.SendTaskObservationBatch
+    started = time.process_time()
+    for batch in chunks:
+        response = call(build_request(batch, dedup), compression=compression, timeout=30,
+                        metadata=compression_metadata(compression))
+        assert len(response.actions) == len(batch)
+    return time.process_time() - started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    chunks = batches(make_observations(count))
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server(AiActionServiceServicer(lambda message: None), server)
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    try:
+        with grpc.insecure_channel(f"localhost:{port}") as channel:
+            stub = nf_ai_comms_pb2_grpc.AiActionServiceStub(channel)
+            measure_calls(stub, chunks[:2], False, None)  # Warm-up
+            print(f"{count} observations in batches of {BATCH_SIZE}")
+            print(f"{'mode':<16}{'bytes/obs':>10}{'ratio':>8}{'encode us/obs':>15}{'call us/obs':>13}")
+            baseline = None
+            for name, (dedup, compression, size) in MODES.items():
+                total_bytes, encode_s = measure_encoding(chunks, dedup, size)
+                call_s = measure_calls(stub, chunks, dedup, compression)
+                per_observation = total_bytes / count
+                baseline = baseline or per_observation
+                print(f"{name:<16}{per_observation:>10.1f}{baseline / per_observation:>7.2f}x"
+                      f"{encode_s / count * 1e6:>15.2f}{call_s / count * 1e6:>13.2f}")
+    finally:
+        server.stop(0)
+
+
+if __name__ == "__main__":
+    main()
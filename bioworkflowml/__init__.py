@@ -0,0 +1,3 @@
+# The bioworkflowml distribution: proto (generated gRPC code), utilities (clients and AiServer)
+# and ai_action_streamer (the Ray actor). One top-level package, so installing it cannot shadow
+# other distributions' generic top-level names (proto-plus installs `proto`).
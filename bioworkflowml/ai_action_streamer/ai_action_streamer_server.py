@@ -0,0 +1,436 @@
+import grpc
+import os
+import time
+import asyncio
+from concurrent import futures
+import uuid # For generating unique action IDs
+
+# Import the generated gRPC files
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+
+from bioworkflowml.ai_action_streamer.failure_scorer import FailureScorer
+from bioworkflowml.ai_action_streamer.policy_registry import PolicyRegistry
+from bioworkflowml.ai_action_streamer.resource_recommender import ResourceRecommender
+from bioworkflowml.ai_action_streamer.scheduling_advisor import SchedulingAdvisor
+from bioworkflowml.ai_action_streamer.state_checkpoint import StateCheckpointer
+from bioworkflowml.utilities.fast_path import FastPath
+from bioworkflowml.utilities.metrics import ServerMetrics
+from bioworkflowml.utilities.reply_cache import DONE, NEW, ReplyCache
+from bioworkflowml.utilities.session_store import SessionStore
+from bioworkflowml.utilities.shm_transport import SHM_SUPPORTED, ShmBatchServer, batch_method_handler
+from bioworkflowml.utilities import tracing
+from bioworkflowml.utilities.wire_format import compression_algorithm, decode_observations, set_response_compression
+
+
+def default_warmup_observations():
+    """A small sample batch used to warm up freshly loaded policies before they go live."""
+    return [
+        nf_ai_comms_pb2.TaskObservation(
+            event_id=f"warmup_{i}",
+            event_type=event_type,
+            pipeline_name="warmup_pipeline",
+            process_name="warmup_process",
+            task_id_num=i,
+            status=status,
+        )
+        for i, (event_type, status) in enumerate([
+            ("task_start", "RUNNING"),
+            ("task_complete", "COMPLETED"),
+            ("task_complete", "FAILED"),
+        ])
+    ]
+
+
+# Define the servicer class that implements the RPC methods
+class AiActionServicer(nf_ai_comms_pb2_grpc.AiActionServiceServicer):
+    def __init__(self, policy_registry=None, session_store=None, resource_recommender=None, failure_scorer=None,
+                 scheduling_advisor=None, fast_path=None, reply_cache=None, compression=None, metrics=None):
+        self.policy_registry = policy_registry or PolicyRegistry(warmup_observations=default_warmup_observations())
+        # Optional: gives policies the observation's task history (see utilities/session_store.py).
+        self.session_store = session_store
+        # Optional: attaches a ResourceRecommendation for the observation's process to each Action.
+        self.resource_recommender = resource_recommender
+        # Optional: attaches an EarlyTermination to Actions for task_progress events predicting failure.
+        self.failure_scorer = failure_scorer
+        # Optional: attaches a SchedulingAdvice on the order to start the pipeline's pending tasks in.
+        self.scheduling_advisor = scheduling_advisor
+        # Optional: acknowledges low-value observations with a canned Action instead of deciding
+        # (see utilities/fast_path.py). Those still update the session store, the scheduling advisor
+        # and the resource models, but skip the policy, the failure scorer and the attached advice.
+        self.fast_path = fast_path
+        # Optional: answers a retried event_id with the first reply instead of deciding it again
+        # (see utilities/reply_cache.py). Checked before everything else.
+        self.reply_cache = reply_cache
+        # Compression of batch replies the client did not choose one for (see utilities/wire_format.py).
+        self.compression = compression
+        # Optional ServerMetrics: counts the observations of encoded batches once they are decoded.
+        self.metrics = metrics
+
+    def _track(self, observation):
+        # The state updates of _decide without the decision, for fast-pathed observations: sessions,
+        # pending tasks and resource models stay right whatever the fast path routes.
+        if self.session_store is not None:
+            self.session_store.observe(observation)
+        if self.scheduling_advisor is not None:
+            self.scheduling_advisor.track(observation)
+        if self.resource_recommender is not None and observation.event_type == "task_complete":
+            self.resource_recommender.learn(observation)
+
+    def _decide(self, request):
+        """Returns the Action fields decided for an observation, as keyword arguments."""
+        task = self.session_store.observe(request) if self.session_store is not None else None
+        with tracing.stage("server.policy"):
+            action_details, policy_version = self.policy_registry.decide(request, task)
+        # The entry is resolved once per observation, so a concurrent reload cannot mix versions.
+        self.policy_registry.maybe_shadow(request, action_details, task)
+        decision = {"action_details": action_details, "policy_version": policy_version}
+        if self.resource_recommender is not None:
+            decision["resource_recommendation"] = self.resource_recommender.observe(request)
+        if self.failure_scorer is not None:
+            decision["early_termination"] = self.failure_scorer.observe(request)
+        if self.scheduling_advisor is not None:
+            decision["scheduling_advice"] = self.scheduling_advisor.observe(request)
+        return decision
+
+    async def SendTaskObservation(self, request: nf_ai_comms_pb2.TaskObservation, context):
+        print(f"AiActionStreamer: Received observation_event_id: {request.event_id}, type: {request.event_type}")
+        print(f"  Pipeline: {request.pipeline_name}, Process: {request.process_name}, Task: {request.task_name}")
+
+        reply_cache = self.reply_cache
+        if reply_cache is not None:
+            state, cached = reply_cache.begin(request.event_id)
+            if state == DONE:
+                print(f"  Sending cached action_id: {cached.action_id} (retried observation)")
+                return cached
+            if state != NEW:
+                await context.abort(grpc.StatusCode.ABORTED, f"Observation {request.event_id} is still being processed")
+        try:
+            fields = self._action_fields(request)
+        except BaseException:
+            if reply_cache is not None:
+                reply_cache.abandon(request.event_id)
+            raise
+        if "policy_version" in fields:
+            print(f"  Sending action_id: {fields['action_id']} (policy {fields['policy_version']})")
+        else:
+            print(f"  Sending action_id: {fields['action_id']} ({fields['action_details']})")
+        action = nf_ai_comms_pb2.Action(**fields)
+        if reply_cache is not None:
+            reply_cache.complete(request.event_id, action)
+        return action
+
+    async def SendTaskObservationBatch(self, request: nf_ai_comms_pb2.TaskObservationBatch, context):
+        print(f"AiActionStreamer: Received batch of {len(request.observations)} observations")
+        set_response_compression(context, len(request.observations), self.compression)
+        return self._process_batch(request.observations)
+
+    async def SendEncodedObservationBatch(self, request: nf_ai_comms_pb2.EncodedObservationBatch, context):
+        print(f"AiActionStreamer: Received encoded batch of {len(request.observations)} observations")
+        try:
+            observations = decode_observations(request)
+        except ValueError as e:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Malformed EncodedObservationBatch: {e}")
+        if self.metrics is not None:
+            for observation in observations:
+                self.metrics.record_observation(observation)
+        set_response_compression(context, len(observations), self.compression)
+        return self._process_batch(observations)
+
+    def _action_fields(self, observation):
+        """Returns the fields of the Action for an observation: canned by the fast path, or decided."""
+        canned = self.fast_path.route(observation) if self.fast_path is not None else None
+        if canned is not None:
+            self._track(observation)
+            canned["observation_event_id"] = observation.event_id
+            return canned
+        return dict(
+            observation_event_id=observation.event_id,
+            action_id=f"act_{uuid.uuid4()}",
+            success=True,
+            message=f"AiActionStreamer: Processed observation_event_id {observation.event_id}",
+            **self._decide(observation)
+        )
+
+    def _process_batch(self, observations):
+        response = nf_ai_comms_pb2.ActionBatch()
+        reply_cache = self.reply_cache
+        for observation in observations:
+            if reply_cache is not None:
+                state, cached = reply_cache.begin(observation.event_id)
+                if state == DONE:
+                    response.actions.add().CopyFrom(cached)
+                    continue
+                if state != NEW:
+                    response.actions.add(observation_event_id=observation.event_id, success=False,
+                                         message="Duplicate of an observation still being processed; retry later")
+                    continue
+            try:
+                action = response.actions.add(**self._action_fields(observation))
+            except BaseException:
+                if reply_cache is not None:
+                    reply_cache.abandon(observation.event_id)
+                raise
+            if reply_cache is not None:
+                reply_cache.complete(observation.event_id, action)
+        return response
+
+# The actor implementation. Ray is only imported when the actor class is first requested
+# (see __getattr__ below), so importing this module for the servicer alone stays cheap.
+class _AiActionStreamer:
+    # Make the __init__ method asynchronous
+    async def __init__(self, host="[::]", port=50051, metrics_port=None, ray_metrics_interval_s=10.0,
+                       uds_path=None, shm_path=None, session_snapshot_path=None, checkpoint_dir=None,
+                       checkpoint_interval_s=5.0, compression=None, fast_path_rules=None, fast_path_window_s=60.0,
+                       reply_cache_size=100_000):
+        self.host = host
+        self.port = port
+        self.server = None
+        # Optional local listeners for a co-located observer: a Unix domain socket (port=None
+        # disables TCP) and shared-memory batches (see utilities/shm_transport.py).
+        self.uds_path = uds_path
+        self.shm_path = shm_path
+        self.shm_server = None
+        # Compression of batch replies ("gzip", "deflate") when the client did not name one; single
+        # Actions are sent uncompressed. Compressed requests are always accepted.
+        self.compression = compression_algorithm(compression)
+        self.policy_registry = PolicyRegistry(warmup_observations=default_warmup_observations())
+        # Restored from session_snapshot_path if it exists, and snapshotted there while serving.
+        self.session_store = SessionStore(snapshot_path=session_snapshot_path)
+        self.resource_recommender = ResourceRecommender()
+        self.failure_scorer = FailureScorer(self.resource_recommender)
+        self.scheduling_advisor = SchedulingAdvisor()
+        # Replies to the last reply_cache_size event_ids, so retries are not counted twice (0 disables).
+        self.reply_cache = ReplyCache(reply_cache_size) if reply_cache_size else None
+        # Sessions, policies, resource models, the advisor, the scorer and the reply cache are checkpointed to
+        # checkpoint_dir while serving, and restored from it here, so an actor restarted by Ray (max_restarts)
+        # resumes with its state warm.
+        self.checkpointer = None
+        if checkpoint_dir:
+            self.checkpointer = StateCheckpointer(checkpoint_dir, self.session_store, self.policy_registry,
+                                                  self.resource_recommender, self.scheduling_advisor,
+                                                  self.failure_scorer, self.reply_cache,
+                                                  interval_s=checkpoint_interval_s)
+            await self._restore_checkpoint()
+        self.metrics = ServerMetrics()
+        if self.reply_cache is not None:
+            self.metrics.track_reply_cache(self.reply_cache)
+        # Rules as in BIOFLOW_FAST_PATH_RULES (the default); always created so rules can be set while serving.
+        if fast_path_rules:
+            self.fast_path = FastPath.from_spec(fast_path_rules, window_s=fast_path_window_s)
+        else:
+            self.fast_path = FastPath.from_env() or FastPath(window_s=fast_path_window_s)
+        self.metrics.track_fast_path(self.fast_path)
+        self.metrics_port = metrics_port
+        self.ray_metrics_interval_s = ray_metrics_interval_s
+        # Spans are recorded for requests the client sampled; configured by the BIOFLOW_TRACE_* env vars.
+        self.tracer = tracing.Tracer.from_env("ai_action_streamer")
+        print(f"AiActionStreamer Actor initialized. Will listen on {self.host}:{self.port}")
+
+    async def _restore_checkpoint(self):
+        started = time.perf_counter()
+        try:
+            records = await self.checkpointer.restore()
+        except Exception as e:
+            # Serving cold beats failing every restart on a checkpoint that cannot be read.
+            print(f"AiActionStreamer: could not restore checkpoint from {self.checkpointer.directory}: {e}")
+            return
+        if records:
+            print(f"AiActionStreamer: restored {len(self.session_store)} pipelines and policy "
+                  f"{self.policy_registry.active.version} from {records} checkpoint records "
+                  f"in {time.perf_counter() - started:.2f}s")
+
+    async def start_server(self):
+        executor = futures.ThreadPoolExecutor(max_workers=10)
+        self.server = grpc.aio.server(executor, interceptors=[self.metrics.aio_interceptor()])
+        add_servicer_to_server = nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server
+        if self.tracer:
+            add_servicer_to_server = self.tracer.instrument(add_servicer_to_server)
+        servicer = AiActionServicer(self.policy_registry, self.session_store, self.resource_recommender,
+                                    self.failure_scorer, self.scheduling_advisor, self.fast_path, self.reply_cache,
+                                    self.compression, self.metrics)
+        self.session_store.start_snapshots()
+        if self.checkpointer:
+            self.checkpointer.start()
+        self.metrics.add_servicer_to_server(
+            servicer,
+            add_servicer_to_server,
+            self.server
+        )
+        if self.port is not None:
+            self.server.add_insecure_port(f"{self.host}:{self.port}")
+        if self.uds_path:
+            self.server.add_insecure_port(f"unix:{self.uds_path}")
+        await self.server.start()
+        print(f"AiActionStreamer gRPC server started on {self.host}:{self.port}" + (f" and {self.uds_path}" if self.uds_path else ""))
+        if self.shm_path and not SHM_SUPPORTED:
+            print(f"AiActionStreamer: shared memory is not supported on this CPU; clients of {self.shm_path} "
+                  f"should use gRPC (connect_batch_client falls back to it)")
+        elif self.shm_path:
+            handler = self.metrics.wrap_handler(*batch_method_handler(servicer))
+            self.shm_server = ShmBatchServer(handler, self.shm_path, loop=asyncio.get_running_loop())
+            self.shm_server.start()
+            print(f"AiActionStreamer serving batches over shared memory via {self.shm_path}")
+        if self.metrics_port is not None:
+            self.metrics_port = self.metrics.start_http_server(port=self.metrics_port)
+            print(f"AiActionStreamer metrics available on port {self.metrics_port} at /metrics")
+        if self.ray_metrics_interval_s:
+            self.metrics.start_ray_bridge(interval_s=self.ray_metrics_interval_s)
+        try:
+            await self.server.wait_for_termination()
+        except KeyboardInterrupt:
+            print("AiActionStreamer server shutting down due to KeyboardInterrupt...")
+        except Exception as e:
+            print(f"AiActionStreamer server error: {e}")
+        finally:
+            await self.stop_server()
+
+
+    async def stop_server(self):
+        if self.shm_server:
+            self.shm_server.stop()
+            self.shm_server = None
+        if self.server:
+            print("Stopping AiActionStreamer gRPC server...")
+            await self.server.stop(grace=1.0) 
+            self.server = None
+            self.session_store.stop()
+            if self.checkpointer:
+                self.checkpointer.stop()
+            self.metrics.stop()
+            if self.tracer:
+                self.tracer.close()
+            print("AiActionStreamer gRPC server stopped.")
+
+    def get_port(self): 
+        return self.port
+
+    async def load_policy(self, version, checkpoint_path):
+        """Loads, warms up and atomically activates a checkpoint without restarting the gRPC server."""
+        await self.policy_registry.load(version, checkpoint_path, activate=True)
+        print(f"AiActionStreamer: policy {version} is now active")
+        return version
+
+    async def load_shadow_policy(self, version, checkpoint_path, fraction=0.1):
+        """Loads a candidate policy and evaluates it on `fraction` of the traffic without serving it."""
+        await self.policy_registry.load(version, checkpoint_path, activate=False, shadow_fraction=fraction)
+        print(f"AiActionStreamer: shadow policy {version} evaluating on {fraction:.0%} of traffic")
+        return version
+
+    def promote_shadow_policy(self):
+        version = self.policy_registry.promote_shadow()
+        print(f"AiActionStreamer: shadow policy {version} promoted to active")
+        return version
+
+    def clear_shadow_policy(self):
+        self.policy_registry.clear_shadow()
+
+    def get_policy_status(self):
+        return self.policy_registry.status()
+
+    def get_session_stats(self):
+        return self.session_store.stats()
+
+    def get_resource_recommendations(self):
+        """The current recommendation of every process with enough history, as dictionaries."""
+        return {
+            name: {"memory_bytes": r.memory_bytes, "cpus": r.cpus, "time_ms": r.time_ms,
+                   "quantile": r.quantile, "sample_count": r.sample_count}
+            for name, r in self.resource_recommender.table.items()
+        }
+
+    def get_failure_scorer_stats(self):
+        return {"running_tasks": len(self.failure_scorer.tasks), **self.failure_scorer.stats}
+
+    def set_scheduling_capacity(self, pipeline_name, cpus=None, memory_bytes=None):
+        """Sets the CPUs and memory a pipeline's tasks can use at once, which scheduling advice has to fit."""
+        self.scheduling_advisor.set_capacity(pipeline_name, cpus=cpus, memory_bytes=memory_bytes)
+
+    def get_scheduling_stats(self):
+        return {
+            "pipelines": len(self.scheduling_advisor.pipelines),
+            "pending_tasks": sum(len(queue.heap) for queue in self.scheduling_advisor.pipelines.values()),
+            **self.scheduling_advisor.stats,
+        }
+
+    def set_fast_path_rules(self, spec):
+        """Replaces the fast path rules with those of a spec like BIOFLOW_FAST_PATH_RULES ("" removes them all)."""
+        self.fast_path.set_rules(FastPath.from_spec(spec).rules)
+        print(f"AiActionStreamer: fast path rules are now {self.fast_path.rules}")
+
+    def get_fast_path_stats(self):
+        return self.fast_path.stats()
+
+    def drain_fast_path_summaries(self, flush=True):
+        """Removes and returns the aggregated window summaries as dictionaries, closing the current window if `flush`."""
+        if flush:
+            self.fast_path.flush()
+        return [summary.to_dict() for summary in self.fast_path.drain_summaries()]
+
+    def get_checkpoint_stats(self):
+        return dict(self.checkpointer.stats) if self.checkpointer else None
+
+    def get_metrics(self):
+        """Returns the current metrics in the Prometheus text format."""
+        return self.metrics.registry.render_prometheus()
+
+_actor_class = None
+
+
+def get_actor_class():
+    """Returns the AiActionStreamer Ray actor class, importing ray on first use."""
+    global _actor_class
+    if _actor_class is None:
+        import ray
+        _actor_class = ray.remote(_AiActionStreamer)
+    return _actor_class
+
+
+def __getattr__(name):
+    # Keeps `from ai_action_streamer.ai_action_streamer_server import AiActionStreamer` working.
+    if name == "AiActionStreamer":
+        return get_actor_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def main_server_loop():
+    import ray
+
+    if not ray.is_initialized():
+        ray.init(ignore_reinit_error=True, log_to_driver=False)
+
+    broker_port = 50051 
+    # Ray restarts a crashed actor, resuming from its last checkpoint if BIOFLOW_STREAMER_CHECKPOINT_DIR
+    # is set; max_task_retries resubmits start_server() to the restarted actor.
+    checkpoint_dir = os.environ.get("BIOFLOW_STREAMER_CHECKPOINT_DIR")
+    ai_streamer_actor = get_actor_class().options(
+        name="AiActionStreamerService", get_if_exists=True, max_restarts=-1, max_task_retries=-1,
+    ).remote(port=broker_port, checkpoint_dir=checkpoint_dir)
+
+    print("Attempting to start AiActionStreamer server via Ray actor...")
+    server_task_future = ai_streamer_actor.start_server.remote()
+    # Ensure the actor has time to initialize before getting the port
+    # A small delay or a more robust check might be needed in some cases
+    await asyncio.sleep(0.1) 
+    print(f"AiActionStreamer server launch initiated. Expected to listen on port {await ai_streamer_actor.get_port.remote()}")
+
+    try:
+        while True:
+            await asyncio.sleep(3600) 
+    except KeyboardInterrupt:
+        print("Application shutting down by KeyboardInterrupt...")
+    except Exception as e:
+        print(f"Main loop encountered an error: {e}")
+    finally:
+        print("Ensuring AiActionStreamer server is stopped...")
+        await ai_streamer_actor.stop_server.remote()
+        if ray.is_initialized():
+            ray.shutdown()
+        print("Ray shut down. Exiting.")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main_server_loop())
+    except KeyboardInterrupt:
+        print("Exiting main application script...")
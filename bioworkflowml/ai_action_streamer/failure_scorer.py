@@ -0,0 +1,227 @@
+"""
+Early warning for running tasks that are about to hit their memory or walltime limit.
+
+Nextflow sends a "task_progress" observation per running task every few seconds (current
+rss_bytes, realtime_ms so far, and the limits the task was submitted with). FailureScorer
+keeps a few numbers per running task, so scoring a progress event is a dict lookup and a
+few multiplications:
+
+    memory    The RSS growth rate is smoothed (EWMA over successive readings) and projected
+              forward: a task whose RSS would reach memory_limit_bytes within `horizon_ms`
+              is flagged, with more confidence the sooner that would happen.
+    walltime  Given the walltimes of the process's completed tasks (the ResourceRecommender's
+              sketch), the probability that a task already running for realtime_ms also
+              runs past time_limit_ms is S(limit) / S(elapsed), from a cumulative table
+              rebuilt when the process's history changes (two bisects per check). Only
+              checked once a task has used `walltime_check_fraction` of its limit.
+
+A flagged task gets an EarlyTermination in the Action replying to its progress event, once,
+with the resources to resubmit it with: its limit grown by `growth`, or the process's
+recommendation if that is larger.
+
+    scorer = FailureScorer(resource_recommender)
+    termination = scorer.observe(observation)   # None, or an EarlyTermination to attach
+"""
+import collections
+import math
+import threading
+import time
+
+# Import the generated classes
+from bioworkflowml.proto import nf_ai_comms_pb2
+
+from bioworkflowml.ai_action_streamer.resource_recommender import MIB
+
+PROGRESS_EVENT_TYPE = "task_progress"
+FINISHED_EVENT_TYPES = frozenset(["task_complete"])
+
+
+class RunningTask:
+    """What the scorer remembers of one running task between its progress events."""
+    __slots__ = ("rss_bytes", "realtime_ms", "rss_rate", "readings", "flagged", "last_seen")
+
+    def __init__(self):
+        self.rss_bytes = 0
+        self.realtime_ms = 0
+        self.rss_rate = 0.0  # Smoothed RSS growth in bytes per ms
+        self.readings = 0
+        self.flagged = False
+        self.last_seen = 0.0
+
+
+class FailureScorer:
+    """
+    Scores task_progress observations for imminent memory or walltime failure.
+
+    Args:
+        resource_recommender (ResourceRecommender): Optional. Supplies walltime history for the
+                                                    walltime check and the resources to resubmit with.
+        horizon_ms (int): How far ahead a memory breach is predicted.
+        threshold (float): Confidence from which a task is flagged.
+        min_readings (int): Progress events of a task needed before its memory trend is trusted.
+        smoothing (float): EWMA weight of the latest RSS growth reading.
+        walltime_check_fraction (float): Share of its time limit a task must have used before the
+                                         walltime check runs.
+        growth (float): Factor applied to the limit that would be exceeded, for the resubmission.
+        stale_after_s (float): Tasks without a progress event for this long are forgotten.
+    """
+    def __init__(self, resource_recommender=None, horizon_ms=120_000, threshold=0.5, min_readings=3,
+                 smoothing=0.3, walltime_check_fraction=0.25, growth=1.5, stale_after_s=600.0):
+        self.resource_recommender = resource_recommender
+        self.horizon_ms = horizon_ms
+        self.threshold = threshold
+        self.min_readings = min_readings
+        self.smoothing = smoothing
+        self.walltime_check_fraction = walltime_check_fraction
+        self.growth = growth
+        self.stale_after_s = stale_after_s
+        self.tasks = collections.OrderedDict()  # (pipeline_name, task key) -> RunningTask, least recently seen first
+        self.stats = collections.Counter()
+        self._survivals = {}  # process_name -> (sample count, Survival of its walltimes)
+        # Tasks are scored on the serving thread and read by state() on the checkpointer's.
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(observation):
+        return observation.pipeline_name, observation.task_id_num or observation.task_hash
+
+    def observe(self, observation):
+        """Returns an EarlyTermination for a task_progress observation predicting failure, else None."""
+        event_type = observation.event_type
+        if event_type == PROGRESS_EVENT_TYPE:
+            return self.score(observation)
+        if event_type in FINISHED_EVENT_TYPES:
+            with self._lock:
+                self.tasks.pop(self._key(observation), None)
+        return None
+
+    def score(self, observation):
+        with self._lock:
+            return self._score(observation)
+
+    def _score(self, observation):
+        now = time.monotonic()
+        key = self._key(observation)
+        task = self.tasks.get(key)
+        if task is None:
+            self._evict_stale(now)
+            task = self.tasks[key] = RunningTask()
+        else:
+            self.tasks.move_to_end(key)
+        task.last_seen = now
+        self.stats["scored"] += 1
+
+        rss = observation.rss_bytes
+        elapsed = observation.realtime_ms
+        if task.readings and elapsed > task.realtime_ms:
+            rate = (rss - task.rss_bytes) / (elapsed - task.realtime_ms)
+            task.rss_rate += self.smoothing * (rate - task.rss_rate)
+        task.rss_bytes = rss
+        task.realtime_ms = elapsed
+        task.readings += 1
+        if task.flagged:
+            return None
+
+        termination = self._check_memory(observation, task) or self._check_walltime(observation)
+        if termination is not None:
+            task.flagged = True
+            self.stats[f"flagged_{termination.reason}"] += 1
+        return termination
+
+    def _check_memory(self, observation, task):
+        limit = observation.memory_limit_bytes
+        if not limit or task.readings < self.min_readings:
+            return None
+        remaining = limit - task.rss_bytes
+        if remaining <= 0:
+            time_to_limit = 0.0
+        elif task.rss_rate > 0:
+            time_to_limit = remaining / task.rss_rate
+        else:
+            return None
+        if time_to_limit >= self.horizon_ms:
+            return None
+        confidence = 1.0 - time_to_limit / self.horizon_ms
+        if confidence < self.threshold:
+            return None
+        return self._termination(observation, "memory", confidence, time_to_limit)
+
+    def _check_walltime(self, observation):
+        limit = observation.time_limit_ms
+        elapsed = observation.realtime_ms
+        if not limit or elapsed < self.walltime_check_fraction * limit or self.resource_recommender is None:
+            return None
+        survival = self._walltime_survival(observation.process_name)
+        if survival is None:
+            return None
+        still_running = survival.fraction_above(elapsed)
+        if not still_running:
+            return None  # Longer than every task seen so far: history says nothing
+        confidence = min(1.0, survival.fraction_above(limit) / still_running)
+        if confidence < self.threshold:
+            return None
+        return self._termination(observation, "walltime", confidence, limit - elapsed)
+
+    def _walltime_survival(self, process_name):
+        model = self.resource_recommender.models.get(process_name)
+        if model is None or model.samples < self.resource_recommender.min_samples:
+            return None
+        cached = self._survivals.get(process_name)
+        if cached is None or cached[0] != model.samples:
+            # Rebuilt at most once per completed task of the process, not per progress event
+            cached = self._survivals[process_name] = (model.samples, model.time.survival())
+        return cached[1]
+
+    def _termination(self, observation, reason, confidence, time_to_limit_ms):
+        recommendation = (self.resource_recommender.recommend(observation.process_name)
+                          if self.resource_recommender is not None else None)
+        memory = observation.memory_limit_bytes
+        time_ms = observation.time_limit_ms
+        if reason == "memory":
+            memory = math.ceil(memory * self.growth / MIB) * MIB
+        else:
+            time_ms = math.ceil(time_ms * self.growth / 1000) * 1000
+        resubmit_with = nf_ai_comms_pb2.ResourceRecommendation(
+            process_name=observation.process_name, memory_bytes=memory, time_ms=time_ms)
+        if recommendation is not None:
+            resubmit_with.memory_bytes = max(memory, recommendation.memory_bytes)
+            resubmit_with.time_ms = max(time_ms, recommendation.time_ms)
+            resubmit_with.cpus = recommendation.cpus
+            resubmit_with.quantile = recommendation.quantile
+            resubmit_with.sample_count = recommendation.sample_count
+        return nf_ai_comms_pb2.EarlyTermination(
+            reason=reason, confidence=confidence, predicted_failure_in_ms=max(0, int(time_to_limit_ms)),
+            resubmit_with=resubmit_with,
+        )
+
+    def state(self):
+        """The running tasks as plain data, consistent even while another thread scores."""
+        now = time.monotonic()
+        with self._lock:
+            tasks = [[pipeline_name, task_key, task.rss_bytes, task.realtime_ms, task.rss_rate, task.readings,
+                      task.flagged, now - task.last_seen]
+                     for (pipeline_name, task_key), task in self.tasks.items()]
+        return {"tasks": tasks}
+
+    def load_state(self, state):
+        """Restores state() output. Tasks keep the time since their last progress event, not its clock reading."""
+        now = time.monotonic()
+        with self._lock:
+            self.tasks = collections.OrderedDict()
+            for pipeline_name, task_key, rss_bytes, realtime_ms, rss_rate, readings, flagged, idle_s in state["tasks"]:
+                task = self.tasks[pipeline_name, task_key] = RunningTask()
+                task.rss_bytes = rss_bytes
+                task.realtime_ms = realtime_ms
+                task.rss_rate = rss_rate
+                task.readings = readings
+                task.flagged = flagged
+                task.last_seen = now - idle_s
+
+    def _evict_stale(self, now):
+        # Tasks that finished without a task_complete reaching us (or were killed) stop sending progress.
+        while self.tasks:
+            key, task = next(iter(self.tasks.items()))
+            if now - task.last_seen < self.stale_after_s:
+                return
+            del self.tasks[key]
+            self.stats["evicted"] += 1
@@ -0,0 +1,237 @@
+import asyncio
+import inspect
+import pickle
+import random
+import threading
+import time
+
+
+class EchoPolicy:
+    """
+    The default policy: acknowledges every observation without deciding anything.
+
+    This is what AiActionServicer used to hardcode, kept as the version the
+    registry starts with so the server is usable before any checkpoint is loaded.
+    """
+    def compute_action(self, observation):
+        return "echo_received_and_processed"
+
+
+def pickle_checkpoint_loader(checkpoint_path):
+    """
+    Default checkpoint loader: the checkpoint is a pickled policy object.
+
+    Any object with a `compute_action(observation) -> str` method is a valid policy. A policy
+    whose compute_action() also accepts a `task` keyword is given the observation's
+    utilities.session_store.TaskRecord (None if the server keeps no session state).
+    """
+    with open(checkpoint_path, "rb") as f:
+        return pickle.load(f)
+
+
+def _accepts_task(compute_action):
+    try:
+        parameters = inspect.signature(compute_action).parameters
+    except (TypeError, ValueError):
+        return False
+    return "task" in parameters or any(p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters.values())
+
+
+class PolicyEntry:
+    """An immutable (version, policy) pair. Swapping the active entry is a single reference assignment."""
+    __slots__ = ("version", "policy", "checkpoint_path", "loaded_at", "accepts_task")
+
+    def __init__(self, version, policy, checkpoint_path=None):
+        self.version = version
+        self.policy = policy
+        self.checkpoint_path = checkpoint_path  # None for a policy that was not loaded from a checkpoint
+        self.loaded_at = time.time()
+        # Decided once here rather than inspecting the signature on every call.
+        self.accepts_task = _accepts_task(policy.compute_action)
+
+    def compute_action(self, observation, task=None):
+        if self.accepts_task:
+            return self.policy.compute_action(observation, task=task)
+        return self.policy.compute_action(observation)
+
+
+class PolicyRegistry:
+    """
+    Holds the active policy served by AiActionServicer and an optional shadow candidate.
+
+    Checkpoints are loaded and warmed up off the event loop (in the default executor),
+    then swapped in with a single attribute assignment. Requests already in flight keep
+    the entry they started with, so a reload never drops or mixes observations.
+
+    A candidate can be evaluated in shadow mode on a sampled fraction of traffic: its
+    decision is computed (also off the event loop) and compared against the active
+    policy's, but never returned to the caller.
+
+    The active policy, by contrast, runs synchronously in decide(), which the actor calls on
+    its event loop: every other RPC waits while compute_action() runs. That keeps the
+    TaskRecord it is given consistent (the session store updates it on the same loop) and
+    saves an executor hop per observation, but compute_action() must not block. Keep it to
+    in-memory work well under a millisecond; anything slower (I/O, remote inference) belongs
+    in a background refresh of state the policy reads, or in the loader and warm-up.
+    """
+    def __init__(self, loader=pickle_checkpoint_loader, warmup_observations=None,
+                 initial_policy=None, initial_version="echo-0"):
+        self.loader = loader
+        self.warmup_observations = list(warmup_observations or [])
+        self._active = PolicyEntry(initial_version, initial_policy or EchoPolicy())
+        self._shadow = None
+        self._shadow_fraction = 0.0
+        self._load_lock = asyncio.Lock()
+        self._stats_lock = threading.Lock()
+        self._shadow_stats = self._empty_shadow_stats()
+
+    @staticmethod
+    def _empty_shadow_stats():
+        return {"evaluated": 0, "agreed": 0, "errors": 0}
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def shadow(self):
+        return self._shadow
+
+    def _load_and_warm(self, version, checkpoint_path):
+        # Runs in a worker thread: nothing here may touch registry state.
+        policy = self.loader(checkpoint_path)
+        if not callable(getattr(policy, "compute_action", None)):
+            raise TypeError(f"Checkpoint {checkpoint_path} for version {version} has no compute_action() method")
+        entry = PolicyEntry(version, policy, checkpoint_path)
+        for observation in self.warmup_observations:
+            entry.compute_action(observation)
+        return entry
+
+    async def load(self, version, checkpoint_path, activate=True, shadow_fraction=None):
+        """
+        Loads and warms up a checkpoint in the background, then installs it.
+
+        Args:
+            version (str): Version tag attached to every Action the policy produces.
+            checkpoint_path (str): Path handed to the registry's loader.
+            activate (bool): If True, the new policy becomes active. If False, it becomes
+                             the shadow candidate.
+            shadow_fraction (float): Fraction of traffic the shadow candidate is evaluated on.
+                                     Only used when activate is False.
+
+        Returns:
+            str: The version that was installed.
+
+        Raises:
+            Whatever the loader or a warm-up call raises. The previously installed policy
+            is left untouched in that case.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._load_lock:
+            entry = await loop.run_in_executor(None, self._load_and_warm, version, checkpoint_path)
+            if activate:
+                self._active = entry
+            else:
+                self._set_shadow(entry, shadow_fraction)
+        return version
+
+    def _set_shadow(self, entry, fraction):
+        if fraction is not None and not 0.0 <= fraction <= 1.0:
+            raise ValueError(f"shadow_fraction must be within [0, 1], got {fraction}")
+        with self._stats_lock:
+            self._shadow = entry
+            self._shadow_fraction = 0.0 if entry is None else (fraction if fraction is not None else self._shadow_fraction)
+            self._shadow_stats = self._empty_shadow_stats()
+
+    def clear_shadow(self):
+        self._set_shadow(None, None)
+
+    def promote_shadow(self):
+        """Makes the shadow candidate the active policy. Returns the promoted version."""
+        entry = self._shadow
+        if entry is None:
+            raise RuntimeError("No shadow policy to promote")
+        self._active = entry
+        self.clear_shadow()
+        return entry.version
+
+    def decide(self, observation, task=None):
+        """
+        Runs the active policy on an observation, synchronously on the calling thread (in the
+        actor, its event loop: see the class docstring).
+
+        Args:
+            observation: The TaskObservation.
+            task: The observation's session TaskRecord, passed on to policies that accept it.
+
+        Returns:
+            tuple: (action_details, policy_version). The version is the one of the entry
+                   actually used, even if a swap happens while the policy is running.
+        """
+        entry = self._active
+        return entry.compute_action(observation, task), entry.version
+
+    def maybe_shadow(self, observation, active_details, task=None):
+        """
+        Schedules shadow evaluation of the candidate for a sampled fraction of calls.
+
+        Must be called from the event loop. The evaluation itself runs in the default
+        executor so it never adds latency to the request being served.
+        """
+        entry = self._shadow
+        if entry is None or random.random() >= self._shadow_fraction:
+            return None
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(None, self._evaluate_shadow, entry, observation, active_details, task)
+
+    def _evaluate_shadow(self, entry, observation, active_details, task):
+        try:
+            details = entry.compute_action(observation, task)
+        except Exception:
+            with self._stats_lock:
+                if self._shadow is entry:
+                    self._shadow_stats["errors"] += 1
+            return
+        with self._stats_lock:
+            # Ignore late results for a candidate that has since been replaced.
+            if self._shadow is entry:
+                self._shadow_stats["evaluated"] += 1
+                if details == active_details:
+                    self._shadow_stats["agreed"] += 1
+
+    def state(self):
+        """What restore_state() needs to rebuild the registry: versions, checkpoint paths and shadow stats."""
+        with self._stats_lock:
+            shadow = self._shadow
+            return {
+                "active": {"version": self._active.version, "checkpoint_path": self._active.checkpoint_path},
+                "shadow": {"version": shadow.version, "checkpoint_path": shadow.checkpoint_path} if shadow else None,
+                "shadow_fraction": self._shadow_fraction,
+                "shadow_stats": dict(self._shadow_stats),
+            }
+
+    async def restore_state(self, state):
+        """
+        Reloads (and warms up) the policies recorded by state(). Policies that were not loaded
+        from a checkpoint are left as they are.
+        """
+        active = state["active"]
+        if active["checkpoint_path"] is not None:
+            await self.load(active["version"], active["checkpoint_path"])
+        shadow = state["shadow"]
+        if shadow is not None and shadow["checkpoint_path"] is not None:
+            await self.load(shadow["version"], shadow["checkpoint_path"], activate=False,
+                            shadow_fraction=state["shadow_fraction"])
+            with self._stats_lock:
+                self._shadow_stats.update(state["shadow_stats"])
+
+    def status(self):
+        with self._stats_lock:
+            shadow = self._shadow
+            return {
+                "active_version": self._active.version,
+                "active_loaded_at": self._active.loaded_at,
+                "shadow_version": shadow.version if shadow else None,
+                "shadow_fraction": self._shadow_fraction,
+                "shadow_stats": dict(self._shadow_stats),
+            }
@@ -0,0 +1,228 @@
+"""
+Per-process resource recommendations from the resources completed tasks actually used.
+
+For every process_name, ResourceRecommender keeps one quantile sketch each of peak memory
+(peak_rss_bytes), CPUs (cpu_percent / 100) and walltime (realtime_ms), fed by task_complete
+observations. The recommendation is the `quantile` of each sketch plus `headroom`, so that
+`quantile` of the process's tasks would have fit while the rest of the cluster is not held
+by over-provisioned requests.
+
+The sketches are log-bucketed histograms: adding a sample is a dict increment, and any
+quantile is exact to within `precision` (relative). Recommendations are recomputed into a
+table of ready ResourceRecommendation messages each time a process's sample count doubles,
+then every `refresh_every` samples, so answering one is a dict lookup. Older samples are
+down-weighted by halving a sketch every `half_life` samples, which lets recommendations
+follow a pipeline whose inputs change.
+
+    recommender = ResourceRecommender(quantile=0.95, headroom=0.1)
+    recommendation = recommender.observe(observation)   # None until min_samples tasks completed
+"""
+import bisect
+import itertools
+import math
+import threading
+
+# Import the generated classes
+from bioworkflowml.proto import nf_ai_comms_pb2
+
+MIB = 1024 * 1024
+# Exit code of a task killed with SIGKILL, which is how executors enforce memory limits.
+OOM_EXIT_CODE = 137
+
+
+def parse_cpu_percent(cpu_percent):
+    """Maps Nextflow's "%cpu" ("163.5%") onto cores (1.635). Returns None if it is empty or malformed."""
+    try:
+        return float(cpu_percent.rstrip("%")) / 100.0
+    except ValueError:
+        return None
+
+
+class Survival:
+    """Frozen cumulative view of a QuantileSketch, answering fraction_above() with a bisect."""
+    __slots__ = ("log_gamma", "buckets", "cumulative")
+
+    def __init__(self, log_gamma, buckets, cumulative):
+        self.log_gamma = log_gamma
+        self.buckets = buckets
+        self.cumulative = cumulative
+
+    def fraction_above(self, value):
+        """Share of the weight in buckets above the one `value` falls in."""
+        index = bisect.bisect_right(self.buckets, math.ceil(math.log(value) / self.log_gamma)) if value > 0 else 0
+        total = self.cumulative[-1]
+        return (total - self.cumulative[index - 1]) / total if index else 1.0
+
+
+class QuantileSketch:
+    """Weighted histogram of positive values in buckets growing by a factor (1 + precision)."""
+    __slots__ = ("log_gamma", "counts", "total")
+
+    def __init__(self, precision=0.01):
+        self.log_gamma = math.log1p(precision)
+        self.counts = {}
+        self.total = 0.0
+
+    def add(self, value, weight=1.0):
+        if value <= 0:
+            return
+        bucket = math.ceil(math.log(value) / self.log_gamma)
+        self.counts[bucket] = self.counts.get(bucket, 0.0) + weight
+        self.total += weight
+
+    def quantile(self, q):
+        """The upper bound of the bucket holding the q-quantile, or None if the sketch is empty."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0.0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return math.exp(bucket * self.log_gamma)
+        return math.exp(max(self.counts) * self.log_gamma)
+
+    def survival(self):
+        """A Survival snapshot of the sketch as it is now (None if the sketch is empty)."""
+        if not self.total:
+            return None
+        buckets = sorted(self.counts)
+        return Survival(self.log_gamma, buckets, list(itertools.accumulate(self.counts[b] for b in buckets)))
+
+    def decay(self, factor):
+        """Multiplies every weight by `factor`, dropping buckets that fall below a hundredth of a sample."""
+        self.counts = {bucket: count * factor for bucket, count in self.counts.items() if count * factor >= 0.01}
+        self.total = sum(self.counts.values())
+
+    def to_dict(self):
+        return {"counts": dict(self.counts), "total": self.total}
+
+    def load_dict(self, data):
+        self.counts = {int(bucket): count for bucket, count in data["counts"].items()}
+        self.total = data["total"]
+
+
+class ProcessModel:
+    """The sketches of one process_name."""
+    __slots__ = ("memory", "cpus", "time", "samples", "since_refresh")
+
+    def __init__(self, precision):
+        self.memory = QuantileSketch(precision)
+        self.cpus = QuantileSketch(precision)
+        self.time = QuantileSketch(precision)
+        self.samples = 0
+        self.since_refresh = 0
+
+    def to_dict(self):
+        return {"memory": self.memory.to_dict(), "cpus": self.cpus.to_dict(), "time": self.time.to_dict(),
+                "samples": self.samples}
+
+
+class ResourceRecommender:
+    """
+    Learns per-process resource quantiles from task_complete observations and serves
+    ResourceRecommendations from a precomputed table.
+
+    Args:
+        quantile (float): Fraction of tasks a recommendation should cover.
+        headroom (float): Relative margin added on top of the quantile (0.1 = 10%).
+        min_samples (int): Completed tasks of a process needed before it gets recommendations.
+        refresh_every (int): Most samples of a process between recomputations of its recommendation.
+        half_life (int): Samples of a process after which older samples count half.
+        precision (float): Relative bucket width of the sketches.
+        oom_growth (float): An OOM-killed task (exit code 137) needed more memory than it had;
+                            its peak RSS is recorded multiplied by this.
+    """
+    def __init__(self, quantile=0.95, headroom=0.1, min_samples=5, refresh_every=100, half_life=1000,
+                 precision=0.01, oom_growth=1.5):
+        self.quantile = quantile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.refresh_every = refresh_every
+        self.half_life = half_life
+        self.precision = precision
+        self.oom_growth = oom_growth
+        self.models = {}
+        self.table = {}  # process_name -> ResourceRecommendation
+        self.version = 0  # Bumped on every change, so checkpoints can skip an unchanged model
+        # Models are learned on the serving thread and read by state() on the checkpointer's.
+        self._lock = threading.Lock()
+
+    def observe(self, observation):
+        """
+        Learns from `observation` if it is a task_complete, then returns the current
+        recommendation for its process (None if there is none yet).
+        """
+        if observation.event_type == "task_complete":
+            self.learn(observation)
+        return self.table.get(observation.process_name)
+
+    def recommend(self, process_name):
+        return self.table.get(process_name)
+
+    def learn(self, observation):
+        if observation.status == "COMPLETED":
+            memory = observation.peak_rss_bytes
+        elif observation.exit_code == OOM_EXIT_CODE:
+            memory = observation.peak_rss_bytes * self.oom_growth
+        else:
+            return  # Other failures say nothing about what the task needs
+
+        with self._lock:
+            self._learn(observation, memory)
+
+    def _learn(self, observation, memory):
+        model = self.models.get(observation.process_name)
+        if model is None:
+            model = self.models[observation.process_name] = ProcessModel(self.precision)
+        model.memory.add(memory)
+        if observation.status == "COMPLETED":
+            cpus = parse_cpu_percent(observation.cpu_percent)
+            if cpus is not None:
+                model.cpus.add(cpus)
+            model.time.add(observation.realtime_ms)
+        model.samples += 1
+        model.since_refresh += 1
+        self.version += 1
+
+        if self.half_life and model.samples % self.half_life == 0:
+            for sketch in (model.memory, model.cpus, model.time):
+                sketch.decay(0.5)
+        if model.samples >= self.min_samples and (observation.process_name not in self.table
+                                                  or model.since_refresh >= min(self.refresh_every, model.samples // 2)):
+            self._refresh(observation.process_name, model)
+
+    def _refresh(self, process_name, model):
+        margin = 1.0 + self.headroom
+        memory = model.memory.quantile(self.quantile)
+        cpus = model.cpus.quantile(self.quantile)
+        time_ms = model.time.quantile(self.quantile)
+        self.table[process_name] = nf_ai_comms_pb2.ResourceRecommendation(
+            process_name=process_name,
+            memory_bytes=math.ceil(memory * margin / MIB) * MIB if memory else 0,
+            cpus=max(1, math.ceil(cpus * margin)) if cpus else 0,
+            time_ms=math.ceil(time_ms * margin / 1000) * 1000 if time_ms else 0,
+            quantile=self.quantile,
+            sample_count=model.samples,
+        )
+        model.since_refresh = 0
+
+    def state(self):
+        """A copy of the models as plain data, consistent even while another thread learns."""
+        with self._lock:
+            return {"version": self.version, "models": {name: model.to_dict() for name, model in self.models.items()}}
+
+    def load_state(self, state):
+        """Restores state() output and rebuilds the recommendation table."""
+        with self._lock:
+            self.models = {}
+            self.table = {}
+            for name, data in state["models"].items():
+                model = self.models[name] = ProcessModel(self.precision)
+                model.memory.load_dict(data["memory"])
+                model.cpus.load_dict(data["cpus"])
+                model.time.load_dict(data["time"])
+                model.samples = data["samples"]
+                if model.samples >= self.min_samples:
+                    self._refresh(name, model)
+            self.version = state["version"]
@@ -0,0 +1,436 @@
+"""
+Advice on which of a pipeline's pending tasks to start first.
+
+Nextflow starts pending tasks in submission order, skipping those that do not fit. When
+resources are short, that can leave the long chain of tasks that bounds the pipeline's
+makespan waiting behind short tasks nothing depends on. SchedulingAdvisor keeps every
+pipeline's pending tasks (task_submit seen, task_start not yet) in a priority queue and
+ranks them by critical path: the expected time from the start of a task's process to the
+end of the pipeline,
+
+    critical_path(process) = duration(process) + max(critical_path(downstream process))
+
+Durations are learned per process_name from task_complete realtime_ms (an EWMA across
+pipelines). The process graph is learned from `upstream_processes` on task_submit, which
+comes too late in a pipeline's first run to rank the tasks feeding a process. So a first
+run is advised in submission order, and ranking starts with the second run, once the
+graph and critical paths carry over (`min_runs`).
+
+Resource fit: tasks are taken best first, but one that does not fit the pipeline's free
+capacity (cpus and memory_limit_bytes against set_capacity(), minus the tasks running) is
+skipped, so a smaller task behind it can start rather than leave the capacity idle.
+
+The queue is an IndexedHeap, so a task leaves it in O(log n) when it starts. When a
+process's critical path changes (its duration estimate moved by more than
+`rekey_tolerance`, or an edge was learned), only the pending tasks of that process are
+re-keyed. Each takes an O(log n) decrease-key or increase-key, and nothing is rebuilt.
+
+    advisor = SchedulingAdvisor()
+    advisor.set_capacity("nf-core/rnaseq", cpus=64, memory_bytes=256 * 1024**3)
+    advice = advisor.observe(observation)   # None, or a SchedulingAdvice to attach
+"""
+import collections
+import heapq
+import math
+import threading
+
+# Import the generated classes
+from bioworkflowml.proto import nf_ai_comms_pb2
+
+from bioworkflowml.utilities.session_store import PIPELINE_FINISHED_EVENT_TYPES
+
+SCHEDULING_EVENT_TYPES = frozenset(["task_submit", "task_start", "task_complete"])
+
+
+class IndexedHeap:
+    """
+    Binary min-heap of keys by sort key, with a position index so any key can be re-keyed
+    (decrease-key or increase-key) or removed in O(log n).
+    """
+    __slots__ = ("_entries", "_positions")
+
+    def __init__(self):
+        self._entries = []  # [sort key, key], in heap order
+        self._positions = {}  # key -> index in _entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def push(self, key, sort_key):
+        if key in self._positions:
+            self.update(key, sort_key)
+            return
+        self._entries.append([sort_key, key])
+        self._positions[key] = len(self._entries) - 1
+        self._sift_up(len(self._entries) - 1)
+
+    def update(self, key, sort_key):
+        index = self._positions[key]
+        entry = self._entries[index]
+        previous, entry[0] = entry[0], sort_key
+        if sort_key < previous:
+            self._sift_up(index)
+        else:
+            self._sift_down(index)
+
+    def remove(self, key):
+        index = self._positions.pop(key, None)
+        if index is None:
+            return False
+        last = self._entries.pop()
+        if index < len(self._entries):
+            self._entries[index] = last
+            self._positions[last[1]] = index
+            self._sift_up(index)
+            self._sift_down(self._positions[last[1]])
+        return True
+
+    def ordered(self):
+        """Yields keys smallest sort key first without modifying the heap, in O(log k) per key taken."""
+        entries = self._entries
+        size = len(entries)
+        if not size:
+            return
+        frontier = [(entries[0][0], 0)]
+        while frontier:
+            _, index = heapq.heappop(frontier)
+            yield entries[index][1]
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < size:
+                    heapq.heappush(frontier, (entries[child][0], child))
+
+    def _sift_up(self, index):
+        entries, positions = self._entries, self._positions
+        entry = entries[index]
+        while index:
+            parent = (index - 1) >> 1
+            if entry[0] >= entries[parent][0]:
+                break
+            entries[index] = entries[parent]
+            positions[entries[index][1]] = index
+            index = parent
+        entries[index] = entry
+        positions[entry[1]] = index
+
+    def _sift_down(self, index):
+        entries, positions = self._entries, self._positions
+        size = len(entries)
+        entry = entries[index]
+        while True:
+            child = 2 * index + 1
+            if child >= size:
+                break
+            if child + 1 < size and entries[child + 1][0] < entries[child][0]:
+                child += 1
+            if entries[child][0] >= entry[0]:
+                break
+            entries[index] = entries[child]
+            positions[entries[index][1]] = index
+            index = child
+        entries[index] = entry
+        positions[entry[1]] = index
+
+
+class QueuedTask:
+    """A task the advisor tracks from task_submit until task_complete."""
+    __slots__ = ("process_name", "cpus", "memory_bytes", "seq", "running")
+
+    def __init__(self, process_name, cpus, memory_bytes, seq):
+        self.process_name = process_name
+        self.cpus = cpus
+        self.memory_bytes = memory_bytes
+        self.seq = seq  # Submission order, which breaks ties between equal critical paths
+        self.running = False
+
+
+class PipelineQueue:
+    """The pending tasks, running demand and process graph of one pipeline_name."""
+    __slots__ = ("heap", "tasks", "pending_by_process", "pending_demands", "downstream", "critical_path",
+                 "capacity_cpus", "capacity_memory_bytes", "running_cpus", "running_memory_bytes", "submitted",
+                 "paths_version", "runs")
+
+    def __init__(self, capacity_cpus, capacity_memory_bytes):
+        self.heap = IndexedHeap()  # task_id_num by (-critical path, seq)
+        self.tasks = {}  # task_id_num -> QueuedTask, pending or running
+        self.pending_by_process = collections.defaultdict(set)
+        self.downstream = collections.defaultdict(set)  # process_name -> processes consuming its outputs
+        self.critical_path = {}  # process_name -> critical path (ms) its pending tasks are keyed by
+        self.capacity_cpus = capacity_cpus
+        self.capacity_memory_bytes = capacity_memory_bytes
+        self.running_cpus = 0
+        self.running_memory_bytes = 0
+        self.pending_demands = collections.Counter()  # (cpus, memory_bytes) -> pending tasks asking for it
+        self.submitted = 0
+        self.paths_version = -1  # SchedulingAdvisor.durations_version the critical paths were computed at
+        self.runs = 0  # Runs of the pipeline seen to completion
+
+    def clear(self):
+        """Forgets the tasks of a finished run. The graph, critical paths and capacity carry over to the next."""
+        self.heap = IndexedHeap()
+        self.tasks = {}
+        self.pending_by_process.clear()
+        self.running_cpus = 0
+        self.running_memory_bytes = 0
+        self.pending_demands.clear()
+        self.submitted = 0
+        self.runs += 1
+
+    def submit(self, task_id, task, critical_path):
+        self.tasks[task_id] = task
+        self.pending_by_process[task.process_name].add(task_id)
+        self.pending_demands[task.cpus, task.memory_bytes] += 1
+        self.heap.push(task_id, (-critical_path, task.seq))
+
+    def start(self, task_id):
+        task = self.tasks.get(task_id)
+        if task is None or task.running:
+            return
+        self._unqueue(task_id, task)
+        task.running = True
+        self.running_cpus += task.cpus
+        self.running_memory_bytes += task.memory_bytes
+
+    def finish(self, task_id):
+        task = self.tasks.pop(task_id, None)
+        if task is None:
+            return
+        if task.running:
+            self.running_cpus -= task.cpus
+            self.running_memory_bytes -= task.memory_bytes
+        else:
+            self._unqueue(task_id, task)  # Cached, or failed before starting
+
+    def _unqueue(self, task_id, task):
+        self.heap.remove(task_id)
+        pending = self.pending_by_process[task.process_name]
+        pending.discard(task_id)
+        if not pending:
+            del self.pending_by_process[task.process_name]
+        demand = (task.cpus, task.memory_bytes)
+        self.pending_demands[demand] -= 1
+        if not self.pending_demands[demand]:
+            del self.pending_demands[demand]
+
+
+class SchedulingAdvisor:
+    """
+    Ranks each pipeline's pending tasks by critical path and advises which to start next.
+
+    Args:
+        capacity_cpus (int): Default CPUs a pipeline's tasks can use at once (None for unlimited).
+        capacity_memory_bytes (int): Default memory a pipeline's tasks can use at once (None for unlimited).
+        advice_size (int): Most task_id_nums in a SchedulingAdvice.
+        max_scan (int): Most pending tasks looked at to fill the advice.
+        min_runs (int): Runs of a pipeline to see through before its tasks are ranked. Until then its
+                        graph is only partly known, and tasks are advised in submission order.
+        smoothing (float): EWMA weight of the latest duration of a process.
+        default_duration_ms (int): Duration assumed for a process no task of which has completed yet.
+        rekey_tolerance (float): Relative change of a duration estimate or critical path below which
+                                 pending tasks keep their key.
+        max_pipelines (int): Pipelines tracked at once; the least recently observed is dropped first.
+                             A pipeline's graph, critical paths and capacity are kept across its runs.
+    """
+    def __init__(self, capacity_cpus=None, capacity_memory_bytes=None, advice_size=10, max_scan=500, min_runs=1,
+                 smoothing=0.2, default_duration_ms=60_000, rekey_tolerance=0.05, max_pipelines=1000):
+        self.capacity_cpus = capacity_cpus
+        self.capacity_memory_bytes = capacity_memory_bytes
+        self.advice_size = advice_size
+        self.max_scan = max_scan
+        self.min_runs = min_runs
+        self.smoothing = smoothing
+        self.default_duration_ms = default_duration_ms
+        self.rekey_tolerance = rekey_tolerance
+        self.max_pipelines = max_pipelines
+        self.pipelines = collections.OrderedDict()  # pipeline_name -> PipelineQueue, least recently observed first
+        self.durations = {}  # process_name -> duration estimate (ms) critical paths are computed from
+        self._duration_ewma = {}  # process_name -> EWMA of realtime_ms
+        self.durations_version = 0  # Bumped whenever `durations` changes
+        self.stats = collections.Counter()
+        # Tasks are tracked on the serving thread and the learned state read by state() on the checkpointer's.
+        self._lock = threading.Lock()
+
+    def set_capacity(self, pipeline_name, cpus=None, memory_bytes=None):
+        """Sets the resources a pipeline's tasks can use at once (e.g. its executor's cpus and memory)."""
+        with self._lock:
+            queue = self._queue(pipeline_name)
+            queue.capacity_cpus = cpus
+            queue.capacity_memory_bytes = memory_bytes
+
+    def observe(self, observation):
+        """Tracks a task event and returns the pipeline's SchedulingAdvice, or None if nothing is pending."""
+        queue = self.track(observation)
+        if queue is None or not queue.heap:
+            return None
+        self.stats["advised"] += 1
+        return nf_ai_comms_pb2.SchedulingAdvice(
+            dispatch_order=self.advise(observation.pipeline_name),
+            priority_ms=int(queue.critical_path.get(observation.process_name, 0)),
+            pending_tasks=len(queue.heap),
+        )
+
+    def track(self, observation):
+        """Tracks a task event without building advice. Returns the pipeline's queue, or None if it was not a task event."""
+        with self._lock:
+            return self._track(observation)
+
+    def _track(self, observation):
+        event_type = observation.event_type
+        if event_type in PIPELINE_FINISHED_EVENT_TYPES:
+            queue = self.pipelines.get(observation.pipeline_name)
+            if queue is not None:
+                queue.clear()
+            return None
+        task_id = observation.task_id_num
+        if event_type not in SCHEDULING_EVENT_TYPES or not task_id:
+            return None
+        queue = self._queue(observation.pipeline_name)
+
+        if event_type == "task_submit":
+            if task_id in queue.tasks:
+                return None
+            self._learn_edges(queue, observation)
+            self._refresh_paths(queue)
+            queue.submitted += 1
+            task = QueuedTask(observation.process_name, observation.cpus or 1, observation.memory_limit_bytes,
+                              queue.submitted)
+            ranked = queue.runs >= self.min_runs
+            queue.submit(task_id, task, self._critical_path(queue, observation.process_name) if ranked else 0)
+        elif event_type == "task_start":
+            queue.start(task_id)
+        else:
+            queue.finish(task_id)
+            if observation.realtime_ms > 0:
+                self._learn_duration(observation.process_name, observation.realtime_ms)
+            self._refresh_paths(queue)
+        return queue
+
+    def advise(self, pipeline_name, limit=None):
+        """The task_id_nums of the pipeline's pending tasks to start next, best first, that fit its free capacity."""
+        queue = self.pipelines.get(pipeline_name)
+        if queue is None:
+            return []
+        limit = limit or self.advice_size
+        free_cpus = math.inf if queue.capacity_cpus is None else queue.capacity_cpus - queue.running_cpus
+        free_memory = (math.inf if queue.capacity_memory_bytes is None
+                       else queue.capacity_memory_bytes - queue.running_memory_bytes)
+        # Pending tasks ask for a handful of distinct (cpus, memory) pairs: stop looking once none could fit
+        min_cpus = min((cpus for cpus, _ in queue.pending_demands), default=0)
+        min_memory = min((memory for _, memory in queue.pending_demands), default=0)
+        advice = []
+        for scanned, task_id in enumerate(queue.heap.ordered()):
+            if len(advice) >= limit or scanned >= self.max_scan or free_cpus < min_cpus or free_memory < min_memory:
+                break
+            task = queue.tasks[task_id]
+            if task.cpus <= free_cpus and task.memory_bytes <= free_memory:
+                free_cpus -= task.cpus
+                free_memory -= task.memory_bytes
+                advice.append(task_id)
+        return advice
+
+    def state(self):
+        """
+        What the advisor learned, as plain data: the duration estimates, and each pipeline's process
+        graph, capacity and completed runs. The tasks of runs in progress are left out.
+        """
+        with self._lock:
+            return {
+                "durations": dict(self.durations),
+                "duration_ewma": dict(self._duration_ewma),
+                "durations_version": self.durations_version,
+                "pipelines": [
+                    [name, {process: sorted(consumers) for process, consumers in queue.downstream.items()},
+                     queue.capacity_cpus, queue.capacity_memory_bytes, queue.runs]
+                    for name, queue in self.pipelines.items()
+                ],
+            }
+
+    def load_state(self, state):
+        """Restores state() output. Critical paths are recomputed when the pipelines' next tasks are submitted."""
+        with self._lock:
+            self.durations = dict(state["durations"])
+            self._duration_ewma = dict(state["duration_ewma"])
+            self.durations_version = state["durations_version"]
+            self.pipelines = collections.OrderedDict()
+            for name, downstream, capacity_cpus, capacity_memory_bytes, runs in state["pipelines"]:
+                queue = self.pipelines[name] = PipelineQueue(capacity_cpus, capacity_memory_bytes)
+                for process, consumers in downstream.items():
+                    queue.downstream[process] = set(consumers)
+                queue.runs = runs
+
+    def _queue(self, pipeline_name):
+        queue = self.pipelines.get(pipeline_name)
+        if queue is None:
+            queue = self.pipelines[pipeline_name] = PipelineQueue(self.capacity_cpus, self.capacity_memory_bytes)
+            if len(self.pipelines) > self.max_pipelines:
+                self.pipelines.popitem(last=False)
+        else:
+            self.pipelines.move_to_end(pipeline_name)
+        return queue
+
+    def _learn_duration(self, process_name, realtime_ms):
+        ewma = self._duration_ewma.get(process_name)
+        ewma = realtime_ms if ewma is None else ewma + self.smoothing * (realtime_ms - ewma)
+        self._duration_ewma[process_name] = ewma
+        published = self.durations.get(process_name)
+        if published is None or abs(ewma - published) > self.rekey_tolerance * published:
+            self.durations[process_name] = ewma
+            self.durations_version += 1
+
+    def _learn_edges(self, queue, observation):
+        for upstream in observation.upstream_processes:
+            consumers = queue.downstream[upstream]
+            if observation.process_name not in consumers:
+                consumers.add(observation.process_name)
+                queue.paths_version = -1  # The graph changed: recompute on the next refresh
+
+    def _duration(self, process_name):
+        duration = self.durations.get(process_name)
+        if duration is None:
+            return self.default_duration_ms
+        return duration
+
+    def _critical_path(self, queue, process_name):
+        path = queue.critical_path.get(process_name)
+        if path is None:
+            path = queue.critical_path[process_name] = self._compute_paths(queue, [process_name])[process_name]
+        return path
+
+    def _compute_paths(self, queue, process_names=()):
+        """Critical path of every process of the pipeline's graph, by memoised depth-first search."""
+        paths = {}
+        in_progress = set()
+
+        def visit(process_name):
+            path = paths.get(process_name)
+            if path is not None:
+                return path
+            if process_name in in_progress:
+                return 0  # A cycle in a misreported graph: ignore the back edge
+            in_progress.add(process_name)
+            longest = max((visit(d) for d in queue.downstream.get(process_name, ())), default=0)
+            in_progress.discard(process_name)
+            path = paths[process_name] = self._duration(process_name) + longest
+            return path
+
+        for process_name in (*queue.downstream, *queue.critical_path, *process_names):
+            visit(process_name)
+        return paths
+
+    def _refresh_paths(self, queue):
+        """Recomputes the pipeline's critical paths if durations or its graph changed, re-keying what moved."""
+        if queue.paths_version == self.durations_version or queue.runs < self.min_runs:
+            return
+        queue.paths_version = self.durations_version
+        paths = self._compute_paths(queue)
+        tolerance = self.rekey_tolerance
+        for process_name, path in paths.items():
+            keyed = queue.critical_path.get(process_name)
+            if keyed is not None and abs(path - keyed) <= tolerance * keyed:
+                continue
+            queue.critical_path[process_name] = path
+            for task_id in queue.pending_by_process.get(process_name, ()):
+                queue.heap.update(task_id, (-path, queue.tasks[task_id].seq))
+                self.stats["rekeyed"] += 1
@@ -0,0 +1,269 @@
+"""
+Checkpoints of the AiActionStreamer actor's state, so a restarted actor resumes warm.
+
+The state is the session store (every pipeline's tasks and per-process counters), the
+policy registry (active and shadow versions with their checkpoint paths, shadow statistics),
+the resource recommender's per-process models, the scheduling advisor's durations and
+process graphs, the failure scorer's running tasks and the reply cache's replies.
+A checkpoint directory holds one full checkpoint and a journal of incremental ones taken
+after it:
+
+    state-000000000007.base      full state when checkpoint 7 was taken
+    state-000000000007.journal   one record per later checkpoint: the pipelines and tasks
+                                 changed since the previous one, the pipelines dropped,
+                                 and the replies cached since the previous one
+
+Records are framed like the observation spool (length and CRC32, see utilities/spool.py)
+around zlib-compressed pickles of plain data. Loading refuses anything but builtins, so a
+checkpoint can never instantiate classes. A new full checkpoint replaces the previous base
+and journal once the journal holds `full_every` records or outgrows the base.
+
+Checkpoints go to local disk rather than the Ray object store: objects put by an actor are
+owned by it and go away with it, which is exactly when they would be needed.
+
+    checkpointer = StateCheckpointer("/var/lib/bioflow/streamer", session_store, policy_registry)
+    await checkpointer.restore()      # On actor start; a no-op without a checkpoint
+    checkpointer.start()              # Incremental checkpoint every interval_s
+    ...
+    checkpointer.stop()               # Final full checkpoint
+"""
+import asyncio
+import contextlib
+import gc
+import io
+import logging
+import os
+import pickle
+import re
+import threading
+import time
+import zlib
+
+from bioworkflowml.utilities.spool import RECORD_HEADER, read_records
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+CHECKPOINT_PATTERN = re.compile(r"^state-(\d{12})\.(base|journal|base\.tmp)$")
+
+
+class _PlainDataUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"Checkpoint refers to {module}.{name}; only plain data is allowed")
+
+
+def encode_record(data):
+    payload = zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), 1)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def decode_payload(payload):
+    return _PlainDataUnpickler(io.BytesIO(zlib.decompress(payload))).load()
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    # A restore allocates millions of objects, all of them kept; letting the cyclic collector
+    # run while they are being created makes it several times slower.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class StateCheckpointer:
+    """
+    Writes full and incremental checkpoints of a SessionStore, a PolicyRegistry, a
+    ResourceRecommender, a SchedulingAdvisor, a FailureScorer and a ReplyCache to `directory`.
+    All but the SessionStore are optional.
+
+    checkpoint() is safe to call from any thread; start() calls it every `interval_s` from a
+    background thread, which logs failed checkpoints and keeps going. Journal records are
+    fsynced before checkpoint() returns, so a crash loses at most the observations of one
+    interval. The checkpoint after a failed one is always full.
+    """
+    def __init__(self, directory, session_store, policy_registry=None, resource_recommender=None,
+                 scheduling_advisor=None, failure_scorer=None, reply_cache=None, interval_s=5.0, full_every=100):
+        self.directory = directory
+        self.session_store = session_store
+        self.policy_registry = policy_registry
+        self.resource_recommender = resource_recommender
+        self.scheduling_advisor = scheduling_advisor
+        self.failure_scorer = failure_scorer
+        self.reply_cache = reply_cache
+        self._recommender_version = None  # Version in the last checkpoint; unchanged models are not rewritten
+        self.interval_s = interval_s
+        self.full_every = full_every
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()  # One checkpoint at a time
+        self._stop = threading.Event()
+        self._thread = None
+        self._seq = self._latest_seq() or 0
+        self._journal = None
+        self._journal_records = 0
+        self._journal_bytes = 0
+        self._base_bytes = 0
+        # Set when a checkpoint failed: its changes were already taken from the session store, so only
+        # a full checkpoint can cover them.
+        self._needs_full = False
+        self.stats = {"full": 0, "incremental": 0, "failed": 0, "bytes_written": 0, "last_duration_s": 0.0,
+                      "restored_records": 0}
+
+    def _path(self, seq, suffix):
+        return os.path.join(self.directory, f"state-{seq:012d}.{suffix}")
+
+    def _latest_seq(self):
+        seqs = [int(m.group(1)) for m in map(CHECKPOINT_PATTERN.match, os.listdir(self.directory))
+                if m and m.group(2) == "base"]
+        return max(seqs) if seqs else None
+
+    def _capture(self, kind, full):
+        sessions, removed = self.session_store.take_changes(full=full)
+        recommender = None
+        if self.resource_recommender is not None and (full or self.resource_recommender.version != self._recommender_version):
+            recommender = self.resource_recommender.state()
+            self._recommender_version = recommender["version"]
+        return {
+            "version": FORMAT_VERSION,
+            "kind": kind,
+            "taken_at": time.time(),
+            "sessions": sessions,
+            "removed": removed,
+            "evicted": self.session_store.evicted,
+            "policy": self.policy_registry.state() if self.policy_registry is not None else None,
+            "recommender": recommender,
+            "advisor": self.scheduling_advisor.state() if self.scheduling_advisor is not None else None,
+            "scorer": self.failure_scorer.state() if self.failure_scorer is not None else None,
+            # Like the sessions, only the replies cached since the previous checkpoint, unless full.
+            "replies": self.reply_cache.state(changed_only=not full) if self.reply_cache is not None else None,
+        }
+
+    def checkpoint(self, full=False):
+        """Writes a checkpoint (incremental unless `full` or due for compaction). Returns its size in bytes."""
+        with self._lock:
+            started = time.perf_counter()
+            full = (full or self._needs_full or self._journal is None or self._journal_records >= self.full_every
+                    or self._journal_bytes > self._base_bytes)
+            try:
+                size = self._write_full() if full else self._append_incremental()
+            except BaseException:
+                self._needs_full = True
+                self._recommender_version = None
+                self.stats["failed"] += 1
+                raise
+            self._needs_full = False
+            self.stats["full" if full else "incremental"] += 1
+            self.stats["bytes_written"] += size
+            self.stats["last_duration_s"] = time.perf_counter() - started
+            return size
+
+    def _write_full(self):
+        record = encode_record(self._capture("full", full=True))
+        seq = self._seq + 1
+        tmp_path = self._path(seq, "base.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(seq, "base"))
+
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self._path(seq, "journal"), "ab")
+        self._journal_records = 0
+        self._journal_bytes = 0
+        self._base_bytes = len(record)
+        self._seq = seq
+        for name in os.listdir(self.directory):
+            match = CHECKPOINT_PATTERN.match(name)
+            if match and int(match.group(1)) < seq:  # Superseded by the new base
+                os.unlink(os.path.join(self.directory, name))
+        return len(record)
+
+    def _append_incremental(self):
+        record = encode_record(self._capture("incremental", full=False))
+        self._journal.write(record)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal_records += 1
+        self._journal_bytes += len(record)
+        return len(record)
+
+    def load(self):
+        """Returns the latest base record and its intact journal records, oldest first ([] without a checkpoint)."""
+        seq = self._latest_seq()
+        if seq is None:
+            return []
+        with open(self._path(seq, "base"), "rb") as f:
+            data = f.read()
+        # The base was fsynced before the rename that made it visible, so it is always whole.
+        records = [decode_payload(data[RECORD_HEADER.size:])]
+        journal_path = self._path(seq, "journal")
+        if os.path.exists(journal_path):
+            # A torn last record (crash mid-write) ends the replay; the next checkpoint is a full one.
+            records.extend(decode_payload(payload) for _, payload in read_records(journal_path))
+        return records
+
+    async def restore(self):
+        """
+        Rebuilds the session store, resource models, advisor, scorer and reply cache and reloads the
+        policies from the latest checkpoint. Returns the number of records replayed (0 if there was nothing to restore).
+        """
+        with _gc_paused():
+            records = await asyncio.get_running_loop().run_in_executor(None, self.load)
+            for record in records:
+                if record["version"] != FORMAT_VERSION:
+                    raise ValueError(f"Unsupported checkpoint format version {record['version']}")
+                if record["kind"] == "full":
+                    self.session_store.load_dict(record)
+                else:
+                    self.session_store.apply_changes(record["sessions"], record["removed"])
+                self.session_store.evicted = record["evicted"]
+            # Recommender models are only written when they changed: the latest one written is current.
+            recommender_states = [record["recommender"] for record in records if record.get("recommender")]
+            if self.resource_recommender is not None and recommender_states:
+                self.resource_recommender.load_state(recommender_states[-1])
+            if self.reply_cache is not None:
+                for record in records:
+                    if record.get("replies"):
+                        self.reply_cache.load_state(record["replies"])
+        if not records:
+            return 0
+        # Written whole by every checkpoint (absent from those taken by earlier versions).
+        if self.scheduling_advisor is not None and records[-1].get("advisor") is not None:
+            self.scheduling_advisor.load_state(records[-1]["advisor"])
+        if self.failure_scorer is not None and records[-1].get("scorer") is not None:
+            self.failure_scorer.load_state(records[-1]["scorer"])
+        policy_state = records[-1]["policy"]
+        if self.policy_registry is not None and policy_state is not None:
+            await self.policy_registry.restore_state(policy_state)
+        self.stats["restored_records"] = len(records)
+        return len(records)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="state-checkpointer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.checkpoint()
+            except Exception:
+                # A full disk or a racing mutation must not end checkpointing; the next one is full.
+                logger.exception("Checkpoint to %s failed", self.directory)
+
+    def stop(self):
+        """Stops the background thread and writes a final full checkpoint."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.checkpoint(full=True)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # NO CHECKED-IN PROTOBUF GENCODE
-# source: dummy.proto
+# source: bioworkflowml/proto/dummy.proto
 # Protobuf Python Version: 5.29.0
 """Generated protocol buffer code."""
 from google.protobuf import descriptor as _descriptor
@@ -15,7 +15,7 @@ _runtime_version.ValidateProtobufRuntimeVersion(
     29,
     0,
     '',
-    'dummy.proto'
+    'bioworkflowml/proto/dummy.proto'
 )
 # @@protoc_insertion_point(imports)
 
@@ -24,17 +24,17 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0b\x64ummy.proto\x12\x05\x64ummy\"\x1c\n\x0cHelloRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\"\x1d\n\nHelloReply\x12\x0f\n\x07message\x18\x01 \x01(\t2=\n\x07Greeter\x12\x32\n\x08SayHello\x12\x13.dummy.HelloRequest\x1a\x11.dummy.HelloReplyb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x1f\x62ioworkflowml/proto/dummy.proto\x12\x05\x64ummy\"\x1c\n\x0cHelloRequest\x12\x0c\n\x04name\x18\x01 \x01(\t\"\x1d\n\nHelloReply\x12\x0f\n\x07message\x18\x01 \x01(\t2=\n\x07Greeter\x12\x32\n\x08SayHello\x12\x13.dummy.HelloRequest\x1a\x11.dummy.HelloReplyb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
-_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'dummy_pb2', _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'bioworkflowml.proto.dummy_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_HELLOREQUEST']._serialized_start=22
-  _globals['_HELLOREQUEST']._serialized_end=50
-  _globals['_HELLOREPLY']._serialized_start=52
-  _globals['_HELLOREPLY']._serialized_end=81
-  _globals['_GREETER']._serialized_start=83
-  _globals['_GREETER']._serialized_end=144
+  _globals['_HELLOREQUEST']._serialized_start=42
+  _globals['_HELLOREQUEST']._serialized_end=70
+  _globals['_HELLOREPLY']._serialized_start=72
+  _globals['_HELLOREPLY']._serialized_end=101
+  _globals['_GREETER']._serialized_start=103
+  _globals['_GREETER']._serialized_end=164
 # @@protoc_insertion_point(module_scope)
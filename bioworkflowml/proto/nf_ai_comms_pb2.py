@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: bioworkflowml/proto/nf_ai_comms.proto
+# Protobuf Python Version: 5.29.0
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    5,
+    29,
+    0,
+    '',
+    'bioworkflowml/proto/nf_ai_comms.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n%bioworkflowml/proto/nf_ai_comms.proto\x12\x0bnf_ai_comms\"\xf5\x03\n\x0fTaskObservation\x12\x10\n\x08\x65vent_id\x18\x01 \x01(\t\x12\x12\n\nevent_type\x18\x02 \x01(\t\x12\x15\n\rtimestamp_iso\x18\x03 \x01(\t\x12\x15\n\rpipeline_name\x18\x04 \x01(\t\x12\x14\n\x0cprocess_name\x18\x05 \x01(\t\x12\x13\n\x0btask_id_num\x18\x06 \x01(\x03\x12\x11\n\ttask_hash\x18\x07 \x01(\t\x12\x11\n\ttask_name\x18\x08 \x01(\t\x12\x11\n\tnative_id\x18\t \x01(\t\x12\x0e\n\x06status\x18\n \x01(\t\x12\x11\n\texit_code\x18\x0b \x01(\x05\x12\x13\n\x0b\x64uration_ms\x18\x0c \x01(\x03\x12\x13\n\x0brealtime_ms\x18\r \x01(\x03\x12\x13\n\x0b\x63pu_percent\x18\x0e \x01(\t\x12\x16\n\x0epeak_rss_bytes\x18\x0f \x01(\x03\x12\x17\n\x0fpeak_vmem_bytes\x18\x10 \x01(\x03\x12\x12\n\nread_bytes\x18\x11 \x01(\x03\x12\x13\n\x0bwrite_bytes\x18\x12 \x01(\x03\x12\x11\n\trss_bytes\x18\x13 \x01(\x03\x12\x1a\n\x12memory_limit_bytes\x18\x14 \x01(\x03\x12\x15\n\rtime_limit_ms\x18\x15 \x01(\x03\x12\x0c\n\x04\x63pus\x18\x16 \x01(\x05\x12\x1a\n\x12upstream_processes\x18\x17 \x03(\t\"\xc5\x02\n\x06\x41\x63tion\x12\x1c\n\x14observation_event_id\x18\x01 \x01(\t\x12\x11\n\taction_id\x18\x02 \x01(\t\x12\x16\n\x0e\x61\x63tion_details\x18\x03 \x01(\t\x12\x0f\n\x07success\x18\x04 \x01(\x08\x12\x0f\n\x07message\x18\x05 \x01(\t\x12\x16\n\x0epolicy_version\x18\x06 \x01(\t\x12\x44\n\x17resource_recommendation\x18\x07 \x01(\x0b\x32#.nf_ai_comms.ResourceRecommendation\x12\x38\n\x11\x65\x61rly_termination\x18\x08 \x01(\x0b\x32\x1d.nf_ai_comms.EarlyTermination\x12\x38\n\x11scheduling_advice\x18\t \x01(\x0b\x32\x1d.nf_ai_comms.SchedulingAdvice\"V\n\x10SchedulingAdvice\x12\x16\n\x0e\x64ispatch_order\x18\x01 \x03(\x03\x12\x13\n\x0bpriority_ms\x18\x02 \x01(\x03\x12\x15\n\rpending_tasks\x18\x03 \x01(\x03\"\x93\x01\n\x10\x45\x61rlyTermination\x12\x0e\n\x06reason\x18\x01 \x01(\t\x12\x12\n\nconfidence\x18\x02 \x01(\x01\x12\x1f\n\x17predicted_failure_in_ms\x18\x03 \x01(\x03\x12:\n\rresubmit_with\x18\x04 \x01(\x0b\x32#.nf_ai_comms.ResourceRecommendation\"\x8b\x01\n\x16ResourceRecommendation\x12\x14\n\x0cprocess_name\x18\x01 \x01(\t\x12\x14\n\x0cmemory_bytes\x18\x02 \x01(\x03\x12\x0c\n\x04\x63pus\x18\x03 \x01(\x05\x12\x0f\n\x07time_ms\x18\x04 \x01(\x03\x12\x10\n\x08quantile\x18\x05 \x01(\x01\x12\x14\n\x0csample_count\x18\x06 \x01(\x03\"J\n\x14TaskObservationBatch\x12\x32\n\x0cobservations\x18\x01 \x03(\x0b\x32\x1c.nf_ai_comms.TaskObservation\"\x8a\x01\n\x17\x45ncodedObservationBatch\x12\x15\n\rstring_fields\x18\x01 \x03(\t\x12\x0f\n\x07strings\x18\x02 \x03(\t\x12\x13\n\x0bstring_refs\x18\x03 \x03(\r\x12\x32\n\x0cobservations\x18\x04 \x03(\x0b\x32\x1c.nf_ai_comms.TaskObservation\"3\n\x0b\x41\x63tionBatch\x12$\n\x07\x61\x63tions\x18\x01 \x03(\x0b\x32\x13.nf_ai_comms.Action2\x99\x02\n\x0f\x41iActionService\x12J\n\x13SendTaskObservation\x12\x1c.nf_ai_comms.TaskObservation\x1a\x13.nf_ai_comms.Action\"\x00\x12Y\n\x18SendTaskObservationBatch\x12!.nf_ai_comms.TaskObservationBatch\x1a\x18.nf_ai_comms.ActionBatch\"\x00\x12_\n\x1bSendEncodedObservationBatch\x12$.nf_ai_comms.EncodedObservationBatch\x1a\x18.nf_ai_comms.ActionBatch\"\x00\x42,\n\x1a\x63om.yourorg.bioflowml.grpcB\x0eNfAiCommsProtob\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'bioworkflowml.proto.nf_ai_comms_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  _globals['DESCRIPTOR']._loaded_options = None
+  _globals['DESCRIPTOR']._serialized_options = b'\n\032com.yourorg.bioflowml.grpcB\016NfAiCommsProto'
+  _globals['_TASKOBSERVATION']._serialized_start=55
+  _globals['_TASKOBSERVATION']._serialized_end=556
+  _globals['_ACTION']._serialized_start=559
+  _globals['_ACTION']._serialized_end=884
+  _globals['_SCHEDULINGADVICE']._serialized_start=886
+  _globals['_SCHEDULINGADVICE']._serialized_end=972
+  _globals['_EARLYTERMINATION']._serialized_start=975
+  _globals['_EARLYTERMINATION']._serialized_end=1122
+  _globals['_RESOURCERECOMMENDATION']._serialized_start=1125
+  _globals['_RESOURCERECOMMENDATION']._serialized_end=1264
+  _globals['_TASKOBSERVATIONBATCH']._serialized_start=1266
+  _globals['_TASKOBSERVATIONBATCH']._serialized_end=1340
+  _globals['_ENCODEDOBSERVATIONBATCH']._serialized_start=1343
+  _globals['_ENCODEDOBSERVATIONBATCH']._serialized_end=1481
+  _globals['_ACTIONBATCH']._serialized_start=1483
+  _globals['_ACTIONBATCH']._serialized_end=1534
+  _globals['_AIACTIONSERVICE']._serialized_start=1537
+  _globals['_AIACTIONSERVICE']._serialized_end=1818
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,220 @@
+import grpc
+from concurrent import futures
+import time
+import uuid
+import grpc
+from concurrent import futures
+
+# Import the generated classes
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+
+from bioworkflowml.utilities.fast_path import FastPath
+from bioworkflowml.utilities.metrics import ServerMetrics
+from bioworkflowml.utilities.reply_cache import DONE, NEW, ReplyCache
+from bioworkflowml.utilities.session_store import SessionStore
+from bioworkflowml.utilities.shm_transport import SHM_SUPPORTED, ShmBatchServer, batch_method_handler
+from bioworkflowml.utilities.tracing import Tracer
+from bioworkflowml.utilities.wire_format import compression_algorithm, decode_observations, set_response_compression
+
+# AiActionServiceServicer remains largely the same but uses a passed-in logger
+class AiActionServiceServicer(nf_ai_comms_pb2_grpc.AiActionServiceServicer):
+    def __init__(self, logger_callable, session_store=None, fast_path=None, reply_cache=None, compression=None,
+                 metrics=None):
+        self.logger = logger_callable
+        # Optional per-pipeline task state (see utilities/session_store.py).
+        self.session_store = session_store
+        # Optional: acknowledges low-value observations with a canned Action (see utilities/fast_path.py).
+        self.fast_path = fast_path
+        # Optional: answers a retried event_id with the first reply instead of deciding it again
+        # (see utilities/reply_cache.py).
+        self.reply_cache = reply_cache
+        # Compression of batch replies the client did not choose one for (see utilities/wire_format.py).
+        self.compression = compression
+        # Optional ServerMetrics: counts the observations of encoded batches once they are decoded.
+        self.metrics = metrics
+
+    def _build_action(self, request, response):
+        """Fills in the Action for an observation. Returns None for a duplicate still being decided."""
+        if self.reply_cache is None:
+            return self._decide_action(request, response)
+        state, cached = self.reply_cache.begin(request.event_id)
+        if state == DONE:
+            response.CopyFrom(cached)
+            return response
+        if state != NEW:
+            response.observation_event_id = request.event_id
+            response.success = False
+            response.message = "Duplicate of an observation still being processed; retry later"
+            return None
+        try:
+            self._decide_action(request, response)
+        except BaseException:
+            self.reply_cache.abandon(request.event_id)
+            raise
+        self.reply_cache.complete(request.event_id, response)
+        return response
+
+    def _decide_action(self, request, response):
+        canned = self.fast_path.route(request) if self.fast_path is not None else None
+        if self.session_store is not None:
+            self.session_store.observe(request)  # Fast-pathed too: the task state must stay right
+        if canned is not None:
+            response.observation_event_id = request.event_id
+            for field, value in canned.items():
+                setattr(response, field, value)
+            return response
+        response.observation_event_id = request.event_id
+        response.action_id = str(uuid.uuid4())
+        response.action_details = f"Action for event {request.event_id}: Processed event type '{request.event_type}'"
+        response.success = True
+        response.message = "Successfully processed TaskObservation"
+        return response
+
+    def SendTaskObservation(self, request, context):
+        self.logger(f"Received TaskObservation: event_id={request.event_id}, event_type={request.event_type}")
+        response = self._build_action(request, nf_ai_comms_pb2.Action())
+        if response is None:
+            context.abort(grpc.StatusCode.ABORTED, f"Observation {request.event_id} is still being processed")
+        self.logger(f"Sending Action: action_id={response.action_id}")
+        return response
+
+    def _process_batch(self, observations):
+        response = nf_ai_comms_pb2.ActionBatch()
+        for observation in observations:
+            self._build_action(observation, response.actions.add())
+        self.logger(f"Sending ActionBatch: {len(response.actions)} actions")
+        return response
+
+    def SendTaskObservationBatch(self, request, context):
+        # One log line per batch: the per-observation log write would dominate batch cost.
+        self.logger(f"Received TaskObservationBatch: {len(request.observations)} observations")
+        set_response_compression(context, len(request.observations), self.compression)
+        return self._process_batch(request.observations)
+
+    def SendEncodedObservationBatch(self, request, context):
+        self.logger(f"Received EncodedObservationBatch: {len(request.observations)} observations, "
+                    f"{len(request.strings)} distinct strings")
+        try:
+            observations = decode_observations(request)
+        except ValueError as e:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Malformed EncodedObservationBatch: {e}")
+        if self.metrics is not None:
+            for observation in observations:
+                self.metrics.record_observation(observation)
+        set_response_compression(context, len(observations), self.compression)
+        return self._process_batch(observations)
+
+class AiServer:
+    def __init__(self, port=50052, log_file="/tmp/ai_server.log", metrics_port=None, tracer=None,
+                 uds_path=None, shm_path=None, session_snapshot_path=None, compression=None, fast_path=None,
+                 reply_cache_size=100_000):
+        self.port = port
+        self.log_file = log_file
+        self.server = None
+        # Co-located clients can skip TCP: uds_path adds a Unix domain socket listener (port=None
+        # disables TCP entirely), shm_path serves batches over shared memory (utilities/shm_transport.py).
+        self.uds_path = uds_path
+        self.shm_path = shm_path
+        self.shm_server = None
+        # Restored from session_snapshot_path if it exists, and snapshotted there while serving.
+        self.session_store = SessionStore(snapshot_path=session_snapshot_path)
+        # Replies to the last reply_cache_size event_ids, so retries are not counted twice (0 disables).
+        self.reply_cache = ReplyCache(reply_cache_size) if reply_cache_size else None
+        # Compression of batch replies ("gzip", "deflate") when the client did not name one; single
+        # Actions are sent uncompressed. Compressed requests are always accepted.
+        self.compression = compression_algorithm(compression)
+        # Prometheus endpoint is only served when metrics_port is set (0 picks a free port).
+        self.metrics_port = metrics_port
+        self.metrics = ServerMetrics()
+        if self.reply_cache is not None:
+            self.metrics.track_reply_cache(self.reply_cache)
+        # Spans are recorded for requests the client sampled; defaults to the BIOFLOW_TRACE_* env vars.
+        self.tracer = tracer if tracer is not None else Tracer.from_env("ai_server")
+        # Observations routed past the decision (aggregated or sampled); defaults to BIOFLOW_FAST_PATH_RULES.
+        self.fast_path = fast_path if fast_path is not None else FastPath.from_env()
+        if self.fast_path is not None:
+            self.metrics.track_fast_path(self.fast_path)
+            if self.fast_path.sink is None:
+                self.fast_path.sink = self._log_fast_path_summaries
+
+    def app_log(self, message):
+        with open(self.log_file, "a") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {message}\n")
+
+    def _log_fast_path_summaries(self, summaries):
+        for s in summaries:
+            self.app_log(f"Fast path summary: {s.pipeline_name}/{s.process_name} {s.event_type} x{s.count} "
+                         f"({s.failed} failed, realtime_ms max {s.realtime_ms_max}, "
+                         f"peak_rss_bytes max {s.peak_rss_bytes_max}) in window starting {s.window_start:.0f}")
+
+    def start(self):
+        # Initialize logging (clear/create log file)
+        with open(self.log_file, "w") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Log initialized for AiServer.\n")
+
+        add_servicer_to_server = nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server
+        max_workers = 10
+        if self.tracer:
+            executor = self.tracer.thread_pool(max_workers=max_workers)
+            add_servicer_to_server = self.tracer.instrument(add_servicer_to_server)
+        else:
+            executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.server = grpc.server(executor)
+        self.metrics.set_handler_capacity(max_workers)
+        self.metrics.track_executor(executor)
+
+        # Instantiate servicer with the app_log method
+        servicer = AiActionServiceServicer(self.app_log, self.session_store, self.fast_path, self.reply_cache,
+                                           self.compression, self.metrics)
+        self.session_store.start_snapshots()
+        self.metrics.add_servicer_to_server(servicer, add_servicer_to_server, self.server)
+
+        if self.port is not None:
+            self.server.add_insecure_port(f'[::]:{self.port}')
+        if self.uds_path:
+            self.server.add_insecure_port(f'unix:{self.uds_path}')
+        self.server.start()
+        self.app_log(f"AiServer started. Listening on port {self.port}" + (f" and {self.uds_path}." if self.uds_path else "."))
+        if self.shm_path and not SHM_SUPPORTED:
+            self.app_log(f"AiServer: shared memory is not supported on this CPU; clients of {self.shm_path} "
+                         f"should use gRPC (connect_batch_client falls back to it).")
+        elif self.shm_path:
+            handler = self.metrics.wrap_handler(*batch_method_handler(servicer))
+            self.shm_server = ShmBatchServer(handler, self.shm_path)
+            self.shm_server.start()
+            self.app_log(f"AiServer serving batches over shared memory via {self.shm_path}.")
+        if self.metrics_port is not None:
+            self.metrics_port = self.metrics.start_http_server(port=self.metrics_port)
+            self.app_log(f"AiServer metrics available on port {self.metrics_port} at /metrics.")
+
+    def stop(self, grace=None):
+        self.app_log("AiServer stopping.")
+        if self.shm_server:
+            self.shm_server.stop()
+            self.shm_server = None
+        if self.server:
+            self.server.stop(grace)
+        self.session_store.stop()
+        if self.fast_path is not None:
+            self.fast_path.flush()
+        self.metrics.stop()
+        if self.tracer:
+            self.tracer.close()
+        self.app_log("AiServer stopped.")
+
+    def wait_for_termination(self):
+        if self.server:
+            self.server.wait_for_termination()
+
+# Updated main execution block
+if __name__ == '__main__':
+    ai_server = AiServer() # Uses default port and log file
+    ai_server.start()
+    print(f"AiServer running on port {ai_server.port}. Press Ctrl+C to stop.")
+    try:
+        ai_server.wait_for_termination()
+    except KeyboardInterrupt:
+        print("KeyboardInterrupt received. Stopping server...")
+        ai_server.stop(0) # Grace period 0 for immediate stop
+    print("Server shut down gracefully.")
@@ -0,0 +1,214 @@
+import asyncio
+import itertools
+
+import grpc
+
+# Import the generated classes
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+
+from bioworkflowml.utilities.nf_client import build_task_observation, channel_target
+from bioworkflowml.utilities.wire_format import compression_algorithm, compression_metadata, encode_batch
+
+# Each channel is one HTTP/2 connection, and servers cap concurrent streams per
+# connection (gRPC's default is 100), so high concurrency needs several channels.
+STREAMS_PER_CHANNEL = 100
+
+
+class AsyncAiClient:
+    """
+    A grpc.aio client for high-rate TaskObservation submission.
+
+    Channels are created once and shared by every call; the number of RPCs in flight is
+    bounded by a semaphore so that a burst of observations queues in the client instead
+    of overwhelming the server. The first send connects if connect() was not called.
+
+    Usage:
+        async with AsyncAiClient("localhost:50052", max_concurrency=512) as client:
+            action = await client.send({"event_type": "task_start", ...})
+            actions = await client.send_many(observations)
+            async for observation, result in client.stream(observations):
+                ...
+    """
+    def __init__(self, server_address='localhost:50052', max_concurrency=256, num_channels=None,
+                 timeout=None, channel_options=None, compression=None, dedup_strings=False):
+        """
+        Args:
+            server_address (str): The address (host:port or unix:/path) of the gRPC server.
+            max_concurrency (int): Maximum number of RPCs in flight at once.
+            num_channels (int): Number of channels (connections) to spread calls over.
+                                Defaults to enough channels for max_concurrency streams.
+            timeout (float): Optional per-call deadline in seconds.
+            channel_options (list): Extra grpc channel options.
+            compression: Default compression of every call: "gzip", "deflate" or a
+                         grpc.Compression. The send methods can override it per call.
+            dedup_strings (bool): If True, batches are sent as EncodedObservationBatch, with
+                                  repeated strings sent once (see utilities/wire_format.py).
+                                  Requires a server that implements SendEncodedObservationBatch.
+        """
+        self.server_address = server_address
+        self.max_concurrency = max_concurrency
+        self.num_channels = num_channels or max(1, -(-max_concurrency // STREAMS_PER_CHANNEL))
+        self.timeout = timeout
+        # A local subchannel pool stops channels to the same target from sharing one connection.
+        self.channel_options = list(channel_options or []) + [("grpc.use_local_subchannel_pool", 1)]
+        self.compression = compression_algorithm(compression)
+        self.dedup_strings = dedup_strings
+        self._channels = []
+        self._calls = []
+        self._next_calls = None
+        self._semaphore = None
+
+    async def connect(self):
+        """Creates the channels. Called implicitly by `async with`."""
+        if self._channels:
+            return self
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        for _ in range(self.num_channels):
+            channel = grpc.aio.insecure_channel(channel_target(self.server_address), options=self.channel_options,
+                                                compression=self.compression)
+            self._channels.append(channel)
+            stub = nf_ai_comms_pb2_grpc.AiActionServiceStub(channel)
+            self._calls.append((stub.SendTaskObservation, stub.SendTaskObservationBatch,
+                                stub.SendEncodedObservationBatch))
+        self._next_calls = itertools.cycle(self._calls).__next__
+        return self
+
+    async def wait_for_ready(self, timeout=None):
+        """Waits until every channel is connected. Raises asyncio.TimeoutError otherwise."""
+        await asyncio.wait_for(asyncio.gather(*(channel.channel_ready() for channel in self._channels)), timeout)
+
+    async def close(self, grace=None):
+        for channel in self._channels:
+            await channel.close(grace)
+        self._channels = []
+        self._calls = []
+        self._next_calls = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @staticmethod
+    def _as_observation(observation):
+        # Anything that isn't a dictionary is passed through as a TaskObservation.
+        if isinstance(observation, dict):
+            return build_task_observation(observation)
+        return observation
+
+    async def send(self, observation, compression=None):
+        """
+        Sends one observation and returns the Action.
+
+        Args:
+            observation: A TaskObservation or a dictionary accepted by build_task_observation().
+            compression: Overrides the client's compression for this call.
+
+        Raises:
+            grpc.aio.AioRpcError: If the call fails.
+        """
+        request = self._as_observation(observation)
+        if self._semaphore is None:
+            await self.connect()
+        async with self._semaphore:
+            return await self._next_calls()[0](request, timeout=self.timeout,
+                                               compression=compression_algorithm(compression))
+
+    async def send_batch(self, observations, compression=None):
+        """
+        Sends observations in a single SendTaskObservationBatch call (SendEncodedObservationBatch
+        with dedup_strings).
+
+        Returns:
+            list: The Actions, in the same order as the observations.
+        """
+        observations = [self._as_observation(o) for o in observations]
+        if self.dedup_strings:
+            request, method = encode_batch(observations), 2
+        else:
+            request, method = nf_ai_comms_pb2.TaskObservationBatch(observations=observations), 1
+        compression = self.compression if compression is None else compression_algorithm(compression)
+        if self._semaphore is None:
+            await self.connect()
+        async with self._semaphore:
+            # The server compresses a large reply like the batch, if it is told how the batch was sent.
+            response = await self._next_calls()[method](request, timeout=self.timeout, compression=compression,
+                                                        metadata=compression_metadata(compression))
+        return list(response.actions)
+
+    async def send_many(self, observations, batch_size=None, return_exceptions=False, compression=None):
+        """
+        Pipelines many observations and returns their Actions in input order.
+
+        At most max_concurrency calls are in flight; the rest wait on the semaphore.
+
+        Args:
+            observations: An iterable of TaskObservations or dictionaries.
+            batch_size (int): If set, observations are grouped into SendTaskObservationBatch
+                              calls of this size. Per-call overhead dominates small
+                              observations, so batching is what reaches tens of thousands
+                              of observations per second from one process.
+            return_exceptions (bool): If True, failed calls are returned as exceptions in
+                                      their slot(s) instead of raising the first one.
+            compression: Overrides the client's compression for these calls.
+        """
+        if not batch_size:
+            return await asyncio.gather(*(self.send(o, compression) for o in observations),
+                                        return_exceptions=return_exceptions)
+
+        observations = list(observations)
+        chunks = [observations[i:i + batch_size] for i in range(0, len(observations), batch_size)]
+        results = await asyncio.gather(*(self.send_batch(chunk, compression) for chunk in chunks),
+                                       return_exceptions=return_exceptions)
+        actions = []
+        for chunk, result in zip(chunks, results):
+            actions.extend([result] * len(chunk) if isinstance(result, BaseException) else result)
+        return actions
+
+    async def stream(self, observations):
+        """
+        Sends observations (a sync or async iterable) and yields (observation, result) as calls complete.
+
+        Unlike send_many(), the input is consumed lazily: only max_concurrency calls (and
+        therefore observations) are held at a time, so this suits unbounded sources.
+        `result` is the Action, or the exception if that call failed.
+        """
+        iterator = observations.__aiter__() if hasattr(observations, "__aiter__") else iter(observations)
+        # Completed calls are pushed here by done callbacks, so each completion costs O(1)
+        # instead of rescanning every pending task with asyncio.wait().
+        completed = asyncio.Queue()
+        pending = {}
+        exhausted = False
+
+        async def next_observation():
+            if hasattr(iterator, "__anext__"):
+                return await anext(iterator, None)
+            # StopIteration must not escape a coroutine, so exhaustion is signalled with None.
+            return next(iterator, None)
+
+        try:
+            while True:
+                while not exhausted and len(pending) < self.max_concurrency:
+                    observation = await next_observation()
+                    if observation is None:
+                        exhausted = True
+                        break
+                    request = self._as_observation(observation)
+                    task = asyncio.ensure_future(self.send(request))
+                    task.add_done_callback(completed.put_nowait)
+                    pending[task] = request
+                if not pending:
+                    return
+                task = await completed.get()
+                if task.cancelled():
+                    # Cancelled from outside (e.g. a shutdown cancelling every task): report it in place.
+                    yield pending.pop(task), asyncio.CancelledError()
+                else:
+                    yield pending.pop(task), task.exception() or task.result()
+        finally:
+            # The consumer stopped early: don't leave calls running in the background.
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,149 @@
+"""
+A long-lived client process that forwards observations from a Unix domain socket to the AI server.
+
+Starting Python and importing grpc and protobuf costs a short-lived client far more than the
+call itself. The daemon pays that once, keeps its channels to the AI server open, and
+short-lived callers only speak newline-delimited JSON over a local socket (see
+utilities.daemon_client, which needs nothing beyond the standard library).
+
+Protocol, one JSON object per line in each direction; replies come in request order:
+    -> {"observation": {...}, "wait": true}
+    <- {"action": {...}}                                  on success
+    <- {"error": {"code": "UNAVAILABLE", "details": "..."}} if the call failed
+    <- {"queued": true}                                   immediately, when "wait" is false
+
+Run from the project root:
+    python -m bioworkflowml.utilities.client_daemon --socket /tmp/bioflow-client.sock --server localhost:50052
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+
+import grpc
+from google.protobuf import json_format
+
+from bioworkflowml.utilities.aio_client import AsyncAiClient
+from bioworkflowml.utilities.daemon_client import DEFAULT_SOCKET_PATH
+
+
+def _error_reply(code, details):
+    return {"error": {"code": code, "details": details}}
+
+
+class ClientDaemon:
+    """Serves the socket protocol above, forwarding observations through one AsyncAiClient."""
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, server_address='localhost:50052',
+                 max_concurrency=256, timeout=None, compression=None):
+        self.socket_path = socket_path
+        self.client = AsyncAiClient(server_address, max_concurrency=max_concurrency, timeout=timeout,
+                                    compression=compression)
+        self.stats = {"received": 0, "delivered": 0, "failed": 0}
+        self._server = None
+        self._background = set()  # Fire-and-forget sends still in flight
+
+    async def start(self):
+        self._remove_stale_socket()
+        await self.client.connect()
+        self._server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        return self
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(self.socket_path)  # Left behind by a daemon that did not shut down cleanly
+        else:
+            raise RuntimeError(f"Another client daemon is already listening on {self.socket_path}")
+        finally:
+            probe.close()
+
+    async def close(self, grace=5.0):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._background:
+            await asyncio.wait(self._background, timeout=grace)
+        await self.client.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    async def _send(self, observation_data):
+        self.stats["received"] += 1
+        try:
+            action = await self.client.send(observation_data)
+        except (TypeError, ValueError) as e:
+            self.stats["failed"] += 1
+            return _error_reply("INVALID_ARGUMENT", f"Invalid observation: {e}")
+        except grpc.aio.AioRpcError as e:
+            self.stats["failed"] += 1
+            return _error_reply(e.code().name, e.details())
+        self.stats["delivered"] += 1
+        return {"action": json_format.MessageToDict(
+            action, preserving_proto_field_name=True, always_print_fields_with_no_presence=True)}
+
+    def _send_in_background(self, observation_data):
+        task = asyncio.ensure_future(self._send(observation_data))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    observation_data = message["observation"]
+                    if not isinstance(observation_data, dict):
+                        raise TypeError("observation must be a JSON object")
+                except (ValueError, KeyError, TypeError) as e:
+                    reply = _error_reply("INVALID_ARGUMENT", f"Malformed request: {e}")
+                else:
+                    if message.get("wait", True):
+                        reply = await self._send(observation_data)
+                    else:
+                        self._send_in_background(observation_data)
+                        reply = {"queued": True}
+                writer.write(json.dumps(reply, separators=(",", ":")).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass  # The caller went away; its in-flight observation (if any) was still sent
+        finally:
+            writer.close()
+
+
+async def run_daemon(socket_path, server_address, max_concurrency, timeout, compression=None):
+    daemon = await ClientDaemon(socket_path, server_address, max_concurrency, timeout, compression).start()
+    print(f"Client daemon forwarding {socket_path} to {server_address}")
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    await stopped.wait()
+    await daemon.close()
+    print(f"Client daemon stopped: {daemon.stats}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Forward observations from a Unix socket to the AI server.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    parser.add_argument("--server", default="localhost:50052")
+    parser.add_argument("--max-concurrency", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=None, help="Per-call deadline in seconds")
+    parser.add_argument("--compression", choices=["none", "gzip", "deflate"], default=None,
+                        help="Compress observations sent to the AI server")
+    args = parser.parse_args(argv)
+    asyncio.run(run_daemon(args.socket, args.server, args.max_concurrency, args.timeout, args.compression))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Talks to a running utilities.client_daemon over its Unix domain socket.
+
+Only the standard library is imported here: a short-lived process (e.g. a Nextflow hook)
+pays for the Python interpreter and a socket round trip, not for grpc and protobuf.
+
+    from bioworkflowml.utilities.daemon_client import send_observation
+    action = send_observation({"event_type": "task_complete", ...})
+
+    # From a shell, one JSON observation per line on stdin:
+    echo '{"event_type": "task_complete"}' | python -m bioworkflowml.utilities.daemon_client
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+
+DEFAULT_SOCKET_PATH = os.environ.get("BIOFLOW_CLIENT_SOCKET", "/tmp/bioflow-client.sock")
+
+
+class DaemonError(Exception):
+    """The daemon could not deliver an observation. `code` is the gRPC status code name."""
+    def __init__(self, code, details):
+        super().__init__(f"{code}: {details}")
+        self.code = code
+        self.details = details
+
+
+class DaemonConnection:
+    """
+    One connection to the daemon. Requests on a connection are answered in order, so a
+    process that sends many observations should reuse a connection rather than reconnect.
+    """
+    def __init__(self, socket_path=None, timeout=10.0):
+        self.socket_path = socket_path or DEFAULT_SOCKET_PATH
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(self.socket_path)
+        self._file = self._socket.makefile("rb")
+
+    def send(self, observation_data, wait=True):
+        """
+        Sends one observation dictionary.
+
+        Args:
+            observation_data (dict): Accepted by utilities.nf_client.build_task_observation().
+            wait (bool): If True, waits for the Action. If False, returns as soon as the daemon
+                         has queued the observation.
+
+        Returns:
+            dict: The Action's fields, or {"queued": True} if wait is False.
+
+        Raises:
+            DaemonError: If the daemon reports a failed call or a malformed request.
+        """
+        line = json.dumps({"observation": observation_data, "wait": wait}, separators=(",", ":"))
+        self._socket.sendall(line.encode() + b"\n")
+        reply = self._file.readline()
+        if not reply:
+            raise ConnectionError("Client daemon closed the connection")
+        reply = json.loads(reply)
+        if "error" in reply:
+            raise DaemonError(reply["error"]["code"], reply["error"]["details"])
+        return reply.get("action", reply)
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def send_observation(observation_data, socket_path=None, wait=True, timeout=10.0):
+    """Sends one observation over a new connection. See DaemonConnection.send()."""
+    with DaemonConnection(socket_path, timeout) as connection:
+        return connection.send(observation_data, wait=wait)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send JSON observations (one per line on stdin) to the client daemon.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    parser.add_argument("--no-wait", action="store_true", help="Return once queued instead of waiting for the Action")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    exit_code = 0
+    with DaemonConnection(args.socket, args.timeout) as connection:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            try:
+                print(json.dumps(connection.send(json.loads(line), wait=not args.no_wait)))
+            except DaemonError as e:
+                print(f"Observation not delivered: {e}", file=sys.stderr)
+                exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,8 @@
 import grpc
 
-# Import the generated classes
-import sys
-sys.path.append('../proto')  # Add proto folder to Python path
-import dummy_pb2
-import dummy_pb2_grpc
+# Import the generated classes (run from the project root: python -m bioworkflowml.utilities.dummy_client)
+from bioworkflowml.proto import dummy_pb2
+from bioworkflowml.proto import dummy_pb2_grpc
 
 def run():
     # Connect to the server
@@ -2,11 +2,9 @@ import grpc
 from concurrent import futures
 import time
 
-# Import the generated classes
-import sys
-sys.path.append('../proto')  # Add proto folder to Python path
-import dummy_pb2
-import dummy_pb2_grpc
+# Import the generated classes (run from the project root: python -m bioworkflowml.utilities.dummy_server)
+from bioworkflowml.proto import dummy_pb2
+from bioworkflowml.proto import dummy_pb2_grpc
 
 # Create a class to define the server functions, derived from
 # dummy_pb2_grpc.GreeterServicer
@@ -0,0 +1,290 @@
+"""
+Fast path for observations that do not need an individual decision.
+
+Most observations carry little information on their own: the task_start events of ten
+thousand identical scatter shards, say. A FastPath holds rules per event_type and
+process_name (glob patterns, first match wins) that route such observations past the
+decision pipeline:
+
+    aggregate   The observation is folded into a summary of its (pipeline, event type,
+                process) for the current window, and acknowledged with a canned Action.
+    sample      A `sample_rate` share of the observations goes on to the decision pipeline;
+                the rest are acknowledged with a canned Action.
+
+Observations matching no rule, and those sampled in, get the full pipeline. Fast-pathed
+observations skip the policy decision and the Action build, but the servicers still feed
+them into their cheap state updates (the session store, the scheduling advisor's pending
+tasks, the resource models), so routing task events does not corrupt that state. What
+they do lose is the advice attached to a decided Action, e.g. early termination on a
+sampled-out task_progress.
+
+Rules come from a spec, e.g. in BIOFLOW_FAST_PATH_RULES:
+
+    task_start=aggregate, task_submit/SCATTER_*=sample:0.05
+
+    fast_path = FastPath.from_spec("task_start=aggregate")
+    fields = fast_path.route(observation)  # None: decide as usual; else the canned Action's fields
+    fast_path.flush()
+    fast_path.drain_summaries()            # closed windows, as WindowSummary records
+
+The rule of an (event_type, process_name) pair is resolved once and cached, so routing is
+a dict lookup plus a few increments, made under one lock because servers route from
+several threads.
+"""
+import collections
+import fnmatch
+import itertools
+import os
+import random
+import threading
+import time
+import uuid
+
+AGGREGATE = "aggregate"
+SAMPLE = "sample"
+MODES = (AGGREGATE, SAMPLE)
+
+FAILED_STATUSES = frozenset(["FAILED", "ABORTED"])
+
+
+class FastPathRule:
+    """Routes observations whose event_type and process_name match the glob patterns."""
+    __slots__ = ("event_type", "process_name", "mode", "sample_rate")
+
+    def __init__(self, event_type, process_name="*", mode=AGGREGATE, sample_rate=0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown fast path mode {mode!r}, expected one of {', '.join(MODES)}")
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"sample_rate must be between 0 and 1, got {sample_rate}")
+        self.event_type = event_type
+        self.process_name = process_name
+        self.mode = mode
+        self.sample_rate = sample_rate
+
+    def matches(self, event_type, process_name):
+        return (fnmatch.fnmatchcase(event_type, self.event_type)
+                and fnmatch.fnmatchcase(process_name, self.process_name))
+
+    def __repr__(self):
+        mode = f"{SAMPLE}:{self.sample_rate:g}" if self.mode == SAMPLE else self.mode
+        return f"FastPathRule({self.event_type}/{self.process_name}={mode})"
+
+
+class WindowSummary:
+    """The observations of one (pipeline, event type, process) aggregated in one window."""
+    __slots__ = ("pipeline_name", "event_type", "process_name", "window_start", "window_end", "count", "failed",
+                 "realtime_ms_total", "realtime_ms_max", "peak_rss_bytes_max", "first_event_id", "last_event_id")
+
+    def __init__(self, pipeline_name, event_type, process_name, window_start, first_event_id):
+        self.pipeline_name = pipeline_name
+        self.event_type = event_type
+        self.process_name = process_name
+        self.window_start = window_start
+        self.window_end = None
+        self.count = 0
+        self.failed = 0
+        self.realtime_ms_total = 0
+        self.realtime_ms_max = 0
+        self.peak_rss_bytes_max = 0
+        self.first_event_id = first_event_id
+        self.last_event_id = first_event_id
+
+    def add(self, observation):
+        self.count += 1
+        if observation.status in FAILED_STATUSES:
+            self.failed += 1
+        realtime_ms = observation.realtime_ms
+        self.realtime_ms_total += realtime_ms
+        if realtime_ms > self.realtime_ms_max:
+            self.realtime_ms_max = realtime_ms
+        if observation.peak_rss_bytes > self.peak_rss_bytes_max:
+            self.peak_rss_bytes_max = observation.peak_rss_bytes
+        self.last_event_id = observation.event_id
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class _Route:
+    """The resolved rule of one (event_type, process_name) pair, with its counters."""
+    __slots__ = ("mode", "sample_rate", "fields", "counts", "children")
+
+    def __init__(self, rule, counts, children):
+        self.mode = rule.mode
+        self.sample_rate = rule.sample_rate
+        self.fields = {
+            "action_details": f"fast_path:{rule.mode}",
+            "success": True,
+            "message": f"Acknowledged by fast path rule {rule!r}",
+        }
+        self.counts = counts
+        self.children = children  # outcome -> metrics counter child, if metrics are tracked
+
+
+class FastPath:
+    """
+    Routes low-value observations past the decision pipeline.
+
+    Args:
+        rules (list): FastPathRules, checked in order.
+        window_s (float): Length of the aggregation windows.
+        max_summaries (int): Closed window summaries kept until drained; the oldest are dropped beyond it.
+        sink (callable): Optional. Called with the summaries of each closed window instead of keeping them.
+    """
+    def __init__(self, rules=(), window_s=60.0, max_summaries=10_000, sink=None):
+        self.rules = list(rules)
+        self.window_s = window_s
+        self.sink = sink
+        self.summaries = collections.deque(maxlen=max_summaries)
+        self.dropped_summaries = 0
+        self.metrics_counter = None
+        self._routes = {}  # (event_type, process_name) -> _Route, or None for the full pipeline
+        self._counts = {}  # (event_type, process_name) -> {outcome: count}, kept across rule changes
+        self._window = {}  # (pipeline_name, (event_type, process_name)) -> WindowSummary
+        self._window_end = time.time() + window_s
+        # Guards the counts, the open window and the closed summaries: a summary must not take an
+        # observation after its window closed, and a drain must not race the window that closes.
+        self._lock = threading.Lock()
+        # Canned action IDs only need to be unique, not random: a prefix per FastPath and a counter.
+        self._action_prefix = f"fp_{uuid.uuid4().hex[:12]}_"
+        self._action_numbers = itertools.count()
+
+    @classmethod
+    def from_spec(cls, spec, **kwargs):
+        """
+        Builds a FastPath from comma-separated `event_type[/process_name]=mode` rules, where mode
+        is `aggregate` or `sample:<rate>`.
+        """
+        rules = []
+        for entry in filter(None, (part.strip() for part in spec.split(","))):
+            pattern, separator, mode = entry.partition("=")
+            if not separator:
+                raise ValueError(f"Fast path rule {entry!r} has no '=mode'")
+            event_type, _, process_name = pattern.strip().partition("/")
+            mode, _, rate = mode.strip().partition(":")
+            if mode == SAMPLE and not rate:
+                raise ValueError(f"Fast path rule {entry!r} needs a rate, e.g. sample:0.05")
+            rules.append(FastPathRule(event_type, process_name or "*", mode, float(rate or 0.0)))
+        return cls(rules, **kwargs)
+
+    @classmethod
+    def from_env(cls):
+        """Builds a FastPath from BIOFLOW_FAST_PATH_RULES and BIOFLOW_FAST_PATH_WINDOW_S, or returns None."""
+        spec = os.environ.get("BIOFLOW_FAST_PATH_RULES")
+        if not spec:
+            return None
+        return cls.from_spec(spec, window_s=float(os.environ.get("BIOFLOW_FAST_PATH_WINDOW_S", "60")))
+
+    def set_rules(self, rules):
+        """Replaces the rules. Counts so far stay in stats(); open windows are kept."""
+        self.rules = list(rules)
+        self._routes = {}
+
+    def track_metrics(self, counter):
+        """Counts routed observations in a metrics Counter labelled (event_type, process_name, outcome)."""
+        self.metrics_counter = counter
+        self._routes = {}
+
+    def route(self, observation):
+        """Returns the fields of the canned Action for an observation taking the fast path, else None."""
+        key = (observation.event_type, observation.process_name)
+        try:
+            route = self._routes[key]
+        except KeyError:
+            route = self._resolve(key)
+        if route is None:
+            return None
+        closed = None
+        if route.mode == SAMPLE:
+            outcome = "sampled_in" if random.random() < route.sample_rate else "sampled_out"
+            with self._lock:
+                route.counts[outcome] += 1
+                if route.children is not None:
+                    route.children[outcome].value += 1
+            if outcome == "sampled_in":
+                return None
+        else:
+            # Inlined aggregation: this is the per-observation cost of the busiest routes.
+            now = time.time()
+            window_key = (observation.pipeline_name, key)
+            with self._lock:
+                if now >= self._window_end:
+                    closed = self._swap_window(now)
+                summary = self._window.get(window_key)
+                if summary is None:
+                    summary = self._window[window_key] = WindowSummary(
+                        observation.pipeline_name, *key, self._window_end - self.window_s, observation.event_id)
+                summary.add(observation)
+                route.counts["aggregated"] += 1
+                if route.children is not None:
+                    route.children["aggregated"].value += 1
+            if closed:
+                self._emit(closed, now)
+        fields = route.fields.copy()
+        fields["action_id"] = self._action_prefix + str(next(self._action_numbers))
+        return fields
+
+    def _resolve(self, key):
+        # Slow path: first observation of this pair since the rules (or metrics) changed.
+        rule = next((rule for rule in self.rules if rule.matches(*key)), None)
+        route = None
+        if rule is not None:
+            outcomes = ("aggregated",) if rule.mode == AGGREGATE else ("sampled_in", "sampled_out")
+            with self._lock:
+                counts = self._counts.setdefault(key, {})
+                for outcome in outcomes:
+                    counts.setdefault(outcome, 0)
+            children = None
+            if self.metrics_counter is not None:
+                children = {outcome: self.metrics_counter.labels(*key, outcome) for outcome in outcomes}
+            route = _Route(rule, counts, children)
+        self._routes[key] = route
+        return route
+
+    def _swap_window(self, now):
+        # Called with self._lock held. Returns the summaries of the window that closed.
+        closed, self._window = self._window, {}
+        self._window_end = now + self.window_s
+        return list(closed.values())
+
+    def _emit(self, closed, now):
+        for summary in closed:
+            summary.window_end = now
+        if self.sink is not None:
+            self.sink(closed)
+            return
+        with self._lock:
+            for summary in closed:
+                if len(self.summaries) == self.summaries.maxlen:
+                    self.dropped_summaries += 1
+                self.summaries.append(summary)
+
+    def flush(self):
+        """Closes the current window, so its summaries can be drained now."""
+        now = time.time()
+        with self._lock:
+            closed = self._swap_window(now)
+        if closed:
+            self._emit(closed, now)
+
+    def drain_summaries(self):
+        """Removes and returns the summaries of the closed windows, oldest first."""
+        with self._lock:
+            drained = list(self.summaries)
+            self.summaries.clear()
+        return drained
+
+    def stats(self):
+        """Observations routed so far, as {outcome: count} and per event type and process."""
+        totals = collections.Counter()
+        by_route = {}
+        with self._lock:
+            snapshot = [(key, dict(counts)) for key, counts in self._counts.items()]
+            sizes = {"open_summaries": len(self._window), "closed_summaries": len(self.summaries),
+                     "dropped_summaries": self.dropped_summaries}
+        for (event_type, process_name), counts in snapshot:
+            counts = {outcome: count for outcome, count in counts.items() if count}
+            if counts:
+                totals.update(counts)
+                by_route[f"{event_type}/{process_name}"] = counts
+        return {**totals, "by_route": by_route, **sizes}
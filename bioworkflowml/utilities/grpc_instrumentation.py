@@ -0,0 +1,60 @@
+"""
+Helpers for wrapping the method handlers that generated add_*Servicer_to_server functions register.
+
+Wrapping happens once at registration time, so instrumentation (metrics, tracing) needs
+no changes to the servicers and composes by stacking wrappers:
+
+    add = nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server
+    add = wrap_registration(add, tracer.wrap_handler)    # inner
+    add = wrap_registration(add, metrics.wrap_handler)   # outer
+    add(servicer, server)
+"""
+import grpc
+
+
+class _WrappedGenericHandler(grpc.GenericRpcHandler):
+    def __init__(self, inner, wrap_handler):
+        self._inner = inner
+        self._wrap_handler = wrap_handler
+
+    def service(self, handler_call_details):
+        handler = self._inner.service(handler_call_details)
+        if handler is None:
+            return None
+        return self._wrap_handler(handler_call_details.method, handler)
+
+
+class _WrappingServer:
+    """
+    Stands in for a grpc server while a generated add_*Servicer_to_server function runs,
+    so that every method handler it registers is passed through `wrap_handler`.
+    """
+    def __init__(self, server, wrap_handler):
+        self._server = server
+        self._wrap_handler = wrap_handler
+
+    def add_generic_rpc_handlers(self, generic_rpc_handlers):
+        self._server.add_generic_rpc_handlers(
+            tuple(_WrappedGenericHandler(h, self._wrap_handler) for h in generic_rpc_handlers)
+        )
+
+    def add_registered_method_handlers(self, service_name, method_handlers):
+        self._server.add_registered_method_handlers(service_name, {
+            name: self._wrap_handler(f"/{service_name}/{name}", handler)
+            for name, handler in method_handlers.items()
+        })
+
+
+def wrap_registration(add_servicer_function, wrap_handler):
+    """
+    Returns an add_*Servicer_to_server replacement that registers wrapped method handlers.
+
+    Args:
+        add_servicer_function: A generated registration function, or one returned by this function.
+        wrap_handler: Callable (full_method, grpc.RpcMethodHandler) -> grpc.RpcMethodHandler.
+                      It is called for both the generic and the registered handler of each
+                      method, so it should cache its result per full_method.
+    """
+    def add_servicer_to_server(servicer, server):
+        add_servicer_function(servicer, _WrappingServer(server, wrap_handler))
+    return add_servicer_to_server
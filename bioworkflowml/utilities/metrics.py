@@ -0,0 +1,727 @@
+"""
+In-process instrumentation for the AI servers.
+
+Everything expensive (label formatting, quantile estimation, text rendering) happens
+only when the metrics are scraped.
+
+The instrumented RPC handlers run on many threads in the sync AiServer, where a
+read-modify-write such as `child.value += 1` can lose updates, and a lock round trip per
+request would cost about as much as the rest of the recording. So each instrumented method
+has deques, whose append and popleft are thread-safe: handlers append their latency, the
+observation labels of their request, or a token on errors, and in-flight requests are a
+deque of tokens whose length is the gauge. The handler's codecs are not wrapped. Pending records are applied under a lock every
+FOLD_EVERY requests and before every scrape (registry collectors). Everything else a
+request is counted by is worked out then, off the handler: batch observations, and
+(de)serialization time, which is sampled by re-running the method's codecs on the first
+request handled after each fold. Metric children updated directly (e.g.
+counter.labels(...).inc()) must only be updated from one thread at a time.
+
+Usage:
+    metrics = ServerMetrics()
+    metrics.add_servicer_to_server(servicer, nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server, server)
+    metrics.start_http_server(port=9100)   # Prometheus text format on /metrics
+"""
+import asyncio
+import bisect
+import collections
+import inspect
+import operator
+import threading
+import time
+
+import grpc
+
+from bioworkflowml.utilities.grpc_instrumentation import wrap_registration
+
+# Seconds. Roughly x2.5 steps from 25us to 10s, which covers a local echo as well as a slow policy.
+DEFAULT_LATENCY_BUCKETS = (
+    0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Pending handler updates are applied once this many have queued up (and at every scrape).
+FOLD_EVERY = 1024
+
+_observation_labels = operator.attrgetter("event_type", "pipeline_name")
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value", "_function")
+
+    def __init__(self):
+        self.value = 0
+        self._function = None
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Makes the gauge report `function()` at scrape time instead of a stored value."""
+        self._function = function
+
+    def get(self):
+        if self._function is not None:
+            return self._function()
+        return self.value
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bound plus the implicit +Inf bucket. Counts are per bucket,
+        # not cumulative; they are accumulated at render time.
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def observe_many(self, values):
+        """Observes a list of values, which it sorts: one bisect per bound instead of per value."""
+        values.sort()
+        below = 0
+        for index, bound in enumerate(self.bounds):
+            upto = bisect.bisect_right(values, bound)
+            self.counts[index] += upto - below
+            below = upto
+        self.counts[-1] += len(values) - below
+        self.sum += sum(values)
+
+    def snapshot(self):
+        counts = list(self.counts)
+        return counts, sum(counts), self.sum
+
+    def quantile(self, q):
+        """
+        Estimates the q-quantile (0 < q < 1) by linear interpolation inside the matching bucket.
+
+        Returns None if nothing has been observed. Values beyond the last bound are
+        reported as the last bound.
+        """
+        counts, count, _ = self.snapshot()
+        if count == 0:
+            return None
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if index >= len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+
+class _Metric:
+    kind = None
+    child_class = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children = {}
+        self._children_lock = threading.Lock()
+        if not self.label_names:
+            self._default = self.labels()
+
+    def _new_child(self):
+        return self.child_class()
+
+    def labels(self, *label_values):
+        """
+        Returns the child for these label values, creating it on first use.
+
+        Resolve children once outside the hot path where the label values are fixed.
+        """
+        child = self._children.get(label_values)
+        if child is None:
+            if len(label_values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {label_values}")
+            with self._children_lock:
+                child = self._children.setdefault(label_values, self._new_child())
+        return child
+
+    def children(self):
+        with self._children_lock:
+            return list(self._children.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, child in self.children():
+            lines.extend(self._render_child(label_values, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+    child_class = _CounterChild
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def _render_child(self, label_values, child):
+        return [f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(child.value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    child_class = _GaugeChild
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+    def _render_child(self, label_values, child):
+        return [f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(child.get())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, label_names)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def _render_child(self, label_values, child):
+        counts, count, total = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, label_values, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, label_values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """A named collection of metrics that can be rendered in the Prometheus text format."""
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def metrics(self):
+        with self._lock:
+            return list(self._metrics.values())
+
+    def add_collector(self, collector):
+        """Registers a callable run before every scrape, e.g. to apply updates recorded off the metrics."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def collect(self):
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            collector()
+
+    def render_prometheus(self):
+        self.collect()
+        lines = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHttpServer:
+    """Serves a registry in the Prometheus text format on http://host:port/metrics from a daemon thread."""
+    def __init__(self, registry, port=9100, host="0.0.0.0"):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        # Imported here: http.server is slow to import and only needed when metrics are served.
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would otherwise flood stderr.
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._httpd.server_address[1]  # Resolves port 0 to the bound port
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+class RayMetricsBridge:
+    """
+    Periodically mirrors a registry into ray.util.metrics so it shows up on the Ray dashboard.
+
+    Counters are forwarded as deltas, gauges as their current value, and histograms as
+    their count/sum plus p50/p95/p99 gauges (Ray histograms can only be fed one
+    observation at a time, which would put Ray on our hot path).
+    """
+    def __init__(self, registry, interval_s=10.0):
+        self.registry = registry
+        self.interval_s = interval_s
+        self._ray_metrics = {}
+        self._last_counter_values = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _ray_metric(self, kind, name, documentation, label_names):
+        key = (kind, name)
+        metric = self._ray_metrics.get(key)
+        if metric is None:
+            from ray.util import metrics as ray_metrics  # Deferred: ray is only needed inside a Ray actor
+            cls = ray_metrics.Counter if kind == "counter" else ray_metrics.Gauge
+            metric = cls(name, description=documentation, tag_keys=label_names)
+            self._ray_metrics[key] = metric
+        return metric
+
+    def export_once(self):
+        self.registry.collect()
+        for metric in self.registry.metrics():
+            for label_values, child in metric.children():
+                tags = dict(zip(metric.label_names, label_values))
+                if isinstance(metric, Counter):
+                    key = (metric.name, label_values)
+                    delta = child.value - self._last_counter_values.get(key, 0)
+                    self._last_counter_values[key] = child.value
+                    if delta > 0:
+                        self._ray_metric("counter", metric.name, metric.documentation, metric.label_names).inc(delta, tags=tags)
+                elif isinstance(metric, Gauge):
+                    self._ray_metric("gauge", metric.name, metric.documentation, metric.label_names).set(child.get(), tags=tags)
+                elif isinstance(metric, Histogram):
+                    _, count, total = child.snapshot()
+                    gauges = {"count": count, "sum": total}
+                    for q in (0.5, 0.95, 0.99):
+                        value = child.quantile(q)
+                        if value is not None:
+                            gauges[f"p{int(q * 100)}"] = value
+                    for suffix, value in gauges.items():
+                        self._ray_metric("gauge", f"{metric.name}_{suffix}", metric.documentation, metric.label_names).set(value, tags=tags)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.export_once()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ray-metrics-bridge", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+class _MethodRecorder:
+    """The records of one instrumented method that ServerMetrics.fold() has yet to apply."""
+    __slots__ = ("latency", "errors", "request_deserializer", "response_serializer", "deserialize_time",
+                 "serialize_time", "elapsed", "failed", "labels", "batches", "last")
+
+    def __init__(self, latency, errors, request_deserializer, response_serializer, deserialize_time,
+                 serialize_time):
+        self.latency = latency
+        self.errors = errors
+        self.request_deserializer = request_deserializer
+        self.response_serializer = response_serializer
+        self.deserialize_time = deserialize_time
+        self.serialize_time = serialize_time
+        self.elapsed = collections.deque()  # Seconds, one per request
+        self.failed = collections.deque()  # A token per request whose handler raised
+        self.labels = collections.deque()  # (event_type, pipeline_name) of each observation request
+        self.batches = collections.deque()  # Batch requests whose observations are still to be counted
+        self.last = None  # (request, response) of the first request that succeeded since the last fold
+
+    def fold(self, labels, observed):
+        """Applies the pending records; adds the observations to count to `labels` and `observed`."""
+        elapsed = self.elapsed
+        popleft = elapsed.popleft
+        values = [popleft() for _ in range(len(elapsed))]
+        if values:
+            self.latency.observe_many(values)
+        failed = self.failed
+        for _ in range(len(failed)):
+            failed.popleft()
+            self.errors.value += 1
+        popleft = self.labels.popleft
+        labels.extend([popleft() for _ in range(len(self.labels))])
+        popleft = self.batches.popleft
+        for _ in range(len(self.batches)):
+            observed.extend(popleft().observations)
+        last, self.last = self.last, None
+        if last is not None:
+            self._time_codecs(*last)
+
+    def _time_codecs(self, request, response):
+        # Re-runs the method's codecs on a sampled request and response: timing them where gRPC
+        # calls them would cost every request a wrapper call.
+        if self.request_deserializer is not None and hasattr(request, "SerializeToString"):
+            data = request.SerializeToString()
+            start = time.perf_counter()
+            self.request_deserializer(data)
+            self.deserialize_time.observe(time.perf_counter() - start)
+        if self.response_serializer is not None:
+            start = time.perf_counter()
+            self.response_serializer(response)
+            self.serialize_time.observe(time.perf_counter() - start)
+
+
+class _AioRpcInterceptor(grpc.aio.ServerInterceptor):
+    # grpc.aio runs each RPC, from the handler lookup to the reply, in a task of its own.
+    def __init__(self, rpc_tasks):
+        self._rpc_tasks = rpc_tasks
+
+    async def intercept_service(self, continuation, handler_call_details):
+        task = asyncio.current_task()
+        self._rpc_tasks.add(task)
+        task.add_done_callback(self._rpc_tasks.discard)
+        return await continuation(handler_call_details)
+
+
+class ServerMetrics:
+    """
+    The metric set shared by AiServer and the Ray AiActionStreamer.
+
+    Per-RPC latency, in-flight requests, errors and (de)serialization time are recorded
+    by wrapping the method handlers at registration time, so servicers need no changes.
+    Observations are counted by event_type and pipeline_name for every request that
+    carries those fields, and for each entry of requests with an `observations` list.
+    EncodedObservationBatch entries are blank until decoded, so servicers count those
+    themselves with record_observation().
+    """
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        self.rpc_latency = self.registry.histogram(
+            "ai_server_rpc_latency_seconds", "Server-side latency of each RPC, including (de)serialization.", ("method",))
+        self.rpc_in_flight = self.registry.gauge(
+            "ai_server_rpc_in_flight", "RPCs currently being handled.", ("method",))
+        self.rpc_errors = self.registry.counter(
+            "ai_server_rpc_errors_total", "RPCs whose handler raised.", ("method",))
+        self.serialization_time = self.registry.histogram(
+            "ai_server_serialization_seconds",
+            "Time spent (de)serializing protobuf messages, sampled: the codecs are re-run on the first "
+            "request (and its response) handled after each fold.",
+            ("method", "direction"))
+        self.observations = self.registry.counter(
+            "ai_server_observations_total", "TaskObservations received.", ("event_type", "pipeline_name"))
+        self.handlers_in_flight = self.registry.gauge(
+            "ai_server_handlers_in_flight", "RPC handlers currently running, over all methods.")
+        self.handler_capacity = self.registry.gauge(
+            "ai_server_handler_capacity", "RPC handlers that can run at once (server worker threads).")
+        self.queue_depth = self.registry.gauge(
+            "ai_server_queue_depth",
+            "RPCs received but not in their handler: waiting for a worker thread, or in the grpc.aio event loop.")
+        self.cache_requests = self.registry.counter(
+            "ai_server_cache_requests_total", "Lookups in server-side caches, by result (hit, miss, in_progress).",
+            ("cache", "result"))
+        self.cache_evictions = self.registry.counter(
+            "ai_server_cache_evictions_total", "Entries evicted from server-side caches.", ("cache",))
+        self.fast_path_observations = self.registry.counter(
+            "ai_server_fast_path_observations_total",
+            "Observations routed by the fast path, by outcome (aggregated, sampled_in, sampled_out).",
+            ("event_type", "process_name", "outcome"))
+        self._observation_children = {}  # (event_type, pipeline_name) -> counter child
+        self._in_flight_tokens = {}  # method -> deque with one token per running handler
+        self._queued_work = collections.deque()  # One token per work item waiting in a tracked executor
+        self._aio_rpc_tasks = set()  # Tasks of the grpc.aio RPCs in progress
+        self._aio_handler_tokens = []  # The in-flight token deques of the coroutine handlers
+        self._recorders = []  # A _MethodRecorder per instrumented method
+        self._observed = collections.deque()  # Observations passed to record_observation(), not yet counted
+        self._fold_lock = threading.Lock()
+        self._wrapped = {}
+        self._wrapped_lock = threading.Lock()
+        self._http_server = None
+        self._ray_bridge = None
+        self.handlers_in_flight.set_function(
+            lambda: sum(len(tokens) for tokens in list(self._in_flight_tokens.values())))
+        self.queue_depth.set_function(self._queue_depth)
+        self.registry.add_collector(self.fold)
+
+    def fold(self):
+        """Applies the updates handlers recorded since the last fold."""
+        with self._fold_lock:
+            popleft = self._observed.popleft
+            observed = [popleft() for _ in range(len(self._observed))]
+            labels = []
+            for recorder in list(self._recorders):
+                recorder.fold(labels, observed)
+            counts = collections.Counter(labels)
+            counts.update(map(_observation_labels, observed))
+            for key, count in counts.items():
+                child = self._observation_children.get(key) or self._observation_child(key)
+                child.value += count
+
+    def record_observation(self, observation):
+        """Counts an observation that did not arrive as the request of an instrumented RPC (e.g. inside a batch)."""
+        self._observed.append(observation)
+        if len(self._observed) > FOLD_EVERY:
+            self.fold()
+
+    def set_handler_capacity(self, max_workers):
+        """Reports the number of server worker threads, against which handlers_in_flight shows saturation."""
+        self.handler_capacity.set(max_workers)
+
+    def track_executor(self, executor):
+        """
+        Counts the work items waiting for a thread of `executor` (the ThreadPoolExecutor of a
+        grpc.server(), one per RPC) in ai_server_queue_depth.
+        """
+        queued = self._queued_work
+        submit = executor.submit
+
+        def counting_submit(fn, *args, **kwargs):
+            def run():
+                queued.pop()
+                return fn(*args, **kwargs)
+            queued.append(None)
+            try:
+                return submit(run)
+            except BaseException:
+                queued.pop()
+                raise
+        executor.submit = counting_submit
+
+    def aio_interceptor(self):
+        """
+        A grpc.aio server interceptor that tracks the RPCs in progress, so that ai_server_queue_depth
+        counts those not in their handler: waiting for the event loop, or reading the request.
+        Pass it to grpc.aio.server(interceptors=[...]).
+        """
+        return _AioRpcInterceptor(self._aio_rpc_tasks)
+
+    def _queue_depth(self):
+        # The handler side costs nothing per request: RPC tasks minus the coroutine handlers running.
+        in_handlers = sum(len(tokens) for tokens in list(self._aio_handler_tokens))
+        return len(self._queued_work) + max(0, len(self._aio_rpc_tasks) - in_handlers)
+
+    def track_reply_cache(self, reply_cache, cache="reply"):
+        """Exports the lookup and eviction counts of a ReplyCache (utilities/reply_cache.py) at every scrape."""
+        children = {stat: self.cache_requests.labels(cache, result)
+                    for stat, result in (("hits", "hit"), ("misses", "miss"), ("in_progress", "in_progress"))}
+        evictions = self.cache_evictions.labels(cache)
+
+        def collect():
+            counts = reply_cache.counts()
+            for stat, child in children.items():
+                child.value = counts.get(stat, 0)
+            evictions.value = counts.get("evicted", 0)
+        self.registry.add_collector(collect)
+
+    def track_fast_path(self, fast_path):
+        """Counts the observations a FastPath (utilities/fast_path.py) routes."""
+        fast_path.track_metrics(self.fast_path_observations)
+
+    def add_servicer_to_server(self, servicer, add_servicer_function, server):
+        """
+        Registers `servicer` like the generated add_*Servicer_to_server function, but instrumented.
+
+        Args:
+            servicer: The servicer instance.
+            add_servicer_function: The generated registration function, e.g.
+                                   nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server,
+                                   possibly already wrapped with wrap_registration().
+            server: A grpc.Server or grpc.aio.Server.
+        """
+        wrap_registration(add_servicer_function, self.wrap_handler)(servicer, server)
+
+    def wrap_handler(self, full_method, handler):
+        # Handlers are wrapped once per method and shared between the generic and registered paths.
+        with self._wrapped_lock:
+            wrapped = self._wrapped.get(full_method)
+            if wrapped is not None:
+                return wrapped
+            if handler.request_streaming or handler.response_streaming:
+                wrapped = handler
+            else:
+                wrapped = self._wrap_unary_handler(full_method, handler)
+            self._wrapped[full_method] = wrapped
+            return wrapped
+
+    def _wrap_unary_handler(self, full_method, handler):
+        method = full_method.rsplit("/", 1)[-1]
+        tokens = self._in_flight_tokens.setdefault(method, collections.deque())
+        self.rpc_in_flight.labels(method).set_function(tokens.__len__)
+        behavior = handler.unary_unary
+        # Observations are only counted for methods whose request message has the fields.
+        request_class = getattr(handler.request_deserializer, "__self__", None)
+        request_fields = getattr(getattr(request_class, "DESCRIPTOR", None), "fields_by_name", {})
+        counts_observations = "event_type" in request_fields and "pipeline_name" in request_fields
+        # Not for an EncodedObservationBatch (it has `strings`): its deduplicated fields are blank here.
+        counts_batch = "observations" in request_fields and "strings" not in request_fields
+        recorder = _MethodRecorder(
+            self.rpc_latency.labels(method), self.rpc_errors.labels(method),
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+            deserialize_time=self.serialization_time.labels(method, "deserialize"),
+            serialize_time=self.serialization_time.labels(method, "serialize"),
+        )
+        self._recorders.append(recorder)
+        # Bound to locals: the closures below run on every request, and only append to deques.
+        record_elapsed = recorder.elapsed.append
+        record_failed = recorder.failed.append
+        record_labels = recorder.labels.append
+        record_batch = recorder.batches.append
+        pending = recorder.elapsed
+        fold = self.fold
+        enter = tokens.append
+        leave = tokens.pop
+        perf_counter = time.perf_counter
+        fold_every = FOLD_EVERY
+
+        if inspect.iscoroutinefunction(behavior):
+            self._aio_handler_tokens.append(tokens)
+
+            async def instrumented(request, context):
+                enter(None)
+                start = perf_counter()
+                try:
+                    response = await behavior(request, context)
+                except BaseException:
+                    record_failed(None)
+                    raise
+                finally:
+                    record_elapsed(perf_counter() - start)
+                    leave()
+                if counts_observations:
+                    record_labels((request.event_type, request.pipeline_name))
+                elif counts_batch:
+                    record_batch(request)
+                if recorder.last is None:
+                    recorder.last = (request, response)
+                if len(pending) > fold_every:
+                    fold()
+                return response
+        else:
+            def instrumented(request, context):
+                enter(None)
+                start = perf_counter()
+                try:
+                    response = behavior(request, context)
+                except BaseException:
+                    record_failed(None)
+                    raise
+                finally:
+                    record_elapsed(perf_counter() - start)
+                    leave()
+                if counts_observations:
+                    record_labels((request.event_type, request.pipeline_name))
+                elif counts_batch:
+                    record_batch(request)
+                if recorder.last is None:
+                    recorder.last = (request, response)
+                if len(pending) > fold_every:
+                    fold()
+                return response
+
+        return handler._replace(unary_unary=instrumented)
+
+    def _observation_child(self, key):
+        # Slow path of the per-request counting: first observation for this label pair.
+        child = self._observation_children[key] = self.observations.labels(*key)
+        return child
+
+    def start_http_server(self, port=9100, host="0.0.0.0"):
+        """Starts the Prometheus endpoint. Returns the bound port."""
+        self._http_server = MetricsHttpServer(self.registry, port=port, host=host)
+        return self._http_server.start()
+
+    def start_ray_bridge(self, interval_s=10.0):
+        self._ray_bridge = RayMetricsBridge(self.registry, interval_s=interval_s)
+        self._ray_bridge.start()
+
+    def stop(self):
+        if self._http_server:
+            self._http_server.stop()
+            self._http_server = None
+        if self._ray_bridge:
+            self._ray_bridge.stop()
+            self._ray_bridge = None
@@ -3,28 +3,25 @@ import uuid
 import datetime
 
 # Import the generated classes
-# Assuming 'proto' directory is in PYTHONPATH or handled by the calling script.
-import nf_ai_comms_pb2
-import nf_ai_comms_pb2_grpc
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
 
-def send_task_observation(observation_data, server_address='localhost:50052'):
+from bioworkflowml.utilities.spool import spool_on_failure
+from bioworkflowml.utilities.wire_format import compression_algorithm
+
+def build_task_observation(observation_data):
     """
-    Sends a TaskObservation to the AiActionService asynchronously and returns a future.
+    Maps an observation dictionary onto a TaskObservation message.
+
+    Missing event_id and timestamp_iso are generated; numeric fields given as strings are
+    converted (with a warning and the proto default if conversion fails).
 
     Args:
         observation_data (dict): A dictionary containing the data for the TaskObservation.
-        server_address (str): The address (host:port) of the gRPC server.
 
     Returns:
-        grpc.Future: A future object representing the asynchronous call.
-                     The result of the future will be an nf_ai_comms_pb2.Action message.
-                     The caller is responsible for managing the future (e.g., adding callbacks,
-                     checking for exceptions, waiting for results) and for channel management
-                     if making many calls (this function creates a channel per call but does not close it).
+        nf_ai_comms_pb2.TaskObservation: The populated message.
     """
-    channel = grpc.insecure_channel(server_address) # Channel created per call
-    stub = nf_ai_comms_pb2_grpc.AiActionServiceStub(channel)
-
     request = nf_ai_comms_pb2.TaskObservation()
 
     # Map dictionary data to protobuf message fields
@@ -71,6 +68,20 @@ def send_task_observation(observation_data, server_address='localhost:50052'):
         except ValueError:
              print(f"Warning: Could not convert peak_rss_bytes '{observation_data['peak_rss_bytes']}' to int.")
 
+    # Resource readings, on task_complete and on the periodic task_progress events of running tasks,
+    # and the resources a task was submitted with
+    for field in ("realtime_ms", "peak_vmem_bytes", "read_bytes", "write_bytes", "rss_bytes",
+                  "memory_limit_bytes", "time_limit_ms", "cpus"):
+        if field in observation_data:
+            try:
+                setattr(request, field, int(observation_data[field]))
+            except ValueError:
+                print(f"Warning: Could not convert {field} '{observation_data[field]}' to int.")
+    if "cpu_percent" in observation_data:
+        request.cpu_percent = str(observation_data["cpu_percent"])
+    if "upstream_processes" in observation_data:
+        request.upstream_processes.extend(str(name) for name in observation_data["upstream_processes"])
+
     if "cpu_time_seconds" in observation_data:
         try:
             request.cpu_time_seconds = float(observation_data["cpu_time_seconds"])
@@ -85,8 +96,70 @@ def send_task_observation(observation_data, server_address='localhost:50052'):
     # request.script_id = observation_data.get("script_id", "")
     # request.script_hash = observation_data.get("script_hash", "")
 
-    # Make the non-blocking (asynchronous) call
-    future = stub.SendTaskObservation.future(request)
+    return request
+
+SEND_TASK_OBSERVATION_METHOD = '/nf_ai_comms.AiActionService/SendTaskObservation'
+
+def channel_target(server_address):
+    """
+    Maps a server address onto a gRPC channel target.
+
+    "host:port" is used as-is. A Unix domain socket is given as "unix:/path/to.sock",
+    "unix:///path/to.sock" or simply an absolute path; co-located servers listening on
+    one (see AiServer's uds_path) skip the TCP stack.
+    """
+    if server_address.startswith("/"):
+        return "unix:" + server_address
+    return server_address
+
+def send_task_observation(observation_data, server_address='localhost:50052', tracer=None, spool=None, timeout=None,
+                          compression=None):
+    """
+    Sends a TaskObservation to the AiActionService asynchronously and returns a future.
+
+    Args:
+        observation_data (dict): A dictionary containing the data for the TaskObservation.
+        server_address (str): The address (host:port, or a Unix domain socket as "unix:/path") of the gRPC server.
+        tracer (utilities.tracing.Tracer): Optional. If given, a sampled fraction of observations
+                                           is traced end to end (see utilities/tracing.py).
+        spool (utilities.spool.ObservationSpool): Optional. If given, observations whose call fails
+                                                  because the server is unavailable (or similar
+                                                  retryable errors) are written to this on-disk
+                                                  spool and replayed later by a SpoolDrainer.
+        timeout (float): Optional. Deadline for the call in seconds; the server sees the
+                         remaining time and the future fails with DEADLINE_EXCEEDED when it
+                         expires. For retries, hedging and multiple servers, see
+                         utilities.resilient_client.ResilientAiClient.
+        compression: Optional. "gzip" or "deflate" (or a grpc.Compression) to compress the
+                     observation on the wire (see utilities/wire_format.py).
+
+    Returns:
+        grpc.Future: A future object representing the asynchronous call.
+                     The result of the future will be an nf_ai_comms_pb2.Action message.
+                     The caller is responsible for managing the future (e.g., adding callbacks,
+                     checking for exceptions, waiting for results) and for channel management
+                     if making many calls (this function creates a channel per call but does not close it).
+    """
+    trace = tracer.start_client_trace() if tracer is not None else None
+
+    channel = grpc.insecure_channel(channel_target(server_address)) # Channel created per call
+    stub = nf_ai_comms_pb2_grpc.AiActionServiceStub(channel)
+    if trace is not None:
+        trace.channel_ready()
+
+    request = build_task_observation(observation_data)
+    compression = compression_algorithm(compression)
+
+    if trace is not None:
+        trace.attributes["event_id"] = request.event_id
+        future = trace.call_unary_future(channel, SEND_TASK_OBSERVATION_METHOD, request, nf_ai_comms_pb2.Action.FromString,
+                                         timeout=timeout, compression=compression)
+    else:
+        # Make the non-blocking (asynchronous) call
+        future = stub.SendTaskObservation.future(request, timeout=timeout, compression=compression)
+
+    if spool is not None:
+        spool_on_failure(future, request, spool)
     return future
 
 if __name__ == '__main__':
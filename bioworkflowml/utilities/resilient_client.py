@@ -0,0 +1,399 @@
+"""
+A TaskObservation client that survives slow and failing AI servers.
+
+send_task_observation() talks to one address and surfaces every error. ResilientAiClient
+instead keeps a channel per server address and, for each observation:
+
+-   Enforces one deadline for the whole operation. Every attempt is sent with the time that
+    is left, so gRPC propagates the remaining budget to the server and retries never
+    outlive the caller's deadline.
+-   Retries retryable failures (UNAVAILABLE, RESOURCE_EXHAUSTED, ...) with capped
+    exponential backoff and full jitter. A server may have decided an attempt that failed
+    on the client (DEADLINE_EXCEEDED, a dropped connection), so every observation is sent
+    with an event_id (one is generated if it has none). A server that already answered that
+    event_id replies with its cached Action instead of deciding it again (see
+    utilities/reply_cache.py). The cache is per server: a retry or hedge that lands on a
+    different server is decided there too, in that server's own state.
+-   Hedges: if no answer has arrived after the recent p95 latency, the same observation is
+    sent to a second server and whichever answer comes first wins. The slower call is
+    cancelled.
+-   Balances load over the healthy addresses by picking the less loaded of two random
+    candidates. An address is unhealthy while its channel reports TRANSIENT_FAILURE, or for
+    `eject_s` after `eject_after_failures` consecutive failed calls.
+-   close() fails the observations still pending with ClientClosedError (CANCELLED), and
+    spools them if a spool is set.
+
+Usage:
+    client = ResilientAiClient(["ai-1:50052", "ai-2:50052"], timeout=2.0)
+    action = client.send(observation_data).result()
+    client.close()
+"""
+import collections
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+import grpc
+
+# Import the generated classes
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+
+from bioworkflowml.utilities.nf_client import build_task_observation, channel_target
+from bioworkflowml.utilities.wire_format import compression_algorithm
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = frozenset([
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    grpc.StatusCode.ABORTED,
+    grpc.StatusCode.DEADLINE_EXCEEDED,  # Only retried while the overall deadline has time left
+])
+
+DEFAULT_CHANNEL_OPTIONS = [
+    # Detect dead connections to a replica that vanished without closing its sockets.
+    ("grpc.keepalive_time_ms", 60000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.use_local_subchannel_pool", 1),
+]
+
+
+class DeadlineExceededError(grpc.RpcError):
+    """Raised when the overall deadline expires before any attempt succeeded."""
+    def __init__(self, last_error=None):
+        super().__init__("Deadline exceeded")
+        self.last_error = last_error
+
+    def code(self):
+        return grpc.StatusCode.DEADLINE_EXCEEDED
+
+    def details(self):
+        if self.last_error is not None:
+            return f"Deadline exceeded; last attempt failed with {self.last_error.code()}"
+        return "Deadline exceeded"
+
+
+class ClientClosedError(grpc.RpcError):
+    """Raised for observations still pending when the client is closed."""
+    def code(self):
+        return grpc.StatusCode.CANCELLED
+
+    def details(self):
+        return "ResilientAiClient was closed before the observation was answered"
+
+
+class _Scheduler:
+    """Runs callbacks at a given monotonic time on one background thread (backoffs and hedges)."""
+    def __init__(self):
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="resilient-client-scheduler", daemon=True)
+        self._thread.start()
+
+    def call_at(self, when, function):
+        with self._condition:
+            heapq.heappush(self._heap, (when, next(self._sequence), function))
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._condition.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self._stopped:
+                    return
+                _, _, function = heapq.heappop(self._heap)
+            try:
+                function()
+            except Exception:
+                # One failing callback must not take the retries and hedges of every other observation with it.
+                logger.exception("Scheduled callback failed")
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+
+
+class Endpoint:
+    """One AI server address: its channel, stub and health bookkeeping."""
+    def __init__(self, address, channel_options, compression=None):
+        self.address = address
+        self.channel = grpc.insecure_channel(channel_target(address), options=channel_options, compression=compression)
+        self.call = nf_ai_comms_pb2_grpc.AiActionServiceStub(self.channel).SendTaskObservation
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.state = grpc.ChannelConnectivity.IDLE
+        self.channel.subscribe(self._on_state_change, try_to_connect=True)
+
+    def _on_state_change(self, state):
+        self.state = state
+
+    @property
+    def healthy(self):
+        return (self.state not in (grpc.ChannelConnectivity.TRANSIENT_FAILURE, grpc.ChannelConnectivity.SHUTDOWN)
+                and time.monotonic() >= self.ejected_until)
+
+    def close(self):
+        self.channel.unsubscribe(self._on_state_change)
+        self.channel.close()
+
+
+class _Operation:
+    """State shared by all attempts (retries and hedges) of one observation."""
+    __slots__ = ("request", "future", "deadline", "compression", "attempts", "hedges", "calls", "tried",
+                 "last_error", "lock")
+
+    def __init__(self, request, deadline, compression=None):
+        self.request = request
+        self.compression = compression
+        self.future = Future()
+        self.deadline = deadline
+        self.attempts = 0
+        self.hedges = 0
+        self.calls = {}  # grpc future -> (endpoint, start time) for attempts still in flight
+        self.tried = set()
+        self.last_error = None
+        # Reentrant: gRPC runs done callbacks inline when a call has already finished or is cancelled.
+        self.lock = threading.RLock()
+
+
+class ResilientAiClient:
+    """
+    Sends TaskObservations to a set of AI servers with deadlines, retries, hedging and
+    health-aware load balancing (see the module docstring).
+    """
+    def __init__(self, server_addresses, timeout=5.0, max_attempts=4, initial_backoff_s=0.05,
+                 max_backoff_s=1.0, hedge=True, max_hedges=1, hedge_quantile=0.95,
+                 min_hedge_delay_s=0.002, initial_hedge_delay_s=0.05, latency_window=1000,
+                 eject_after_failures=3, eject_s=5.0, channel_options=None, spool=None, compression=None):
+        """
+        Args:
+            server_addresses (list): AI server addresses (host:port). A single string is accepted too.
+            timeout (float): Overall deadline per observation in seconds, across all attempts.
+            max_attempts (int): Maximum number of attempts per observation, hedges included.
+            initial_backoff_s (float): Backoff ceiling before the first retry; doubles per retry.
+            max_backoff_s (float): Upper bound of the backoff ceiling.
+            hedge (bool): Whether to send a hedged request when the first one is slow.
+            max_hedges (int): Maximum number of hedged requests per observation.
+            hedge_quantile (float): Latency quantile after which a request is hedged.
+            min_hedge_delay_s (float): Lower bound on the hedge delay, so fast servers aren't
+                                       hedged on noise.
+            initial_hedge_delay_s (float): Hedge delay until enough latencies have been seen.
+            latency_window (int): Number of recent call latencies the hedge delay is derived from.
+            eject_after_failures (int): Consecutive failed calls after which an address is ejected.
+            eject_s (float): How long an ejected address is skipped.
+            channel_options (list): Extra grpc channel options.
+            spool (utilities.spool.ObservationSpool): Optional. Observations that still fail with
+                                                      a retryable error are appended here.
+            compression: Default compression of every call: "gzip", "deflate" or a grpc.Compression.
+        """
+        if isinstance(server_addresses, str):
+            server_addresses = [server_addresses]
+        if not server_addresses:
+            raise ValueError("At least one server address is required")
+        options = DEFAULT_CHANNEL_OPTIONS + list(channel_options or [])
+        compression = compression_algorithm(compression)
+        self.endpoints = [Endpoint(address, options, compression) for address in server_addresses]
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.initial_backoff_s = initial_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.hedge = hedge and len(self.endpoints) > 1
+        self.max_hedges = max_hedges
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay_s = min_hedge_delay_s
+        self.eject_after_failures = eject_after_failures
+        self.eject_s = eject_s
+        self.spool = spool
+
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._hedge_delay_s = initial_hedge_delay_s
+        self._completions = 0
+        self._scheduler = _Scheduler()
+        # Guards Endpoint.in_flight, which the attempts of all operations update, and the pending operations.
+        self._lock = threading.Lock()
+        self._operations = set()
+        self._closed = False
+
+        self.stats = collections.Counter()
+
+    def close(self):
+        """Fails the observations still pending with ClientClosedError, then closes the channels."""
+        with self._lock:
+            self._closed = True
+            pending, self._operations = self._operations, set()
+        self._scheduler.stop()
+        for operation in pending:
+            with operation.lock:
+                if not operation.future.done():
+                    self._fail(operation, ClientClosedError())
+        for endpoint in self.endpoints:
+            endpoint.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def hedge_delay_s(self):
+        return self._hedge_delay_s
+
+    def send(self, observation, timeout=None, compression=None):
+        """
+        Sends one observation.
+
+        Args:
+            observation: A TaskObservation or a dictionary accepted by build_task_observation().
+            timeout (float): Overrides the client's overall deadline for this observation.
+            compression: Overrides the client's compression for this observation.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the nf_ai_comms_pb2.Action, or raises the
+                                       last grpc.RpcError (DeadlineExceededError if time ran out).
+        """
+        request = build_task_observation(observation) if isinstance(observation, dict) else observation
+        if not request.event_id:
+            # Servers only recognise a retried observation by its event_id.
+            original, request = request, nf_ai_comms_pb2.TaskObservation(event_id=str(uuid.uuid4()))
+            request.MergeFrom(original)
+        operation = _Operation(request, time.monotonic() + (self.timeout if timeout is None else timeout),
+                               compression_algorithm(compression))
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ResilientAiClient is closed")
+            self._operations.add(operation)
+        operation.future.add_done_callback(lambda _: self._forget(operation))
+        # The overall deadline holds even if an attempt or a scheduled retry never completes.
+        self._scheduler.call_at(operation.deadline, lambda: self._expire(operation))
+        with operation.lock:
+            self._start_attempt(operation)
+        return operation.future
+
+    def _forget(self, operation):
+        with self._lock:
+            self._operations.discard(operation)
+
+    def _expire(self, operation):
+        with operation.lock:
+            if not operation.future.done():
+                self._fail(operation, DeadlineExceededError(operation.last_error))
+
+    def _pick_endpoint(self, exclude):
+        candidates = [e for e in self.endpoints if e.healthy and e not in exclude]
+        if not candidates:
+            candidates = [e for e in self.endpoints if e not in exclude] or self.endpoints
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if first.in_flight <= second.in_flight else second
+
+    def _start_attempt(self, operation, hedged=False):
+        # Called with operation.lock held.
+        remaining = operation.deadline - time.monotonic()
+        if remaining <= 0:
+            if not operation.calls:
+                self._fail(operation, DeadlineExceededError(operation.last_error))
+            return
+        endpoint = self._pick_endpoint(operation.tried if hedged else ())
+        operation.attempts += 1
+        operation.tried.add(endpoint)
+        with self._lock:
+            endpoint.in_flight += 1
+        call = endpoint.call.future(operation.request, timeout=remaining, compression=operation.compression)
+        operation.calls[call] = (endpoint, time.monotonic())
+        call.add_done_callback(lambda done: self._on_attempt_done(operation, done))
+
+        if (self.hedge and operation.hedges < self.max_hedges and operation.attempts < self.max_attempts
+                and remaining > self._hedge_delay_s):
+            self._scheduler.call_at(time.monotonic() + self._hedge_delay_s, lambda: self._maybe_hedge(operation, call))
+
+    def _maybe_hedge(self, operation, call):
+        with operation.lock:
+            # Only hedge if the attempt that scheduled this is still the one we are waiting on.
+            if operation.future.done() or call not in operation.calls or operation.attempts >= self.max_attempts:
+                return
+            operation.hedges += 1
+            self.stats["hedges"] += 1
+            self._start_attempt(operation, hedged=True)
+
+    def _on_attempt_done(self, operation, call):
+        with operation.lock:
+            endpoint, started = operation.calls.pop(call)
+            with self._lock:
+                endpoint.in_flight -= 1
+            if operation.future.done():
+                return  # A faster attempt already answered; this one was cancelled
+
+            error = call.exception()
+            if error is None:
+                endpoint.consecutive_failures = 0
+                self._record_latency(time.monotonic() - started)
+                operation.future.set_result(call.result())
+                self._cancel_others(operation)
+                return
+
+            operation.last_error = error
+            code = error.code()
+            if code in RETRYABLE_STATUS_CODES:
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.eject_after_failures:
+                    endpoint.ejected_until = time.monotonic() + self.eject_s
+            if code not in RETRYABLE_STATUS_CODES:
+                self._fail(operation, error)
+            elif operation.calls:
+                return  # A hedged attempt is still in flight and may yet succeed
+            elif operation.attempts >= self.max_attempts:
+                self._fail(operation, error)
+            else:
+                self._schedule_retry(operation)
+
+    def _schedule_retry(self, operation):
+        retries = operation.attempts - operation.hedges
+        ceiling = min(self.max_backoff_s, self.initial_backoff_s * (2 ** (retries - 1)))
+        delay = random.uniform(0, ceiling)  # Full jitter keeps retrying clients from moving in lockstep
+        if time.monotonic() + delay >= operation.deadline:
+            self._fail(operation, DeadlineExceededError(operation.last_error))
+            return
+        self.stats["retries"] += 1
+
+        def retry():
+            with operation.lock:
+                if not operation.future.done():
+                    operation.tried.clear()
+                    self._start_attempt(operation)
+
+        self._scheduler.call_at(time.monotonic() + delay, retry)
+
+    def _cancel_others(self, operation):
+        for call in list(operation.calls):
+            call.cancel()
+
+    def _fail(self, operation, error):
+        self.stats["failures"] += 1
+        # Observations cut off by close() were never answered either, so they are spooled too.
+        if self.spool is not None and (error.code() in RETRYABLE_STATUS_CODES or isinstance(error, ClientClosedError)):
+            self.spool.append(operation.request)
+        operation.future.set_exception(error)
+        self._cancel_others(operation)
+
+    def _record_latency(self, seconds):
+        self._latencies.append(seconds)
+        self._completions += 1
+        # Sorting the window on every call would cost more than the call itself.
+        if self._completions % 100 == 0:
+            ordered = sorted(self._latencies)
+            index = min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))
+            self._hedge_delay_s = max(self.min_hedge_delay_s, ordered[index])
@@ -0,0 +1,432 @@
+"""
+In-memory state of the pipelines the AI server is observing.
+
+Observations arrive one at a time and carry no history. SessionStore keeps, per
+pipeline_name, a record of every task seen (indexed by task_id_num and task_hash) and
+running counters per process_name, so a policy can see in O(1) when a task started, how
+many of its process are running, or that it is a retry.
+
+    store = SessionStore(snapshot_path="/var/tmp/bioflow-sessions.json")
+    task = store.observe(observation)           # the TaskRecord, with task.session for the pipeline
+    task.session.processes["ALIGN"].running
+
+Records use __slots__: a long pipeline has hundreds of thousands of tasks, and a slotted
+record is a fraction of the size of an instance dict.
+"""
+import collections
+import json
+import operator
+import os
+import threading
+import time
+
+PIPELINE_FINISHED_EVENT_TYPES = frozenset(["pipeline_complete", "workflow_complete"])
+FAILED_STATUSES = frozenset(["FAILED", "ABORTED"])
+
+# TaskRecord.state values
+SUBMITTED = "submitted"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class ProcessCounters:
+    """Running counts for one process_name of a pipeline."""
+    __slots__ = ("submitted", "running", "completed", "failed", "retried", "total_duration_ms")
+
+    def __init__(self):
+        self.submitted = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.total_duration_ms = 0
+
+    def mean_duration_ms(self):
+        finished = self.completed + self.failed
+        return self.total_duration_ms / finished if finished else None
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        counters = cls()
+        for name in cls.__slots__:
+            setattr(counters, name, data.get(name, 0))
+        return counters
+
+
+class TaskRecord:
+    """Everything known about one task. `attempt` is 1 for the first task of a task_hash."""
+    __slots__ = ("session", "task_id_num", "task_hash", "process_name", "task_name", "native_id",
+                 "status", "state", "attempt", "first_seen", "started_at", "finished_at",
+                 "exit_code", "duration_ms", "realtime_ms", "peak_rss_bytes", "last_event_type")
+
+    SNAPSHOT_FIELDS = __slots__[1:]  # Everything but the back-reference; snapshots store rows of these
+
+    def __init__(self, session, task_id_num, task_hash, process_name, now):
+        self.session = session
+        self.task_id_num = task_id_num
+        self.task_hash = task_hash
+        self.process_name = process_name
+        self.task_name = ""
+        self.native_id = ""
+        self.status = ""
+        self.state = None
+        self.attempt = 1
+        self.first_seen = now
+        self.started_at = None
+        self.finished_at = None
+        self.exit_code = None
+        self.duration_ms = None
+        self.realtime_ms = None
+        self.peak_rss_bytes = None
+        self.last_event_type = ""
+
+    @property
+    def running_for_s(self):
+        if self.started_at is None or self.finished_at is not None:
+            return None
+        return time.time() - self.started_at
+
+    @classmethod
+    def from_row(cls, session, row):
+        """Rebuilds a record from a row of SNAPSHOT_FIELDS. Restores create many, so this skips __init__."""
+        record = cls.__new__(cls)
+        record.session = session
+        (record.task_id_num, record.task_hash, record.process_name, record.task_name, record.native_id,
+         record.status, record.state, record.attempt, record.first_seen, record.started_at, record.finished_at,
+         record.exit_code, record.duration_ms, record.realtime_ms, record.peak_rss_bytes,
+         record.last_event_type) = row
+        return record
+
+
+_task_row = operator.attrgetter(*TaskRecord.SNAPSHOT_FIELDS)
+
+
+class PipelineSession:
+    """The tasks and per-process counters of one pipeline_name."""
+    __slots__ = ("pipeline_name", "tasks_by_id", "tasks_by_hash", "processes", "observations",
+                 "created_at", "last_seen", "finished_at", "changed_tasks")
+
+    def __init__(self, pipeline_name, now):
+        self.pipeline_name = pipeline_name
+        self.tasks_by_id = {}
+        self.tasks_by_hash = {}  # Latest attempt for each task_hash
+        self.processes = collections.defaultdict(ProcessCounters)
+        self.observations = 0
+        self.created_at = now
+        self.last_seen = now
+        self.finished_at = None
+        self.changed_tasks = set()  # Records touched since the last incremental checkpoint
+
+    def apply(self, observation, now):
+        """Folds one observation into the session. Returns its TaskRecord, or None for pipeline-level events."""
+        self.observations += 1
+        self.last_seen = now
+        event_type = observation.event_type
+        if event_type in PIPELINE_FINISHED_EVENT_TYPES:
+            self.finished_at = now
+            return None
+        task_id = observation.task_id_num
+        task_hash = observation.task_hash
+        if not task_id and not task_hash:
+            return None
+
+        # Tasks are identified by task_id_num; an observation without one is matched by task_hash.
+        record = self.tasks_by_id.get(task_id) if task_id else self.tasks_by_hash.get(task_hash)
+        counters = self.processes[observation.process_name]
+        if record is None:
+            record = TaskRecord(self, task_id, task_hash, observation.process_name, now)
+            if task_id:
+                self.tasks_by_id[task_id] = record
+            if task_hash:
+                previous = self.tasks_by_hash.get(task_hash)
+                if previous is not None:
+                    record.attempt = previous.attempt + 1
+                    counters.retried += 1
+                self.tasks_by_hash[task_hash] = record
+        elif task_hash and not record.task_hash:
+            record.task_hash = task_hash
+            self.tasks_by_hash.setdefault(task_hash, record)
+
+        record.last_event_type = event_type
+        if observation.status:
+            record.status = observation.status
+        if observation.task_name:
+            record.task_name = observation.task_name
+        if observation.native_id:
+            record.native_id = observation.native_id
+
+        if event_type == "task_submit":
+            if record.state is None:
+                record.state = SUBMITTED
+                counters.submitted += 1
+        elif event_type == "task_start":
+            if record.state in (None, SUBMITTED):
+                record.state = RUNNING
+                record.started_at = now
+                counters.running += 1
+        elif event_type == "task_complete":
+            if record.state not in (COMPLETED, FAILED):
+                if record.state == RUNNING:
+                    counters.running -= 1
+                failed = observation.status in FAILED_STATUSES
+                record.state = FAILED if failed else COMPLETED
+                record.finished_at = now
+                record.exit_code = observation.exit_code
+                record.duration_ms = observation.duration_ms
+                record.realtime_ms = observation.realtime_ms
+                record.peak_rss_bytes = observation.peak_rss_bytes
+                if failed:
+                    counters.failed += 1
+                else:
+                    counters.completed += 1
+                counters.total_duration_ms += observation.duration_ms
+        self.changed_tasks.add(record)
+        return record
+
+    def _records(self):
+        yield from self.tasks_by_id.values()
+        # Tasks only known by hash
+        for record in self.tasks_by_hash.values():
+            if not record.task_id_num:
+                yield record
+
+    def task(self, task_id_num):
+        return self.tasks_by_id.get(task_id_num)
+
+    def latest_attempt(self, task_hash):
+        return self.tasks_by_hash.get(task_hash)
+
+    def to_dict(self, changed_only=False):
+        """The session as plain data. With changed_only, only tasks touched since the previous such call."""
+        data, records = self.capture(changed_only)
+        data["tasks"] = [_task_row(record) for record in records]
+        return data
+
+    def capture(self, changed_only=False):
+        """
+        The cheap part of to_dict(): returns (data, records), the session without its "tasks"
+        and the TaskRecords to turn into them. Callers holding the store lock take this under
+        it and build the rows after releasing it.
+        """
+        if changed_only:
+            records, self.changed_tasks = self.changed_tasks, set()
+        else:
+            records = list(self._records())
+        data = {
+            "pipeline_name": self.pipeline_name,
+            "observations": self.observations,
+            "created_at": self.created_at,
+            "last_seen": self.last_seen,
+            "finished_at": self.finished_at,
+            "processes": {name: counters.to_dict() for name, counters in self.processes.items()},
+            "task_fields": TaskRecord.SNAPSHOT_FIELDS,
+        }
+        return data, records
+
+    def merge_dict(self, data):
+        """Applies a to_dict(changed_only=True) of this session on top of it."""
+        self.observations = data["observations"]
+        self.last_seen = data["last_seen"]
+        self.finished_at = data["finished_at"]
+        for name, counters in data["processes"].items():
+            self.processes[name] = ProcessCounters.from_dict(counters)
+        rows = data["tasks"]
+        fields = tuple(data["task_fields"])
+        if fields != TaskRecord.SNAPSHOT_FIELDS:
+            # Written by a version with other fields: map by name, leaving new ones unset.
+            rows = [tuple(dict(zip(fields, row)).get(name) for name in TaskRecord.SNAPSHOT_FIELDS) for row in rows]
+        from_row = TaskRecord.from_row
+        tasks_by_id = self.tasks_by_id
+        tasks_by_hash = self.tasks_by_hash
+        for row in rows:
+            record = from_row(self, row)
+            if record.task_id_num:
+                tasks_by_id[record.task_id_num] = record
+            if record.task_hash:
+                latest = tasks_by_hash.get(record.task_hash)
+                if latest is None or record.attempt >= latest.attempt:
+                    tasks_by_hash[record.task_hash] = record
+
+    @classmethod
+    def from_dict(cls, data):
+        session = cls(data["pipeline_name"], data["created_at"])
+        session.merge_dict(data)
+        return session
+
+
+class SessionStore:
+    """
+    Pipeline sessions keyed by pipeline_name, with eviction and periodic snapshots.
+
+    observe() is O(1) and thread-safe. Sessions are evicted `finished_retention_s` after
+    their pipeline reported completion, after `idle_timeout_s` without observations, or
+    least recently seen first when more than `max_pipelines` are tracked.
+
+    If `snapshot_path` is set, the store is restored from it on construction and
+    start_snapshots() writes it every `snapshot_interval_s` (atomically, via rename).
+    """
+    def __init__(self, max_pipelines=1000, idle_timeout_s=6 * 3600, finished_retention_s=300,
+                 snapshot_path=None, snapshot_interval_s=60.0):
+        self.max_pipelines = max_pipelines
+        self.idle_timeout_s = idle_timeout_s
+        self.finished_retention_s = finished_retention_s
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval_s = snapshot_interval_s
+        self._sessions = collections.OrderedDict()  # Least recently seen first
+        # Pipelines changed or dropped since the last take_changes(), for incremental checkpoints.
+        self._changed = set()
+        self._removed = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.evicted = 0
+        self.snapshots_written = 0
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.restore(snapshot_path)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def observe(self, observation):
+        """Records an observation. Returns its TaskRecord (None for pipeline-level events)."""
+        now = time.time()
+        name = observation.pipeline_name
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is None:
+                session = self._sessions[name] = PipelineSession(name, now)
+                if len(self._sessions) > self.max_pipelines:
+                    self._removed.add(self._sessions.popitem(last=False)[0])
+                    self.evicted += 1
+            else:
+                self._sessions.move_to_end(name)
+            self._changed.add(name)
+            return session.apply(observation, now)
+
+    def get(self, pipeline_name):
+        return self._sessions.get(pipeline_name)
+
+    def evict_expired(self, now=None):
+        """Drops finished and idle sessions. Returns the number evicted."""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [
+                name for name, session in self._sessions.items()
+                if (session.finished_at is not None and now - session.finished_at >= self.finished_retention_s)
+                or now - session.last_seen >= self.idle_timeout_s
+            ]
+            for name in expired:
+                del self._sessions[name]
+            self._removed.update(expired)
+            self.evicted += len(expired)
+        return len(expired)
+
+    def to_dict(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        serialized = []
+        for session in sessions:
+            # One session at a time, and its task rows outside the lock, so a large snapshot
+            # never holds up observe() for long.
+            with self._lock:
+                data, records = session.capture()
+            data["tasks"] = [_task_row(record) for record in records]
+            serialized.append(data)
+        return {"version": 2, "taken_at": time.time(), "sessions": serialized}
+
+    def load_dict(self, data):
+        sessions = [PipelineSession.from_dict(session) for session in data["sessions"]]
+        with self._lock:
+            self._sessions = collections.OrderedDict(
+                (session.pipeline_name, session) for session in sorted(sessions, key=lambda s: s.last_seen))
+
+    def take_changes(self, full=False):
+        """
+        Returns (sessions, removed): the sessions changed since the previous call, as plain data
+        holding only their changed tasks, and the names of the pipelines dropped since then.
+        With full, every session is returned whole (and the change tracking starts over).
+        """
+        with self._lock:
+            names = list(self._sessions) if full else list(self._changed)
+            removed = list(self._removed)
+            self._changed.clear()
+            self._removed.clear()
+        sessions = []
+        for name in names:
+            with self._lock:
+                session = self._sessions.get(name)
+                if session is None:
+                    continue
+                data, records = session.capture(changed_only=not full)
+                if full:
+                    session.changed_tasks.clear()
+            # The rows are read outside the lock. A record observe() updates meanwhile may be
+            # read halfway through, but apply() marks it changed again, so the next call
+            # returns it whole.
+            data["tasks"] = [_task_row(record) for record in records]
+            sessions.append(data)
+        return sessions, removed
+
+    def apply_changes(self, sessions, removed):
+        """Replays take_changes() output: drops `removed`, then merges `sessions` in."""
+        with self._lock:
+            for name in removed:
+                self._sessions.pop(name, None)
+            for data in sessions:
+                session = self._sessions.get(data["pipeline_name"])
+                if session is None:
+                    self._sessions[data["pipeline_name"]] = PipelineSession.from_dict(data)
+                else:
+                    session.merge_dict(data)
+                    self._sessions.move_to_end(data["pipeline_name"])
+
+    def snapshot(self, path=None):
+        """Writes the store to `path` (default: snapshot_path) atomically."""
+        path = path or self.snapshot_path
+        data = self.to_dict()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.snapshots_written += 1
+
+    def restore(self, path=None):
+        with open(path or self.snapshot_path) as f:
+            self.load_dict(json.load(f))
+
+    def start_snapshots(self):
+        """Starts a thread that evicts expired sessions and, if snapshot_path is set, writes snapshots."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._maintain, name="session-store", daemon=True)
+        self._thread.start()
+
+    def _maintain(self):
+        while not self._stop.wait(self.snapshot_interval_s):
+            self.evict_expired()
+            if self.snapshot_path:
+                self.snapshot()
+
+    def stop(self):
+        """Stops the maintenance thread and writes a final snapshot."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if self.snapshot_path:
+            self.snapshot()
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "pipelines": len(sessions),
+            "tasks": sum(len(session.tasks_by_id) for session in sessions),  # Tasks with a task_id_num
+            "evicted": self.evicted,
+            "snapshots_written": self.snapshots_written,
+        }
@@ -0,0 +1,498 @@
+"""
+Shared-memory transport for SendTaskObservationBatch between processes on the same host.
+
+A client creates two single-producer/single-consumer byte rings in shared memory
+(memory-mapped files under /dev/shm), one for requests and one for responses, and hands
+their paths to the server over a Unix domain socket. Once both sides have mapped them the
+files are unlinked, so nothing is left behind even if a process dies. That socket then only carries one-byte doorbells. Serialized batches
+are copied into the rings, so they never pass through the socket stack or gRPC's HTTP/2
+framing. Calls go through the same (instrumented) method handler as the gRPC path.
+
+Server side (AiServer and AiActionStreamer do this when given `shm_path`):
+    shm_server = ShmBatchServer(handler, "/tmp/bioflow-ai.shm.sock")
+    shm_server.start()
+
+Client side:
+    with ShmBatchClient("/tmp/bioflow-ai.shm.sock") as client:
+        actions = client.send_many(observations, batch_size=500)
+
+The rings rely on x86's memory ordering (see ShmRing), which Python has no barrier to
+enforce elsewhere, so shared memory is only used where SHM_SUPPORTED. Elsewhere the server
+does not start it, and connect_batch_client() returns a client sending the same batches over
+gRPC, e.g. to the server's Unix domain socket:
+    with connect_batch_client("/tmp/bioflow-ai.shm.sock", "unix:/tmp/bioflow-ai.sock") as client:
+        actions = client.send_many(observations, batch_size=500)
+"""
+import asyncio
+import json
+import mmap
+import os
+import platform
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+
+from bioworkflowml.utilities.nf_client import channel_target
+
+SEND_TASK_OBSERVATION_BATCH_METHOD = '/nf_ai_comms.AiActionService/SendTaskObservationBatch'
+
+# The producer's head and the consumer's tail sit on separate cache lines.
+HEAD_OFFSET = 0
+TAIL_OFFSET = 64
+DATA_OFFSET = 128
+POSITION = struct.Struct("<Q")
+RECORD_LENGTH = struct.Struct("<I")
+WRAP_MARKER = 0xFFFFFFFF
+
+# First byte of every record.
+RECORD_OK = b"\x00"
+RECORD_ERROR = b"\x01"
+
+DOORBELL = b"\x01"
+
+# x86 does not reorder stores with other stores, nor loads with later stores: the only
+# ordering the rings need (see ShmRing).
+SHM_SUPPORTED = platform.machine().lower() in ("x86_64", "amd64", "i386", "i686", "x86")
+# Rings are created here, and the server maps nothing else.
+RING_DIRECTORY = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+RING_PREFIX = "bioflow-ring-"
+
+
+def ring_path_allowed(path):
+    """Whether `path` names a ring file a client may hand to the server: directly inside RING_DIRECTORY."""
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.realpath(directory) == os.path.realpath(RING_DIRECTORY) and name.startswith(RING_PREFIX)
+
+
+class ShmCallError(grpc.RpcError):
+    """A batch call over shared memory failed, on the server or while waiting for it."""
+    def __init__(self, code, details):
+        super().__init__(f"{code.name}: {details}")
+        self._code = code
+        self._details = details
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._details
+
+
+class ShmRing:
+    """
+    A single-producer/single-consumer ring of length-prefixed records.
+
+    Head and tail are byte counters that only ever grow. A record never straddles the end
+    of the buffer: the producer skips to the start, leaving a wrap marker when there is
+    room for one. The producer publishes a record by storing the new head after the
+    payload is written, and the consumer frees space the same way with the tail. This is
+    only correct where an aligned 8-byte store is not torn, stores are not reordered with
+    other stores, and loads are not reordered with later stores: on x86 (SHM_SUPPORTED).
+    Python cannot issue the barriers weaker memory models (ARM, POWER) would need. The
+    doorbell sent after each record does order it for the reader, since the socket's send
+    and receive synchronize, but the producer also reads the tail without one.
+    """
+    def __init__(self, path=None, size=8 * 1024 * 1024, create=False):
+        if create:
+            fd, path = tempfile.mkstemp(prefix=RING_PREFIX, dir=RING_DIRECTORY)
+            os.ftruncate(fd, DATA_OFFSET + size)  # Zero-filled, so head and tail start at 0
+        else:
+            # O_NOFOLLOW: a symlink planted in the ring directory must not redirect the mapping.
+            fd = os.open(path, os.O_RDWR | os.O_NOFOLLOW)
+        try:
+            self._mmap = mmap.mmap(fd, 0)
+        finally:
+            os.close(fd)
+        self.path = path
+        self._buf = memoryview(self._mmap)
+        self.capacity = len(self._mmap) - DATA_OFFSET
+
+    def _load(self, offset):
+        return POSITION.unpack_from(self._buf, offset)[0]
+
+    def max_record_size(self):
+        # Half the capacity: a record that size always fits in an empty ring, wherever the
+        # head happens to be, so a lone call can never wait for space forever.
+        return self.capacity // 2 - RECORD_LENGTH.size
+
+    def try_write(self, *parts):
+        """Appends one record made of `parts`. Returns False if the ring is too full right now."""
+        length = sum(len(part) for part in parts)
+        if length > self.max_record_size():
+            raise ValueError(f"Record of {length} bytes exceeds the {self.max_record_size()} byte limit of this ring")
+        head = self._load(HEAD_OFFSET)
+        tail = self._load(TAIL_OFFSET)
+        offset = head % self.capacity
+        needed = RECORD_LENGTH.size + length
+        padding = self.capacity - offset if offset + needed > self.capacity else 0
+        if padding + needed > self.capacity - (head - tail):
+            return False
+        if padding:
+            if padding >= RECORD_LENGTH.size:
+                RECORD_LENGTH.pack_into(self._buf, DATA_OFFSET + offset, WRAP_MARKER)
+            offset = 0
+        position = DATA_OFFSET + offset
+        RECORD_LENGTH.pack_into(self._buf, position, length)
+        position += RECORD_LENGTH.size
+        for part in parts:
+            self._buf[position:position + len(part)] = part
+            position += len(part)
+        POSITION.pack_into(self._buf, HEAD_OFFSET, head + padding + needed)
+        return True
+
+    def try_read(self):
+        """Removes and returns the oldest record as bytes, or None if the ring is empty."""
+        tail = self._load(TAIL_OFFSET)
+        head = self._load(HEAD_OFFSET)
+        if tail == head:
+            return None
+        offset = tail % self.capacity
+        remaining = self.capacity - offset
+        if remaining < RECORD_LENGTH.size or RECORD_LENGTH.unpack_from(self._buf, DATA_OFFSET + offset)[0] == WRAP_MARKER:
+            tail += remaining
+            offset = 0
+        position = DATA_OFFSET + offset
+        length = RECORD_LENGTH.unpack_from(self._buf, position)[0]
+        position += RECORD_LENGTH.size
+        record = bytes(self._buf[position:position + length])
+        POSITION.pack_into(self._buf, TAIL_OFFSET, tail + (position - DATA_OFFSET - offset) + length)
+        return record
+
+    def unlink(self):
+        """Removes the file; existing mappings stay valid."""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def close(self):
+        self._buf.release()
+        self._mmap.close()
+
+
+def _recv_exact(sock, count):
+    data = b""
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            raise ConnectionError("Shared-memory peer closed the control socket")
+        data += chunk
+    return data
+
+
+def _write_blocking(ring, *parts, poll_s=0.0001):
+    # Only reached when the peer has fallen a full ring behind, so a short sleep-poll is fine.
+    while not ring.try_write(*parts):
+        time.sleep(poll_s)
+
+
+class _ShmContext:
+    """The subset of grpc.ServicerContext the servicers and handler wrappers use."""
+    def invocation_metadata(self):
+        return ()
+
+    def set_trailing_metadata(self, metadata):
+        pass
+
+    def set_compression(self, compression):
+        pass  # Shared memory is not compressed
+
+    def time_remaining(self):
+        return None
+
+    def peer(self):
+        return "shm"
+
+    def abort(self, code, details):
+        raise ShmCallError(code, details)
+
+
+def batch_method_handler(servicer):
+    """
+    Returns (full method name, handler) for servicer.SendTaskObservationBatch, as gRPC would register it.
+
+    Passing both to ServerMetrics.wrap_handler() yields the instrumented handler that the
+    gRPC path already uses.
+    """
+    return SEND_TASK_OBSERVATION_BATCH_METHOD, grpc.unary_unary_rpc_method_handler(
+        servicer.SendTaskObservationBatch,
+        request_deserializer=nf_ai_comms_pb2.TaskObservationBatch.FromString,
+        response_serializer=nf_ai_comms_pb2.ActionBatch.SerializeToString,
+    )
+
+
+class ShmBatchServer:
+    """
+    Accepts shared-memory clients on a Unix domain socket and serves their batches with `handler`.
+
+    Args:
+        handler (grpc.RpcMethodHandler): The unary-unary handler for SendTaskObservationBatch,
+                                         typically the one ServerMetrics.wrap_handler() returned.
+        control_path (str): Filesystem path of the control socket.
+        loop (asyncio.AbstractEventLoop): Required if the handler is a coroutine function;
+                                          calls are run on this loop.
+    """
+    def __init__(self, handler, control_path, loop=None):
+        self.handler = handler
+        self.control_path = control_path
+        self.loop = loop
+        self._is_async = asyncio.iscoroutinefunction(handler.unary_unary)
+        if self._is_async and loop is None:
+            raise ValueError("An event loop is required for a coroutine handler")
+        self._listener = None
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not SHM_SUPPORTED:
+            raise OSError(f"Shared-memory rings are not supported on {platform.machine()}; serve batches over gRPC")
+        if os.path.exists(self.control_path):
+            os.unlink(self.control_path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.control_path)
+        os.chmod(self.control_path, 0o600)
+        self._listener.listen()
+        threading.Thread(target=self._accept_loop, name="shm-accept", daemon=True).start()
+
+    def stop(self):
+        if self._listener is None:
+            return
+        self._listener.close()
+        self._listener = None
+        with self._lock:
+            for connection in self._connections:
+                connection.shutdown(socket.SHUT_RDWR)
+        if os.path.exists(self.control_path):
+            os.unlink(self.control_path)
+
+    def _accept_loop(self):
+        while True:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:
+                return  # Listener closed by stop()
+            with self._lock:
+                self._connections.add(connection)
+            threading.Thread(target=self._serve_connection, args=(connection,), name="shm-connection", daemon=True).start()
+
+    def _call(self, payload):
+        handler = self.handler
+        request = handler.request_deserializer(payload) if handler.request_deserializer else payload
+        if self._is_async:
+            response = asyncio.run_coroutine_threadsafe(handler.unary_unary(request, _ShmContext()), self.loop).result()
+        else:
+            response = handler.unary_unary(request, _ShmContext())
+        return handler.response_serializer(response) if handler.response_serializer else response
+
+    def _serve_connection(self, connection):
+        requests = responses = None
+        try:
+            with connection.makefile("rb") as handshake:
+                rings = json.loads(handshake.readline())
+            if not all(ring_path_allowed(rings[name]) for name in ("request_ring", "response_ring")):
+                # Only the rings clients create; never an arbitrary file the server can write to.
+                connection.sendall(b"no\n")
+                return
+            requests = ShmRing(rings["request_ring"])
+            responses = ShmRing(rings["response_ring"])
+            connection.sendall(b"ok\n")
+            while True:
+                _recv_exact(connection, 1)
+                payload = requests.try_read()
+                try:
+                    record = (RECORD_OK, self._call(payload))
+                except ShmCallError as e:
+                    record = (RECORD_ERROR, f"{e.code().name}:{e.details()}".encode())
+                except Exception as e:
+                    record = (RECORD_ERROR, f"INTERNAL:{type(e).__name__}: {e}".encode())
+                if sum(len(part) for part in record) > responses.max_record_size():
+                    record = (RECORD_ERROR, b"RESOURCE_EXHAUSTED:Response does not fit in the response ring")
+                _write_blocking(responses, *record)
+                connection.sendall(DOORBELL)
+        except (ConnectionError, OSError, ValueError, KeyError):
+            pass  # Client disconnected or sent a bad handshake
+        finally:
+            with self._lock:
+                self._connections.discard(connection)
+            connection.close()
+            for ring in (requests, responses):
+                if ring is not None:
+                    ring.close()
+
+
+class ShmBatchClient:
+    """
+    Sends TaskObservationBatches to a co-located server through shared memory.
+
+    Not thread-safe: use one client per thread. A wait on the server that times out or fails
+    closes the client, since a reply arriving late would be taken for the next call's: calls
+    then raise ShmCallError(UNAVAILABLE), and a new client is needed.
+    """
+    def __init__(self, control_path, ring_bytes=8 * 1024 * 1024, timeout=None):
+        """
+        Args:
+            control_path (str): The server's shared-memory control socket.
+            ring_bytes (int): Size of each of the two rings. A serialized batch may use up to half of it.
+            timeout (float): Optional timeout in seconds for each wait on the server.
+
+        Raises:
+            OSError: Where shared memory is not SHM_SUPPORTED (see connect_batch_client()).
+        """
+        if not SHM_SUPPORTED:
+            raise OSError(f"Shared-memory rings are not supported on {platform.machine()}")
+        self._requests = ShmRing(size=ring_bytes, create=True)
+        self._responses = ShmRing(size=ring_bytes, create=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.connect(control_path)
+            handshake = {"request_ring": self._requests.path, "response_ring": self._responses.path}
+            self._socket.sendall(json.dumps(handshake).encode() + b"\n")
+            if _recv_exact(self._socket, 3) != b"ok\n":
+                raise ConnectionError("Shared-memory handshake failed")
+        except BaseException:
+            self.close()
+            raise
+        finally:
+            # Both sides have mapped the rings (or never will): the files are no longer needed.
+            for ring in (self._requests, self._responses):
+                ring.unlink()
+        self._outstanding = 0
+        self._closed = False
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._socket.close()
+        for ring in (self._requests, self._responses):
+            ring.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _try_submit(self, batch):
+        if self._closed:
+            raise ShmCallError(grpc.StatusCode.UNAVAILABLE, "Shared-memory client is closed")
+        if not self._requests.try_write(batch.SerializeToString()):
+            return False
+        try:
+            self._socket.sendall(DOORBELL)
+        except OSError as e:
+            self.close()
+            raise ShmCallError(grpc.StatusCode.UNAVAILABLE, f"Shared-memory server unreachable: {e}") from e
+        self._outstanding += 1
+        return True
+
+    def _receive(self):
+        try:
+            _recv_exact(self._socket, 1)
+        except OSError as e:
+            # The reply may still come, and would be read as the next call's: the client is done.
+            self.close()
+            if isinstance(e, TimeoutError):
+                raise ShmCallError(grpc.StatusCode.DEADLINE_EXCEEDED, "Shared-memory server did not reply in time") from e
+            raise ShmCallError(grpc.StatusCode.UNAVAILABLE, f"Shared-memory server unreachable: {e}") from e
+        self._outstanding -= 1
+        record = self._responses.try_read()
+        if record[:1] == RECORD_ERROR:
+            code, _, details = record[1:].decode().partition(":")
+            return ShmCallError(grpc.StatusCode[code], details)
+        return list(nf_ai_comms_pb2.ActionBatch.FromString(record[1:]).actions)
+
+    def send_batch(self, observations):
+        """Sends observations as one batch and returns their Actions in order. Raises ShmCallError."""
+        # Nothing is in flight between calls, so the empty ring always has room.
+        if not self._try_submit(nf_ai_comms_pb2.TaskObservationBatch(observations=observations)):
+            raise ShmCallError(grpc.StatusCode.INTERNAL, "Request ring unexpectedly full between calls")
+        return self._raise_if_error(self._receive())
+
+    def send_many(self, observations, batch_size=500, return_exceptions=False):
+        """
+        Pipelines batches of `batch_size` through the request ring and returns the Actions in input order.
+
+        As many batches are kept in flight as fit in the ring. If return_exceptions is True,
+        a failed batch fills its slots with the ShmCallError instead of raising it.
+        """
+        observations = list(observations)
+        results = []
+        next_start = 0
+        while next_start < len(observations) or self._outstanding:
+            if next_start < len(observations):
+                chunk = observations[next_start:next_start + batch_size]
+                if self._try_submit(nf_ai_comms_pb2.TaskObservationBatch(observations=chunk)):
+                    next_start += len(chunk)
+                    continue
+            result = self._receive()
+            if isinstance(result, ShmCallError):
+                if not return_exceptions:
+                    self._drain()
+                    raise result
+                result = [result] * min(batch_size, len(observations) - len(results))
+            results.extend(result)
+        return results
+
+    def _drain(self):
+        # Keeps the response ring aligned with future calls after an error aborted send_many().
+        while self._outstanding:
+            self._receive()
+
+    @staticmethod
+    def _raise_if_error(result):
+        if isinstance(result, ShmCallError):
+            raise result
+        return result
+
+
+class GrpcBatchClient:
+    """ShmBatchClient's interface over a gRPC channel, for where shared memory is not supported."""
+    def __init__(self, server_address, timeout=None):
+        self._channel = grpc.insecure_channel(channel_target(server_address))
+        self._call = nf_ai_comms_pb2_grpc.AiActionServiceStub(self._channel).SendTaskObservationBatch
+        self._timeout = timeout
+
+    def close(self):
+        self._channel.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def send_batch(self, observations):
+        """Sends observations as one batch and returns their Actions in order. Raises grpc.RpcError."""
+        request = nf_ai_comms_pb2.TaskObservationBatch(observations=observations)
+        return list(self._call(request, timeout=self._timeout).actions)
+
+    def send_many(self, observations, batch_size=500, return_exceptions=False):
+        """Sends batches of `batch_size` one after the other and returns the Actions in input order."""
+        observations = list(observations)
+        results = []
+        for start in range(0, len(observations), batch_size):
+            chunk = observations[start:start + batch_size]
+            try:
+                results.extend(self.send_batch(chunk))
+            except grpc.RpcError as e:
+                if not return_exceptions:
+                    raise
+                results.extend([e] * len(chunk))
+        return results
+
+
+def connect_batch_client(control_path, fallback_address, ring_bytes=8 * 1024 * 1024, timeout=None):
+    """
+    Returns a ShmBatchClient where shared memory is supported, else a GrpcBatchClient for
+    `fallback_address` (the server's Unix domain socket, say).
+    """
+    if SHM_SUPPORTED:
+        return ShmBatchClient(control_path, ring_bytes=ring_bytes, timeout=timeout)
+    return GrpcBatchClient(fallback_address, timeout=timeout)
@@ -0,0 +1,420 @@
+"""
+A durable local spool for observations the AI server could not accept.
+
+Observations are appended to segment files in a spool directory as length-prefixed,
+CRC-checked serialized TaskObservations. Appends are fsynced in groups (every
+`fsync_every` records or `fsync_interval_s`, whichever comes first) so the cost of
+durability is shared across a burst. A SpoolDrainer replays sealed segments through
+SendTaskObservationBatch once the server is reachable again, skipping event_ids it
+has already delivered, and deletes each segment once all of it is acknowledged.
+
+The spool never grows past `max_bytes`: when a new record would exceed it, the oldest
+sealed segments are dropped (and counted) to make room.
+
+Usage:
+    spool = ObservationSpool("/var/spool/bioflow")
+    drainer = SpoolDrainer(spool, server_address="localhost:50052")
+    drainer.start()
+    future = send_task_observation(observation_data, server_address, spool=spool)
+"""
+import collections
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+import grpc
+
+# Import the generated classes
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.wire_format import compression_algorithm, compression_metadata, encode_batch
+
+logger = logging.getLogger(__name__)
+
+# Per record: payload length and CRC32 of the payload, both big-endian uint32.
+RECORD_HEADER = struct.Struct(">II")
+SEGMENT_PATTERN = re.compile(r"^spool-(\d{12})\.seg$")
+
+# Status codes after which the observation is worth keeping for a later replay.
+# Anything else (e.g. INVALID_ARGUMENT) would fail again on replay, and CANCELLED means the
+# caller gave up on the call, not that delivery failed.
+RETRYABLE_STATUS_CODES = frozenset([
+    grpc.StatusCode.UNAVAILABLE,
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+    grpc.StatusCode.ABORTED,
+])
+
+
+def read_records(path, start_offset=0):
+    """
+    Yields (end_offset, payload) for each intact record of a segment file from start_offset.
+
+    Stops at the first torn or corrupt record: everything after it was written after the
+    last successful fsync and cannot be trusted.
+    """
+    with open(path, "rb") as f:
+        f.seek(start_offset)
+        offset = start_offset
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, crc = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset += RECORD_HEADER.size + length
+            yield offset, payload
+
+
+class _Segment:
+    __slots__ = ("seq", "path", "size", "records")
+
+    def __init__(self, seq, path, size=0, records=0):
+        self.seq = seq
+        self.path = path
+        self.size = size
+        self.records = records
+
+
+class ObservationSpool:
+    """
+    Append-only, segment-based on-disk queue of TaskObservations.
+
+    Args:
+        directory (str): Spool directory; created if missing. Segments left by a previous
+                         process are picked up and replayed.
+        max_bytes (int): Upper bound on the total size of all segments.
+        segment_bytes (int): Size after which the active segment is sealed and a new one started.
+        fsync_every (int): Number of appends after which the active segment is fsynced.
+        fsync_interval_s (float): Maximum time an append stays unsynced.
+    """
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, segment_bytes=8 * 1024 * 1024,
+                 fsync_every=64, fsync_interval_s=0.05):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval_s = fsync_interval_s
+        self.appended = 0
+        self.dropped_observations = 0
+        self.dropped_segments = 0
+        self._lock = threading.Lock()
+        self._sealed = collections.deque()
+        self._active = None
+        self._active_file = None
+        self._unsynced = 0
+        self._closed = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+        self._open_new_segment()
+        self._syncer = threading.Thread(target=self._sync_periodically, name="spool-fsync", daemon=True)
+        self._syncer.start()
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"spool-{seq:012d}.seg")
+
+    def _recover(self):
+        for name in sorted(os.listdir(self.directory)):
+            match = SEGMENT_PATTERN.match(name)
+            if not match:
+                continue
+            path = os.path.join(self.directory, name)
+            start = self.acked_offset(path)
+            records = sum(1 for _ in read_records(path, start))
+            if records == 0:
+                self._remove_files(path)
+                continue
+            self._sealed.append(_Segment(int(match.group(1)), path, os.path.getsize(path), records))
+
+    def _open_new_segment(self):
+        seq = (self._sealed[-1].seq + 1) if self._sealed else 0
+        if self._active is not None:
+            seq = max(seq, self._active.seq + 1)
+        self._active = _Segment(seq, self._segment_path(seq))
+        self._active_file = open(self._active.path, "ab")
+
+    def _sync_locked(self):
+        if self._unsynced:
+            self._active_file.flush()
+            os.fsync(self._active_file.fileno())
+            self._unsynced = 0
+
+    def _sync_periodically(self):
+        while True:
+            time.sleep(self.fsync_interval_s)
+            with self._lock:
+                if self._closed:
+                    return
+                self._sync_locked()
+
+    def _seal_locked(self):
+        self._sync_locked()
+        self._active_file.close()
+        self._sealed.append(self._active)
+        self._open_new_segment()
+
+    def _total_bytes_locked(self):
+        return self._active.size + sum(segment.size for segment in self._sealed)
+
+    def append(self, observation):
+        """Appends a TaskObservation. Durable once the next group fsync has happened (see flush())."""
+        payload = observation.SerializeToString()
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Spool is closed")
+            while self._total_bytes_locked() + len(record) > self.max_bytes:
+                if not self._sealed:
+                    if self._active.records == 0:
+                        break  # A single record larger than max_bytes; keep it rather than lose it
+                    self._seal_locked()
+                oldest = self._sealed.popleft()
+                self.dropped_segments += 1
+                self.dropped_observations += oldest.records
+                self._remove_files(oldest.path)
+            self._active_file.write(record)
+            self._active.size += len(record)
+            self._active.records += 1
+            self.appended += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                self._sync_locked()
+            if self._active.size >= self.segment_bytes:
+                self._seal_locked()
+
+    def flush(self):
+        """Forces buffered appends to disk now."""
+        with self._lock:
+            self._sync_locked()
+
+    def seal_active(self):
+        """Seals the active segment if it holds records, so the drainer can pick it up. Returns True if sealed."""
+        with self._lock:
+            if self._active.records == 0:
+                return False
+            self._seal_locked()
+            return True
+
+    def sealed_segments(self):
+        """Paths of sealed segments, oldest first."""
+        with self._lock:
+            return [segment.path for segment in self._sealed]
+
+    def pending_observations(self):
+        with self._lock:
+            return self._active.records + sum(segment.records for segment in self._sealed)
+
+    @staticmethod
+    def _ack_path(segment_path):
+        return segment_path[:-len(".seg")] + ".ack"
+
+    def acked_offset(self, segment_path):
+        """Offset up to which a segment has been delivered (0 if never acknowledged)."""
+        try:
+            with open(self._ack_path(segment_path)) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def acknowledge(self, segment_path, offset, records):
+        """Records that a segment has been delivered up to `offset` (covering `records` more records)."""
+        with self._lock:
+            segment = next((s for s in self._sealed if s.path == segment_path), None)
+            if segment is None:
+                return  # Evicted to respect max_bytes while it was being drained
+            segment.records = max(0, segment.records - records)
+            tmp_path = self._ack_path(segment_path) + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(offset))
+            os.replace(tmp_path, self._ack_path(segment_path))
+
+    def remove_segment(self, segment_path):
+        """Deletes a fully delivered sealed segment."""
+        with self._lock:
+            self._sealed = collections.deque(s for s in self._sealed if s.path != segment_path)
+        self._remove_files(segment_path)
+
+    def _remove_files(self, segment_path):
+        for path in (segment_path, self._ack_path(segment_path)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._sync_locked()
+            self._active_file.close()
+            self._closed = True
+            if self._active.records == 0:
+                self._remove_files(self._active.path)
+
+
+def spool_on_failure(future, request, spool):
+    """
+    Appends `request` to `spool` if the call behind `future` fails with a retryable status.
+
+    The future still fails for its caller; the observation is replayed later by a SpoolDrainer.
+    """
+    def on_done(call):
+        code = call.code()
+        if code in RETRYABLE_STATUS_CODES:
+            spool.append(request)
+    future.add_done_callback(on_done)
+    return future
+
+
+class SpoolDrainer:
+    """
+    Background thread that replays a spool through SendTaskObservationBatch.
+
+    Segments are drained oldest first. Progress is acknowledged per batch, so a restart
+    resumes where the last acknowledged batch ended; event_ids delivered recently are
+    remembered (up to `dedupe_window` of them) and not sent twice. While the server is
+    unreachable, or draining fails otherwise, the drainer backs off exponentially up to
+    `max_backoff_s`. A segment evicted by the spool (max_bytes) before it was drained
+    counts as consumed: its observations are already counted in spool.dropped_observations.
+
+    Args:
+        spool (ObservationSpool): The spool to drain.
+        server_address (str): The address (host:port or unix:/path) of the gRPC server.
+        batch_size (int): Observations per SendTaskObservationBatch call.
+        timeout (float): Deadline of each batch call in seconds.
+        on_action (callable): Optional, called with every Action returned for a replayed observation.
+        compression: Optional. "gzip" or "deflate" (or a grpc.Compression) for the replay channel.
+        dedup_strings (bool): If True, batches are replayed as EncodedObservationBatch (see
+                              utilities/wire_format.py); the server must implement it.
+    """
+    def __init__(self, spool, server_address='localhost:50052', batch_size=500, timeout=10.0,
+                 dedupe_window=100000, on_action=None, idle_interval_s=1.0, max_backoff_s=30.0,
+                 compression=None, dedup_strings=False):
+        self.spool = spool
+        self.server_address = server_address
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.dedupe_window = dedupe_window
+        self.on_action = on_action
+        self.idle_interval_s = idle_interval_s
+        self.max_backoff_s = max_backoff_s
+        self.compression = compression_algorithm(compression)
+        self.dedup_strings = dedup_strings
+        self.replayed = 0
+        self.duplicates_skipped = 0
+        self.vanished_segments = 0
+        self.errors = 0
+        self._delivered = collections.OrderedDict()
+        self._channel = None
+        self._stub = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _ensure_stub(self):
+        if self._stub is None:
+            from bioworkflowml.utilities.nf_client import channel_target  # nf_client imports this module
+            self._channel = grpc.insecure_channel(channel_target(self.server_address), compression=self.compression)
+            self._stub = nf_ai_comms_pb2_grpc.AiActionServiceStub(self._channel)
+        return self._stub
+
+    def _remember(self, event_id):
+        self._delivered[event_id] = None
+        if len(self._delivered) > self.dedupe_window:
+            self._delivered.popitem(last=False)
+
+    def _send(self, batch):
+        stub = self._ensure_stub()
+        if self.dedup_strings:
+            response = stub.SendEncodedObservationBatch(encode_batch(batch.observations), timeout=self.timeout,
+                                                        metadata=compression_metadata(self.compression))
+        else:
+            response = stub.SendTaskObservationBatch(batch, timeout=self.timeout,
+                                                     metadata=compression_metadata(self.compression))
+        for observation in batch.observations:
+            if observation.event_id:
+                self._remember(observation.event_id)
+        self.replayed += len(batch.observations)
+        if self.on_action is not None:
+            for action in response.actions:
+                self.on_action(action)
+
+    def _drain_segment(self, path):
+        batch = nf_ai_comms_pb2.TaskObservationBatch()
+        batch_event_ids = set()
+        batch_records = 0
+        offset = self.spool.acked_offset(path)
+        for offset, payload in read_records(path, offset):
+            observation = nf_ai_comms_pb2.TaskObservation.FromString(payload)
+            batch_records += 1
+            event_id = observation.event_id
+            if event_id and (event_id in self._delivered or event_id in batch_event_ids):
+                self.duplicates_skipped += 1
+            else:
+                batch.observations.append(observation)
+                batch_event_ids.add(event_id)
+            if batch_records >= self.batch_size:
+                if batch.observations:
+                    self._send(batch)
+                self.spool.acknowledge(path, offset, batch_records)
+                batch = nf_ai_comms_pb2.TaskObservationBatch()
+                batch_event_ids = set()
+                batch_records = 0
+        if batch.observations:
+            self._send(batch)
+        if batch_records:
+            self.spool.acknowledge(path, offset, batch_records)
+        self.spool.remove_segment(path)
+
+    def drain_once(self):
+        """
+        Replays every observation currently in the spool.
+
+        Returns:
+            int: The number of observations sent.
+
+        Raises:
+            grpc.RpcError: If a batch call fails; progress up to the last acknowledged batch is kept.
+        """
+        before = self.replayed
+        self.spool.seal_active()
+        for path in self.spool.sealed_segments():
+            try:
+                self._drain_segment(path)
+            except FileNotFoundError:
+                # Evicted by ObservationSpool.append() after sealed_segments() listed it.
+                self.vanished_segments += 1
+                self.spool.remove_segment(path)
+        return self.replayed - before
+
+    def _run(self):
+        backoff_s = self.idle_interval_s
+        while not self._stop.is_set():
+            try:
+                self.drain_once()
+                backoff_s = self.idle_interval_s
+            except grpc.RpcError:
+                backoff_s = min(self.max_backoff_s, backoff_s * 2)
+            except Exception:
+                # E.g. a full or unreadable spool directory: keep the thread alive and retry later.
+                self.errors += 1
+                logger.exception("Draining spool %s failed", self.spool.directory)
+                backoff_s = min(self.max_backoff_s, backoff_s * 2)
+            self._stop.wait(backoff_s)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="spool-drainer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._channel:
+            self._channel.close()
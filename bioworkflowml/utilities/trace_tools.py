@@ -0,0 +1,207 @@
+"""
+Tooling for spans written by utilities.tracing.
+
+    # Per-stage latency breakdown of one or more span files (client and server files can be mixed)
+    python -m bioworkflowml.utilities.trace_tools summarize /tmp/client_spans.jsonl /tmp/server_spans.jsonl
+
+    # A stand-in OTLP/HTTP collector that stores posted spans as JSON lines for `summarize`
+    python -m bioworkflowml.utilities.trace_tools collect --port 4318 --out /tmp/collected_spans.jsonl
+"""
+import argparse
+import json
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STAGES = ("client.channel", "client.serialize", "network", "server.queue", "server.servicer", "server.policy", "response")
+# Stages that only some clients or servicers record.
+OPTIONAL_STAGES = ("client.channel", "server.policy")
+
+
+def _otlp_value(value):
+    for kind in ("stringValue", "boolValue", "doubleValue"):
+        if kind in value:
+            return value[kind]
+    if "intValue" in value:
+        return int(value["intValue"])
+    return None
+
+
+def from_otlp_json(body):
+    """Flattens an OTLP/JSON ExportTraceServiceRequest into the span dicts utilities.tracing writes."""
+    spans = []
+    for resource_spans in body.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                flat = {
+                    "traceId": span["traceId"],
+                    "spanId": span["spanId"],
+                    "name": span["name"],
+                    "startTimeUnixNano": int(span["startTimeUnixNano"]),
+                    "endTimeUnixNano": int(span["endTimeUnixNano"]),
+                    "attributes": {a["key"]: _otlp_value(a["value"]) for a in span.get("attributes", [])},
+                }
+                if span.get("parentSpanId"):
+                    flat["parentSpanId"] = span["parentSpanId"]
+                spans.append(flat)
+    return spans
+
+
+def load_spans(paths):
+    spans = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    spans.append(json.loads(line))
+    return spans
+
+
+def _span_duration_ns(span):
+    if span["name"] == "server.servicer" and "self_time_ns" in span.get("attributes", {}):
+        return span["attributes"]["self_time_ns"]  # Nested stages are reported on their own
+    return span["endTimeUnixNano"] - span["startTimeUnixNano"]
+
+
+def stage_durations(spans):
+    """Returns {trace_id: {stage: total_ns}}. Stages recorded on both sides (response) are summed."""
+    traces = defaultdict(lambda: defaultdict(int))
+    for span in spans:
+        if span["name"] in STAGES:
+            traces[span["traceId"]][span["name"]] += _span_duration_ns(span)
+    return traces
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(spans, tail_quantile=0.99):
+    """
+    Builds the per-stage latency breakdown.
+
+    Returns:
+        dict: {"traces": n, "stages": {stage: {"mean_ms", "p50_ms", "p95_ms", "p99_ms", "share"}},
+               "tail": {stage: mean_ms over the slowest traces}}. Only traces with spans
+               from both client and server (all stages but OPTIONAL_STAGES) are counted.
+    """
+    traces = {
+        trace_id: stages for trace_id, stages in stage_durations(spans).items()
+        if all(stage in stages for stage in STAGES if stage not in OPTIONAL_STAGES)
+    }
+    summary = {"traces": len(traces), "stages": {}, "tail": {}}
+    if not traces:
+        return summary
+
+    grand_total = sum(sum(stages.values()) for stages in traces.values())
+    for stage in STAGES:
+        values = sorted(stages.get(stage, 0) for stages in traces.values())
+        summary["stages"][stage] = {
+            "mean_ms": sum(values) / len(values) / 1e6,
+            "p50_ms": _percentile(values, 0.50) / 1e6,
+            "p95_ms": _percentile(values, 0.95) / 1e6,
+            "p99_ms": _percentile(values, 0.99) / 1e6,
+            "share": sum(values) / grand_total if grand_total else 0.0,
+        }
+
+    # Where did the time go for the slowest traces?
+    by_total = sorted(traces.values(), key=lambda stages: sum(stages.values()))
+    tail = by_total[int(tail_quantile * (len(by_total) - 1)):]
+    for stage in STAGES:
+        summary["tail"][stage] = sum(stages.get(stage, 0) for stages in tail) / len(tail) / 1e6
+    return summary
+
+
+def format_summary(summary):
+    lines = [f"Traces with complete client and server spans: {summary['traces']}"]
+    if not summary["traces"]:
+        return "\n".join(lines)
+    lines.append(f"{'stage':<18}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'share':>8}{'tail ms':>10}")
+    for stage, stats in summary["stages"].items():
+        lines.append(
+            f"{stage:<18}{stats['mean_ms']:>10.3f}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}"
+            f"{stats['p99_ms']:>10.3f}{stats['share']:>8.1%}{summary['tail'][stage]:>10.3f}"
+        )
+    return "\n".join(lines)
+
+
+class CollectorServer:
+    """A minimal OTLP/HTTP (JSON) trace collector that appends received spans to a JSON lines file."""
+    def __init__(self, out_path, port=4318, host="0.0.0.0"):
+        self.out_path = out_path
+        self.host = host
+        self.port = port
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    def start(self):
+        collector = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != "/v1/traces":
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    spans = from_otlp_json(json.loads(self.rfile.read(length)))
+                except (ValueError, KeyError):
+                    self.send_error(400)
+                    return
+                collector.store(spans)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="trace-collector", daemon=True).start()
+        return self.port
+
+    def store(self, spans):
+        with self._lock:
+            with open(self.out_path, "a") as f:
+                for span in spans:
+                    f.write(json.dumps(span, separators=(",", ":")) + "\n")
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summarize_parser = subparsers.add_parser("summarize", help="Per-stage latency breakdown of span files")
+    summarize_parser.add_argument("paths", nargs="+")
+    summarize_parser.add_argument("--tail-quantile", type=float, default=0.99)
+    collect_parser = subparsers.add_parser("collect", help="Run a stand-in OTLP/HTTP collector")
+    collect_parser.add_argument("--port", type=int, default=4318)
+    collect_parser.add_argument("--out", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "summarize":
+        print(format_summary(summarize(load_spans(args.paths), tail_quantile=args.tail_quantile)))
+    else:
+        collector = CollectorServer(args.out, port=args.port)
+        port = collector.start()
+        print(f"Collecting OTLP/JSON spans on http://localhost:{port}/v1/traces into {args.out}. Ctrl+C to stop.")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            collector.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+"""
+Lightweight span tracing of an observation from the Nextflow client to the returned Action.
+
+The client decides whether an observation is sampled and propagates a W3C `traceparent`
+in the gRPC metadata; servers only trace requests that arrive with a sampled context,
+so unsampled traffic pays one metadata lookup on the server and nothing on the client.
+
+Every trace is broken down into these stages (span names):
+
+    client.channel     creating the channel and stub, if the client does that per call (client)
+    client.serialize   building the TaskObservation and serializing it (client)
+    network            round trip minus the time the server reported spending (client, derived)
+    server.queue       waiting for a worker thread / the event loop after the request arrived (server)
+    server.servicer    servicer code, excluding nested stages such as the policy (server)
+    server.policy      policy decision, recorded with `stage("server.policy")` (server)
+    response           response serialization on the server plus deserialization on the client
+
+Spans are written as one JSON object per line (JsonlSpanExporter) or posted as OTLP/JSON
+(OtlpHttpSpanExporter). `python -m bioworkflowml.utilities.trace_tools summarize` turns either into a
+per-stage latency breakdown.
+"""
+import contextvars
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from concurrent import futures
+
+from bioworkflowml.utilities.grpc_instrumentation import wrap_registration
+
+TRACEPARENT_KEY = "traceparent"
+# Trailing metadata the server uses to report how long it held the request (ns).
+SERVER_DURATION_KEY = "x-bioflow-server-duration-ns"
+
+# Wall-clock ns at which the current request became ready to be handled on the server.
+_request_ready_ns = contextvars.ContextVar("bioflow_request_ready_ns", default=None)
+_request_queued_ns = contextvars.ContextVar("bioflow_request_queued_ns", default=None)
+# The server-side trace of the request being handled, if it is sampled.
+_current_trace = contextvars.ContextVar("bioflow_current_trace", default=None)
+# A finished server trace waiting for its response to be serialized.
+_pending_response_trace = contextvars.ContextVar("bioflow_pending_response_trace", default=None)
+
+
+def _new_trace_id():
+    return f"{random.getrandbits(128):032x}"
+
+
+def _new_span_id():
+    return f"{random.getrandbits(64):016x}"
+
+
+def format_traceparent(trace_id, span_id, sampled=True):
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+
+def parse_traceparent(value):
+    """Returns (trace_id, parent_span_id, sampled), or None if the header is malformed."""
+    parts = value.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+class JsonlSpanExporter:
+    """Appends spans to a local file, one JSON object per line, flushing every `batch_size` spans."""
+    def __init__(self, path, batch_size=256):
+        self.path = path
+        self.batch_size = batch_size
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self._buffer.append(span)
+            if len(self._buffer) < self.batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self._write(batch)
+
+    def _write(self, batch):
+        lines = "".join(json.dumps(span, separators=(",", ":")) + "\n" for span in batch)
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(lines)
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        self.flush()
+
+
+def to_otlp_json(spans, service_name):
+    """Wraps flat span dicts in an OTLP/JSON ExportTraceServiceRequest body."""
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    return {"resourceSpans": [{
+        "resource": {"attributes": [attribute("service.name", service_name)]},
+        "scopeSpans": [{
+            "scope": {"name": "bioflowml.tracing"},
+            "spans": [{
+                "traceId": span["traceId"],
+                "spanId": span["spanId"],
+                "parentSpanId": span.get("parentSpanId", ""),
+                "name": span["name"],
+                "kind": 1,
+                "startTimeUnixNano": str(span["startTimeUnixNano"]),
+                "endTimeUnixNano": str(span["endTimeUnixNano"]),
+                "attributes": [attribute(k, v) for k, v in span.get("attributes", {}).items()],
+            } for span in spans],
+        }],
+    }]}
+
+
+class OtlpHttpSpanExporter:
+    """
+    Posts spans as OTLP/JSON to a collector (e.g. http://localhost:4318/v1/traces) from a background thread.
+
+    Export failures are counted and otherwise ignored: tracing must never break serving.
+    """
+    def __init__(self, endpoint, service_name, batch_size=256, flush_interval_s=2.0, timeout_s=5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.timeout_s = timeout_s
+        self.failed_exports = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="otlp-span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        with self._lock:
+            self._buffer.append(span)
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+
+    def _post(self, batch):
+        import urllib.request  # Deferred: slow to import and only needed when exporting over OTLP
+
+        body = json.dumps(to_otlp_json(batch, self.service_name)).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout_s):
+                pass
+        except OSError:
+            self.failed_exports += 1
+
+    def flush(self):
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._post(batch)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval_s)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout=self.timeout_s)
+        self.flush()
+
+
+class _ServerTrace:
+    __slots__ = ("tracer", "trace_id", "parent_span_id", "attributes", "child_ns")
+
+    def __init__(self, tracer, trace_id, parent_span_id, attributes):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.parent_span_id = parent_span_id
+        self.attributes = attributes
+        self.child_ns = 0
+
+    def emit(self, name, start_ns, end_ns, **attributes):
+        self.tracer.emit(name, self.trace_id, self.parent_span_id, start_ns, end_ns, dict(self.attributes, **attributes))
+
+
+class stage:
+    """
+    Context manager that records a nested server stage (e.g. "server.policy") of the current trace.
+
+    A no-op when the request being handled is not traced, so it can stay in servicer code.
+    Its time is subtracted from the enclosing server.servicer span.
+    """
+    __slots__ = ("name", "_trace", "_start_ns")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self._trace = _current_trace.get()
+        if self._trace is not None:
+            self._start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._trace is not None:
+            end_ns = time.time_ns()
+            self._trace.child_ns += end_ns - self._start_ns
+            self._trace.emit(self.name, self._start_ns, end_ns)
+        return False
+
+
+class _QueueTimingExecutor(futures.ThreadPoolExecutor):
+    """A ThreadPoolExecutor that lets the handler know when its work item was queued."""
+    def submit(self, fn, *args, **kwargs):
+        queued_ns = time.time_ns()
+
+        def run():
+            _request_queued_ns.set(queued_ns)
+            return fn(*args, **kwargs)
+        return super().submit(run)
+
+
+class ClientTrace:
+    """The client side of one sampled observation. Created by Tracer.start_client_trace()."""
+    def __init__(self, tracer, attributes=None):
+        self.tracer = tracer
+        self.trace_id = _new_trace_id()
+        self.span_id = _new_span_id()
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.serialize_start_ns = self.start_ns
+
+    def channel_ready(self):
+        """Marks the end of per-call channel setup; the time so far is reported as client.channel."""
+        self.serialize_start_ns = time.time_ns()
+        self._emit("client.channel", self.start_ns, self.serialize_start_ns)
+
+    def _emit(self, name, start_ns, end_ns, **attributes):
+        self.tracer.emit(name, self.trace_id, self.span_id, start_ns, end_ns, dict(self.attributes, **attributes))
+
+    def call_unary_future(self, channel, method, request, response_deserializer, **call_kwargs):
+        """
+        Serializes `request`, sends it with the trace context and returns the call's grpc.Future.
+
+        The request is serialized here, once, so the client.serialize span is exact; the
+        channel then sends the bytes as-is. Remaining spans are emitted when the call completes.
+        """
+        serialized = request.SerializeToString()
+        sent_ns = time.time_ns()
+        self._emit("client.serialize", self.serialize_start_ns, sent_ns, bytes=len(serialized))
+
+        timings = {}
+
+        def deserialize(data):
+            timings["received_ns"] = time.time_ns()
+            response = response_deserializer(data)
+            timings["deserialized_ns"] = time.time_ns()
+            return response
+
+        multicallable = channel.unary_unary(method, request_serializer=None, response_deserializer=deserialize)
+        metadata = tuple(call_kwargs.pop("metadata", None) or ()) + (
+            (TRACEPARENT_KEY, format_traceparent(self.trace_id, self.span_id)),
+        )
+        future = multicallable.future(serialized, metadata=metadata, **call_kwargs)
+
+        def on_done(call):
+            done_ns = time.time_ns()
+            received_ns = timings.get("received_ns", done_ns)
+            server_ns = 0
+            try:
+                for key, value in call.trailing_metadata() or ():
+                    if key == SERVER_DURATION_KEY:
+                        server_ns = int(value)
+            except Exception:
+                pass  # Failed calls may not carry trailing metadata
+            network_ns = max(0, received_ns - sent_ns - server_ns)
+            self._emit("network", sent_ns, sent_ns + network_ns, derived=True)
+            if "deserialized_ns" in timings:
+                self._emit("response", received_ns, timings["deserialized_ns"], side="client")
+            code = call.code()
+            self.tracer.emit("client.rpc", self.trace_id, None, self.start_ns, done_ns,
+                             dict(self.attributes, status=code.name if code else "UNKNOWN"), span_id=self.span_id)
+
+        future.add_done_callback(on_done)
+        return future
+
+
+class Tracer:
+    """
+    Records sampled spans for one process (a client or a server) and hands them to an exporter.
+
+    Args:
+        service_name (str): Added to every span as the `service` attribute.
+        exporter: A JsonlSpanExporter, OtlpHttpSpanExporter or anything with export(span_dict).
+        sample_rate (float): Fraction of client-side observations that are traced. Servers
+                             follow the sampling decision propagated by the client instead.
+    """
+    def __init__(self, service_name, exporter, sample_rate=0.01):
+        self.service_name = service_name
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self._wrapped = {}
+        self._wrapped_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, service_name):
+        """
+        Builds a tracer from BIOFLOW_TRACE_FILE / BIOFLOW_TRACE_OTLP_ENDPOINT and
+        BIOFLOW_TRACE_SAMPLE_RATE, or returns None if neither destination is set.
+        """
+        sample_rate = float(os.environ.get("BIOFLOW_TRACE_SAMPLE_RATE", "0.01"))
+        if os.environ.get("BIOFLOW_TRACE_OTLP_ENDPOINT"):
+            return cls(service_name, OtlpHttpSpanExporter(os.environ["BIOFLOW_TRACE_OTLP_ENDPOINT"], service_name), sample_rate)
+        if os.environ.get("BIOFLOW_TRACE_FILE"):
+            return cls(service_name, JsonlSpanExporter(os.environ["BIOFLOW_TRACE_FILE"]), sample_rate)
+        return None
+
+    def emit(self, name, trace_id, parent_span_id, start_ns, end_ns, attributes=None, span_id=None):
+        span = {
+            "traceId": trace_id,
+            "spanId": span_id or _new_span_id(),
+            "name": name,
+            "startTimeUnixNano": start_ns,
+            "endTimeUnixNano": end_ns,
+            "attributes": dict(attributes or {}, service=self.service_name),
+        }
+        if parent_span_id:
+            span["parentSpanId"] = parent_span_id
+        self.exporter.export(span)
+
+    # Client side
+
+    def start_client_trace(self, attributes=None):
+        """Returns a ClientTrace if this observation is sampled, otherwise None."""
+        if random.random() >= self.sample_rate:
+            return None
+        return ClientTrace(self, attributes)
+
+    # Server side
+
+    def thread_pool(self, max_workers=10):
+        """A drop-in ThreadPoolExecutor for grpc.server() that makes server.queue measurable."""
+        return _QueueTimingExecutor(max_workers=max_workers)
+
+    def instrument(self, add_servicer_function):
+        """Wraps a generated add_*Servicer_to_server function so traced requests emit server spans."""
+        return wrap_registration(add_servicer_function, self.wrap_handler)
+
+    def wrap_handler(self, full_method, handler):
+        with self._wrapped_lock:
+            wrapped = self._wrapped.get(full_method)
+            if wrapped is None:
+                if handler.request_streaming or handler.response_streaming:
+                    wrapped = handler
+                else:
+                    wrapped = self._wrap_unary_handler(full_method, handler)
+                self._wrapped[full_method] = wrapped
+            return wrapped
+
+    def _start_server_trace(self, request, context):
+        for key, value in context.invocation_metadata() or ():
+            if key == TRACEPARENT_KEY:
+                parsed = parse_traceparent(value)
+                if parsed is None or not parsed[2]:
+                    return None
+                attributes = {"event_id": getattr(request, "event_id", "")}
+                return _ServerTrace(self, parsed[0], parsed[1], attributes)
+        return None
+
+    def _finish_server_trace(self, trace, context, ready_ns, start_ns, end_ns, succeeded):
+        trace.emit("server.queue", ready_ns, start_ns)
+        trace.emit("server.servicer", start_ns, end_ns, self_time_ns=end_ns - start_ns - trace.child_ns)
+        if succeeded:
+            context.set_trailing_metadata(((SERVER_DURATION_KEY, str(end_ns - ready_ns)),))
+            # Only a successful handler's response gets serialized; that picks the trace up.
+            _pending_response_trace.set(trace)
+
+    def _wrap_unary_handler(self, full_method, handler):
+        behavior = handler.unary_unary
+        start_server_trace = self._start_server_trace
+        finish_server_trace = self._finish_server_trace
+
+        def ready_time(start_ns):
+            # Sync servers: when the work item was queued. Aio servers: when the request was deserialized.
+            return _request_queued_ns.get() or _request_ready_ns.get() or start_ns
+
+        if inspect.iscoroutinefunction(behavior):
+            async def traced(request, context):
+                trace = start_server_trace(request, context)
+                if trace is None:
+                    return await behavior(request, context)
+                start_ns = time.time_ns()
+                token = _current_trace.set(trace)
+                succeeded = False
+                try:
+                    response = await behavior(request, context)
+                    succeeded = True
+                    return response
+                finally:
+                    _current_trace.reset(token)
+                    finish_server_trace(trace, context, ready_time(start_ns), start_ns, time.time_ns(), succeeded)
+        else:
+            def traced(request, context):
+                trace = start_server_trace(request, context)
+                if trace is None:
+                    return behavior(request, context)
+                start_ns = time.time_ns()
+                token = _current_trace.set(trace)
+                succeeded = False
+                try:
+                    response = behavior(request, context)
+                    succeeded = True
+                    return response
+                finally:
+                    _current_trace.reset(token)
+                    finish_server_trace(trace, context, ready_time(start_ns), start_ns, time.time_ns(), succeeded)
+
+        request_deserializer = handler.request_deserializer
+        response_serializer = handler.response_serializer
+
+        def deserialize(data):
+            response = request_deserializer(data) if request_deserializer else data
+            _request_ready_ns.set(time.time_ns())
+            return response
+
+        def serialize(response):
+            trace = _pending_response_trace.get()
+            if trace is None:
+                return response_serializer(response) if response_serializer else response
+            _pending_response_trace.set(None)
+            start_ns = time.time_ns()
+            data = response_serializer(response) if response_serializer else response
+            trace.emit("response", start_ns, time.time_ns(), side="server")
+            return data
+
+        return handler._replace(unary_unary=traced, request_deserializer=deserialize, response_serializer=serialize)
+
+    def close(self):
+        self.exporter.close()
@@ -0,0 +1,156 @@
+"""
+Payload-size options for observations sent to a remote AI server.
+
+Two independent ways to trade client and server CPU for bandwidth:
+
+    Message compression  gRPC compresses each message with gzip or deflate. Every client
+                         and server takes `compression` ("gzip", "deflate", "none" or a
+                         grpc.Compression) as its channel/server default, and the client
+                         send methods take it per call. Servers compress a reply per call,
+                         and only batch replies of at least COMPRESS_MIN_ACTIONS Actions: a
+                         single Action is too small to gain from it. They use the compression
+                         the client sent the batch with (named in COMPRESSION_METADATA_KEY,
+                         since gRPC does not expose it), else their own default.
+    String dedup         A batch is sent as an EncodedObservationBatch: each distinct value
+                         of the repeated string fields (pipeline, process, status, ...) goes
+                         over the wire once and observations refer to it by index. Clients
+                         opt in with `dedup_strings=True`; servers accept both batch forms.
+
+The two combine: deduplicated batches also compress better. See
+`python -m benchmarks.bench_wire_format` for bytes per observation and CPU cost of each mode.
+
+    encoded = encode_batch(observations)                  # Client
+    observations = decode_observations(encoded)           # Server: the same TaskObservations
+"""
+import grpc
+
+# Import the generated classes
+from bioworkflowml.proto import nf_ai_comms_pb2
+
+COMPRESSION_ALGORITHMS = {
+    "none": grpc.Compression.NoCompression,
+    "deflate": grpc.Compression.Deflate,
+    "gzip": grpc.Compression.Gzip,
+}
+
+COMPRESSION_NAMES = {algorithm: name for name, algorithm in COMPRESSION_ALGORITHMS.items()}
+
+# Call metadata in which clients name the compression they send a batch with.
+COMPRESSION_METADATA_KEY = "bioflow-compression"
+# Replies with fewer Actions (about 1 KB) are sent uncompressed.
+COMPRESS_MIN_ACTIONS = 8
+
+# String fields whose values repeat across the observations of a batch. event_id and
+# timestamp_iso are (nearly) unique per observation, so a table entry would only add a reference.
+DEDUP_FIELDS = ("event_type", "pipeline_name", "process_name", "task_hash", "task_name", "native_id",
+                "status", "cpu_percent")
+
+_STRING_FIELDS = frozenset(
+    field.name for field in nf_ai_comms_pb2.TaskObservation.DESCRIPTOR.fields
+    if field.type == field.TYPE_STRING
+)
+
+
+def compression_algorithm(compression):
+    """
+    Maps a compression setting onto a grpc.Compression.
+
+    Args:
+        compression: None (gRPC's default, i.e. uncompressed), a grpc.Compression, or one
+                     of the names in COMPRESSION_ALGORITHMS.
+
+    Raises:
+        ValueError: For an unknown name.
+    """
+    if compression is None or isinstance(compression, grpc.Compression):
+        return compression
+    try:
+        return COMPRESSION_ALGORITHMS[compression.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown compression {compression!r}; "
+                         f"expected one of {', '.join(COMPRESSION_ALGORITHMS)}") from None
+
+
+def compression_metadata(compression):
+    """Call metadata telling the server which compression the client uses for this call (empty for None)."""
+    compression = compression_algorithm(compression)
+    if compression is None:
+        return ()
+    return ((COMPRESSION_METADATA_KEY, COMPRESSION_NAMES[compression]),)
+
+
+def set_response_compression(context, actions, default=None, min_actions=COMPRESS_MIN_ACTIONS):
+    """
+    Compresses the reply of this call if it holds at least `min_actions` Actions: with the
+    compression the client named in its call metadata, else with `default`.
+    """
+    if actions < min_actions:
+        return
+    compression = default
+    for key, value in context.invocation_metadata():
+        if key == COMPRESSION_METADATA_KEY:
+            compression = COMPRESSION_ALGORITHMS.get(value, default)
+    if compression is not None:
+        context.set_compression(compression)
+
+
+def encode_batch(observations, fields=DEDUP_FIELDS):
+    """
+    Builds an EncodedObservationBatch from TaskObservations, deduplicating the string `fields`.
+
+    The observations themselves are left untouched.
+    """
+    encoded = nf_ai_comms_pb2.EncodedObservationBatch(string_fields=fields)
+    strings = [""]
+    index = {"": 0}
+    refs = []
+    add = encoded.observations.add
+    for observation in observations:
+        compact = add()
+        compact.CopyFrom(observation)
+        for field in fields:
+            value = getattr(observation, field)
+            if value:
+                ref = index.get(value)
+                if ref is None:
+                    ref = index[value] = len(strings)
+                    strings.append(value)
+                setattr(compact, field, "")
+                refs.append(ref)
+            else:
+                refs.append(0)
+    encoded.strings.extend(strings)
+    encoded.string_refs.extend(refs)
+    return encoded
+
+
+def decode_observations(encoded):
+    """
+    Restores the deduplicated fields of an EncodedObservationBatch, in place.
+
+    Returns:
+        The batch's repeated TaskObservation field, now holding complete observations.
+
+    Raises:
+        ValueError: If the batch names unknown fields or its references don't match.
+    """
+    fields = list(encoded.string_fields)
+    unknown = set(fields) - _STRING_FIELDS
+    if unknown:
+        raise ValueError(f"Not TaskObservation string fields: {', '.join(sorted(unknown))}")
+    observations = encoded.observations
+    refs = list(encoded.string_refs)
+    if len(refs) != len(fields) * len(observations):
+        raise ValueError(f"Expected {len(fields) * len(observations)} string references, got {len(refs)}")
+    strings = list(encoded.strings)
+    if refs and max(refs) >= len(strings):
+        raise ValueError(f"String reference {max(refs)} out of range for {len(strings)} strings")
+
+    position = 0
+    for observation in observations:
+        for field in fields:
+            ref = refs[position]
+            if ref:
+                setattr(observation, field, strings[ref])
+            position += 1
+    return observations
@@ -0,0 +1,192 @@
+"""
+Discrete-event simulation of a workflow's tasks on a cluster of fixed capacity.
+
+A Workflow is a DAG of SimTasks, each with a process_name, a duration and the CPUs and memory
+it holds while running. A task becomes ready once all its upstream tasks have completed.
+Whenever capacity frees up, a dispatcher decides which ready tasks start. simulate() returns
+the makespan, so dispatchers can be compared on the same workflow.
+
+Dispatchers implement ready(task, now), started(task, now), completed(task, now) and
+pick(free_cpus, free_memory_bytes), which returns the ready tasks to start now. FifoDispatcher
+is what Nextflow does: ready tasks in the order they became ready, skipping those that do
+not fit.
+
+    workflow = rnaseq_like(samples=48, rng=random.Random(1))
+    result = simulate(workflow, cpus=64, memory_bytes=256 * GB, dispatcher=FifoDispatcher())
+    result.makespan_ms
+"""
+import collections
+import heapq
+import random
+
+GB = 1024 ** 3
+MINUTE_MS = 60_000
+
+
+class SimTask:
+    __slots__ = ("task_id", "process_name", "duration_ms", "cpus", "memory_bytes", "upstream", "downstream",
+                 "waiting_on")
+
+    def __init__(self, task_id, process_name, duration_ms, cpus, memory_bytes, upstream):
+        self.task_id = task_id
+        self.process_name = process_name
+        self.duration_ms = duration_ms
+        self.cpus = cpus
+        self.memory_bytes = memory_bytes
+        self.upstream = list(upstream)
+        self.downstream = []
+        self.waiting_on = len(self.upstream)
+
+
+class Workflow:
+    """The tasks of one pipeline run, and the process graph they imply."""
+
+    def __init__(self, name):
+        self.name = name
+        self.tasks = []  # Task IDs are 1-based positions, like Nextflow's task_id_num
+        self.upstream_processes = collections.defaultdict(set)
+
+    def add(self, process_name, duration_ms, cpus, memory_bytes, upstream=()):
+        task = SimTask(len(self.tasks) + 1, process_name, int(duration_ms), cpus, memory_bytes, upstream)
+        for parent in task.upstream:
+            parent.downstream.append(task)
+            self.upstream_processes[process_name].add(parent.process_name)
+        self.tasks.append(task)
+        return task
+
+    def reset(self):
+        for task in self.tasks:
+            task.waiting_on = len(task.upstream)
+
+
+SimResult = collections.namedtuple("SimResult", ["makespan_ms", "cpu_utilization"])
+
+
+class FifoDispatcher:
+    """Starts ready tasks in the order they became ready, skipping those that do not fit."""
+
+    def __init__(self):
+        self.queue = []
+
+    def ready(self, task, now):
+        self.queue.append(task)
+
+    def started(self, task, now):
+        pass
+
+    def completed(self, task, now):
+        pass
+
+    def pick(self, free_cpus, free_memory_bytes):
+        picked, waiting = [], []
+        for task in self.queue:
+            if task.cpus <= free_cpus and task.memory_bytes <= free_memory_bytes:
+                free_cpus -= task.cpus
+                free_memory_bytes -= task.memory_bytes
+                picked.append(task)
+            else:
+                waiting.append(task)
+        self.queue = waiting
+        return picked
+
+
+def simulate(workflow, cpus, memory_bytes, dispatcher):
+    """Runs the workflow to completion on a cluster of `cpus` and `memory_bytes` and returns a SimResult."""
+    workflow.reset()
+    for task in workflow.tasks:
+        if task.cpus > cpus or task.memory_bytes > memory_bytes:
+            raise ValueError(f"Task {task.task_id} ({task.process_name}) does not fit the cluster")
+    now = 0
+    free_cpus, free_memory = cpus, memory_bytes
+    running = []  # (finish time, task_id, task)
+    busy_cpu_ms = 0
+    done = 0
+    for task in workflow.tasks:
+        if not task.waiting_on:
+            dispatcher.ready(task, now)
+
+    while done < len(workflow.tasks):
+        while True:
+            picked = dispatcher.pick(free_cpus, free_memory)
+            if not picked:
+                break
+            for task in picked:
+                if task.cpus > free_cpus or task.memory_bytes > free_memory:
+                    raise ValueError(f"Dispatcher picked task {task.task_id}, which does not fit")
+                free_cpus -= task.cpus
+                free_memory -= task.memory_bytes
+                busy_cpu_ms += task.cpus * task.duration_ms
+                heapq.heappush(running, (now + task.duration_ms, task.task_id, task))
+                dispatcher.started(task, now)
+        if not running:
+            raise RuntimeError("No task running and none started: the dispatcher is stuck")
+
+        now = running[0][0]
+        while running and running[0][0] == now:
+            _, _, task = heapq.heappop(running)
+            free_cpus += task.cpus
+            free_memory += task.memory_bytes
+            done += 1
+            dispatcher.completed(task, now)
+            for child in task.downstream:
+                child.waiting_on -= 1
+                if not child.waiting_on:
+                    dispatcher.ready(child, now)
+    return SimResult(now, busy_cpu_ms / (cpus * now) if now else 0.0)
+
+
+def _duration(rng, median_minutes, sigma=0.3):
+    return rng.lognormvariate(0, sigma) * median_minutes * MINUTE_MS
+
+
+def rnaseq_like(samples, rng, name="rnaseq"):
+    """
+    An RNA-seq-shaped run. Every sample gets FASTQC and TRIMGALORE, then STAR_ALIGN, SAMTOOLS_SORT
+    and SALMON_QUANT. QUALIMAP runs after the sort. MULTIQC gathers everything at the end.
+    Only the align chain is long; the QC tasks feed nothing but the report.
+    """
+    workflow = Workflow(name)
+    reported = []
+    for _ in range(samples):
+        reported.append(workflow.add("FASTQC", _duration(rng, 4), 2, 4 * GB))
+        trimmed = workflow.add("TRIMGALORE", _duration(rng, 8), 2, 4 * GB)
+        aligned = workflow.add("STAR_ALIGN", _duration(rng, 40), 8, 32 * GB, [trimmed])
+        sorted_ = workflow.add("SAMTOOLS_SORT", _duration(rng, 6), 4, 8 * GB, [aligned])
+        reported.append(workflow.add("QUALIMAP", _duration(rng, 12), 4, 8 * GB, [sorted_]))
+        reported.append(workflow.add("SALMON_QUANT", _duration(rng, 15), 4, 16 * GB, [sorted_]))
+    workflow.add("MULTIQC", _duration(rng, 5), 1, 4 * GB, reported)
+    return workflow
+
+
+def random_layered(processes, samples, rng, layers=4, shape_seed=0, name="layered"):
+    """
+    A random DAG of `processes` in `layers`. Each process is scattered (a task per sample) or,
+    one time in five, gathered (a single task over all tasks of its inputs). Each process reads
+    from one or two processes of earlier layers, and has its own median duration and CPUs.
+    The shape comes from `shape_seed` and task durations from `rng`, so runs of the same
+    workflow can differ in durations only.
+    """
+    workflow = Workflow(name)
+    shape = random.Random(shape_seed)
+    by_layer = [[] for _ in range(layers)]
+    for index in range(processes):
+        by_layer[min(layers - 1, index * layers // processes)].append(f"P{index}")
+    tasks_of = {}
+    for layer, names in enumerate(by_layer):
+        for process_name in names:
+            inputs = shape.sample([p for earlier in by_layer[:layer] for p in earlier],
+                                  min(shape.randint(1, 2), sum(map(len, by_layer[:layer]))))
+            median = shape.choice([2, 5, 10, 30, 60])
+            cpus = shape.choice([1, 2, 4, 8])
+            gathered = layer > 0 and shape.random() < 0.2
+            if gathered:
+                upstream = [task for p in inputs for task in tasks_of[p]]
+                tasks_of[process_name] = [workflow.add(process_name, _duration(rng, median), cpus, cpus * 2 * GB,
+                                                       upstream)]
+            else:
+                tasks_of[process_name] = [
+                    workflow.add(process_name, _duration(rng, median), cpus, cpus * 2 * GB,
+                                 [tasks_of[p][sample % len(tasks_of[p])] for p in inputs])
+                    for sample in range(samples)
+                ]
+    return workflow
@@ -2,21 +2,9 @@ import grpc
 import asyncio
 import uuid # For event_id
 
-# Assuming your generated proto files are in a 'proto' subdirectory
-# relative to where you run this client, or BioWorkFlowML is in PYTHONPATH.
-try:
-    from proto import nf_ai_comms_pb2
-    from proto import nf_ai_comms_pb2_grpc
-except ImportError:
-    # Fallback if running directly and proto is a sibling or needs path adjustment
-    import sys
-    import os
-    # Adjust this path if your 'proto' directory is located elsewhere relative to this script
-    sys.path.append(os.path.join(os.path.dirname(__file__), '.')) # Current dir for proto
-    # Or if proto is in parent and this script is in a subdir:
-    # sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-    from proto import nf_ai_comms_pb2
-    from proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.proto import nf_ai_comms_pb2
+
+from bioworkflowml.utilities.aio_client import AsyncAiClient
 
 
 async def run_client(server_address="localhost:50051"):
@@ -26,10 +14,9 @@ async def run_client(server_address="localhost:50051"):
     """
     print(f"Attempting to connect to server at {server_address}...")
     try:
-        # Use grpc.aio.insecure_channel for an asyncio client
-        async with grpc.aio.insecure_channel(server_address) as channel:
+        # AsyncAiClient shares its channel(s) across calls; see utilities/aio_client.py
+        async with AsyncAiClient(server_address, max_concurrency=1) as client:
             print("Successfully connected to server.")
-            stub = nf_ai_comms_pb2_grpc.AiActionServiceStub(channel)
 
             # Create a sample TaskObservation message
             event_id = f"obs_client_test_{uuid.uuid4()}"
@@ -53,7 +40,7 @@ async def run_client(server_address="localhost:50051"):
 
             try:
                 # Call the SendTaskObservation RPC
-                response_action = await stub.SendTaskObservation(sample_observation)
+                response_action = await client.send(sample_observation)
 
                 print("\nReceived Action from server:")
                 print(f"  Observation Event ID: {response_action.observation_event_id}")
@@ -0,0 +1,118 @@
+import asyncio
+import unittest
+from concurrent import futures
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.aio_client import AsyncAiClient
+
+
+class TestAsyncAiClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server(AiActionServiceServicer(lambda message: None), cls.server)
+        cls.port = cls.server.add_insecure_port("localhost:0")
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop(0)
+
+    def run_with_client(self, scenario, **client_kwargs):
+        async def run():
+            async with AsyncAiClient(f"localhost:{self.port}", **client_kwargs) as client:
+                return await scenario(client)
+        return asyncio.run(run())
+
+    def test_send_accepts_dicts_and_messages(self):
+        async def scenario(client):
+            return [
+                await client.send({"event_id": "from_dict", "task_id_num": "7"}),
+                await client.send(nf_ai_comms_pb2.TaskObservation(event_id="from_message")),
+            ]
+        actions = self.run_with_client(scenario)
+        self.assertEqual([a.observation_event_id for a in actions], ["from_dict", "from_message"])
+
+    def test_send_many_preserves_order_with_and_without_batching(self):
+        observations = [{"event_id": f"e{i}"} for i in range(250)]
+        expected = [o["event_id"] for o in observations]
+
+        async def scenario(client):
+            return await client.send_many(observations), await client.send_many(observations, batch_size=64)
+
+        unary, batched = self.run_with_client(scenario, max_concurrency=16, num_channels=2)
+        self.assertEqual([a.observation_event_id for a in unary], expected)
+        self.assertEqual([a.observation_event_id for a in batched], expected)
+
+    def test_stream_consumes_async_iterables_and_yields_every_result(self):
+        async def source():
+            for i in range(40):
+                yield {"event_id": f"s{i}"}
+
+        async def scenario(client):
+            return {request.event_id: result async for request, result in client.stream(source())}
+
+        results = self.run_with_client(scenario, max_concurrency=8)
+        self.assertEqual(len(results), 40)
+        self.assertTrue(all(results[key].observation_event_id == key for key in results))
+
+    def test_stream_reports_failures_in_place(self):
+        async def scenario(client):
+            return [result async for _, result in client.stream([{"event_id": "x"}])]
+
+        async def run():
+            # Nothing listens on port 1, so the call fails quickly with UNAVAILABLE.
+            async with AsyncAiClient("localhost:1", timeout=5) as client:
+                return await scenario(client)
+
+        [result] = asyncio.run(run())
+        self.assertIsInstance(result, grpc.aio.AioRpcError)
+
+    def test_send_connects_lazily_and_close_resets(self):
+        async def run():
+            client = AsyncAiClient(f"localhost:{self.port}")
+            first = await client.send({"event_id": "lazy"})
+            await client.close()
+            self.assertIsNone(client._next_calls)
+            second = await client.send_batch([{"event_id": "after_close"}])  # Reconnects
+            await client.close()
+            return first, second
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first.observation_event_id, "lazy")
+        self.assertEqual(second[0].observation_event_id, "after_close")
+
+    def test_stream_reports_cancelled_calls_in_place(self):
+        async def scenario(client):
+            started = asyncio.Event()
+            original_send = client.send
+
+            async def send(request):
+                if request.event_id == "cancelled":
+                    started.set()
+                    await asyncio.sleep(3600)
+                return await original_send(request)
+
+            client.send = send
+            stream = client.stream([{"event_id": "cancelled"}])
+            consumer = asyncio.ensure_future(stream.__anext__())
+            await started.wait()
+            for task in asyncio.all_tasks():
+                if task is not asyncio.current_task() and task is not consumer:
+                    task.cancel()
+            result = await consumer
+            await stream.aclose()
+            return result
+
+        request, result = self.run_with_client(scenario)
+        self.assertEqual(request.event_id, "cancelled")
+        self.assertIsInstance(result, asyncio.CancelledError)
+
+
+if __name__ == '__main__':
+    unittest.main()
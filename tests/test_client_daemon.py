@@ -0,0 +1,83 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from concurrent import futures
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.client_daemon import ClientDaemon
+from bioworkflowml.utilities.daemon_client import DaemonConnection, DaemonError, send_observation
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestClientDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.socket_path = os.path.join(self.tmp_dir.name, "client.sock")
+
+        self.server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+        nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server(AiActionServiceServicer(lambda message: None), self.server)
+        port = self.server.add_insecure_port("localhost:0")
+        self.server.start()
+        self.addCleanup(self.server.stop, 0)
+
+        self.loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        thread.start()
+        self.daemon = self.run_in_loop(ClientDaemon(self.socket_path, f"localhost:{port}").start())
+
+    def tearDown(self):
+        self.run_in_loop(self.daemon.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def run_in_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout=10)
+
+    def test_observation_round_trip(self):
+        action = send_observation({"event_id": "e1", "event_type": "task_complete"}, self.socket_path)
+        self.assertEqual(action["observation_event_id"], "e1")
+        self.assertTrue(action["success"])
+
+    def test_connection_can_be_reused_and_fire_and_forget(self):
+        with DaemonConnection(self.socket_path) as connection:
+            self.assertEqual(connection.send({"event_id": "a"})["observation_event_id"], "a")
+            self.assertEqual(connection.send({"event_id": "b"}, wait=False), {"queued": True})
+            self.assertEqual(connection.send({"event_id": "c"})["observation_event_id"], "c")
+        self.run_in_loop(self.daemon.close())
+        self.assertEqual(self.daemon.stats["delivered"], 3)
+
+    def test_invalid_observation_is_reported(self):
+        with self.assertRaises(DaemonError) as raised:
+            send_observation({"event_id": 5}, self.socket_path)
+        self.assertEqual(raised.exception.code, "INVALID_ARGUMENT")
+
+    def test_second_daemon_refuses_a_live_socket(self):
+        with self.assertRaises(RuntimeError):
+            self.run_in_loop(ClientDaemon(self.socket_path).start())
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def imported_modules(self, statement, modules):
+        code = f"import sys; {statement}; print(' '.join(m for m in {modules!r} if m in sys.modules))"
+        result = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+        return result.stdout.split()
+
+    def test_servicer_import_does_not_import_ray(self):
+        self.assertEqual(self.imported_modules("import bioworkflowml.ai_action_streamer.ai_action_streamer_server", ["ray"]), [])
+
+    def test_daemon_client_imports_only_the_standard_library(self):
+        self.assertEqual(self.imported_modules("import bioworkflowml.utilities.daemon_client", ["grpc", "google.protobuf"]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
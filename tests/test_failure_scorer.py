@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+
+from bioworkflowml.ai_action_streamer.ai_action_streamer_server import AiActionServicer
+from bioworkflowml.ai_action_streamer.failure_scorer import FailureScorer
+from bioworkflowml.ai_action_streamer.resource_recommender import MIB, ResourceRecommender
+from bioworkflowml.proto import nf_ai_comms_pb2
+
+GIB = 1024 * MIB
+
+
+def progress(task_id_num, realtime_ms, rss_bytes, memory_limit_bytes=4 * GIB, time_limit_ms=0, process_name="ALIGN"):
+    return nf_ai_comms_pb2.TaskObservation(
+        event_type="task_progress", pipeline_name="p1", process_name=process_name, task_id_num=task_id_num,
+        realtime_ms=realtime_ms, rss_bytes=rss_bytes, memory_limit_bytes=memory_limit_bytes,
+        time_limit_ms=time_limit_ms,
+    )
+
+
+class TestFailureScorer(unittest.TestCase):
+
+    def test_growing_memory_is_flagged_once_before_the_limit(self):
+        scorer = FailureScorer(horizon_ms=60_000, min_readings=3)
+        flagged = []
+        for step in range(20):
+            # +200 MiB every 5 s from 1 GiB: reaches the 4 GiB limit after ~77 s
+            termination = scorer.observe(progress(1, step * 5000, GIB + step * 200 * MIB))
+            if termination is not None:
+                flagged.append((step, termination))
+        self.assertEqual(len(flagged), 1)
+        step, termination = flagged[0]
+        self.assertLess(GIB + step * 200 * MIB, 4 * GIB)
+        self.assertEqual(termination.reason, "memory")
+        self.assertGreaterEqual(termination.confidence, 0.5)
+        self.assertGreater(termination.predicted_failure_in_ms, 0)
+        self.assertEqual(termination.resubmit_with.memory_bytes, 6 * GIB)
+
+    def test_flat_memory_is_not_flagged(self):
+        scorer = FailureScorer()
+        for step in range(50):
+            rss = 3 * GIB + (step % 2) * 10 * MIB  # Close to the limit, but not growing
+            self.assertIsNone(scorer.observe(progress(1, step * 5000, rss)))
+
+    def test_walltime_is_predicted_from_the_process_history(self):
+        recommender = ResourceRecommender(min_samples=5)
+        for duration_s in range(90, 130, 2):
+            recommender.observe(nf_ai_comms_pb2.TaskObservation(
+                event_type="task_complete", status="COMPLETED", process_name="ALIGN", realtime_ms=duration_s * 1000))
+        scorer = FailureScorer(recommender)
+
+        too_short = scorer.observe(progress(1, 30_000, GIB, time_limit_ms=60_000))
+        self.assertEqual(too_short.reason, "walltime")
+        self.assertEqual(too_short.confidence, 1.0)
+        self.assertEqual(too_short.predicted_failure_in_ms, 30_000)
+        self.assertGreaterEqual(too_short.resubmit_with.time_ms, recommender.recommend("ALIGN").time_ms)
+        self.assertIsNone(scorer.observe(progress(2, 60_000, GIB, time_limit_ms=200_000)))
+
+    def test_finished_and_stale_tasks_are_forgotten(self):
+        scorer = FailureScorer(stale_after_s=0)
+        scorer.observe(progress(1, 0, GIB))
+        scorer.observe(nf_ai_comms_pb2.TaskObservation(event_type="task_complete", pipeline_name="p1", task_id_num=1))
+        self.assertEqual(len(scorer.tasks), 0)
+        scorer.observe(progress(2, 0, GIB))
+        scorer.observe(progress(3, 0, GIB))  # Task 2 has gone quiet for longer than stale_after_s
+        self.assertEqual(list(scorer.tasks), [("p1", 3)])
+        self.assertEqual(scorer.stats["evicted"], 1)
+
+    def test_servicer_attaches_early_termination(self):
+        servicer = AiActionServicer(failure_scorer=FailureScorer(min_readings=1))
+
+        async def send():
+            return await servicer.SendTaskObservation(progress(1, 1000, 5 * GIB), None)
+
+        action = asyncio.run(send())
+        self.assertTrue(action.HasField("early_termination"))
+        self.assertEqual(action.early_termination.predicted_failure_in_ms, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import sys
+import threading
+import unittest
+from unittest import mock
+
+from bioworkflowml.ai_action_streamer.ai_action_streamer_server import AiActionServicer
+from bioworkflowml.ai_action_streamer.scheduling_advisor import SchedulingAdvisor
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.fast_path import FastPath, FastPathRule
+from bioworkflowml.utilities.metrics import ServerMetrics
+from bioworkflowml.utilities.session_store import SessionStore
+
+
+def observation(event_type, process_name, event_id="e", **fields):
+    return nf_ai_comms_pb2.TaskObservation(event_id=event_id, event_type=event_type, pipeline_name="p1",
+                                           process_name=process_name, **fields)
+
+
+class TestFastPath(unittest.TestCase):
+
+    def test_spec_parsing_and_first_matching_rule(self):
+        fast_path = FastPath.from_spec("task_start/SCATTER_*=sample:0.25, task_start=aggregate")
+        self.assertEqual([(r.event_type, r.process_name, r.mode, r.sample_rate) for r in fast_path.rules],
+                         [("task_start", "SCATTER_*", "sample", 0.25), ("task_start", "*", "aggregate", 0.0)])
+        self.assertIsNone(fast_path.route(observation("task_complete", "ALIGN")))
+        self.assertEqual(fast_path.route(observation("task_start", "ALIGN"))["action_details"], "fast_path:aggregate")
+        with mock.patch("random.random", return_value=0.9):
+            self.assertEqual(fast_path.route(observation("task_start", "SCATTER_1"))["action_details"],
+                             "fast_path:sample")
+        with mock.patch("random.random", return_value=0.1):
+            self.assertIsNone(fast_path.route(observation("task_start", "SCATTER_1")))
+        self.assertEqual(fast_path.stats()["by_route"],
+                         {"task_start/ALIGN": {"aggregated": 1},
+                          "task_start/SCATTER_1": {"sampled_out": 1, "sampled_in": 1}})
+        for spec in ("task_start", "task_start=sample", "task_start=drop", "task_start=sample:2"):
+            with self.assertRaises(ValueError):
+                FastPath.from_spec(spec)
+
+    def test_aggregated_observations_are_summarised_per_window(self):
+        fast_path = FastPath([FastPathRule("task_complete", "SHARD")], window_s=60)
+        with mock.patch("time.time", return_value=1000.0):
+            fast_path.flush()
+            for i, status in enumerate(["COMPLETED", "FAILED", "COMPLETED"]):
+                fast_path.route(observation("task_complete", "SHARD", f"e{i}", status=status,
+                                            realtime_ms=100 * (i + 1), peak_rss_bytes=10 - i))
+        self.assertEqual(fast_path.drain_summaries(), [])  # Window still open
+        with mock.patch("time.time", return_value=1061.0):
+            fast_path.route(observation("task_complete", "SHARD", "e3", realtime_ms=1))
+        summaries = fast_path.drain_summaries()
+        self.assertEqual(len(summaries), 1)
+        summary = summaries[0].to_dict()
+        self.assertEqual({k: summary[k] for k in ("count", "failed", "realtime_ms_total", "realtime_ms_max",
+                                                   "peak_rss_bytes_max", "first_event_id", "last_event_id",
+                                                   "window_start", "window_end")},
+                         {"count": 3, "failed": 1, "realtime_ms_total": 600, "realtime_ms_max": 300,
+                          "peak_rss_bytes_max": 10, "first_event_id": "e0", "last_event_id": "e2",
+                          "window_start": 1000.0, "window_end": 1061.0})
+        fast_path.flush()
+        self.assertEqual([s.count for s in fast_path.drain_summaries()], [1])
+
+    def test_canned_action_ids_are_unique_and_counted_in_metrics(self):
+        metrics = ServerMetrics()
+        fast_path = FastPath.from_spec("task_start=aggregate")
+        metrics.track_fast_path(fast_path)
+        ids = {fast_path.route(observation("task_start", "A"))["action_id"] for _ in range(100)}
+        self.assertEqual(len(ids), 100)
+        self.assertIn('ai_server_fast_path_observations_total{event_type="task_start",process_name="A",'
+                      'outcome="aggregated"} 100', metrics.registry.render_prometheus())
+
+    def test_concurrent_routing_loses_no_observations(self):
+        metrics = ServerMetrics()
+        emitted = []  # The counts as the sink saw them: an observation added after its window closed is lost
+        # Windows close every millisecond, so they close while other threads are adding to them.
+        fast_path = FastPath.from_spec("task_start=aggregate, task_progress=sample:0.5", window_s=0.001,
+                                       sink=lambda summaries: emitted.extend(s.count for s in summaries))
+        metrics.track_fast_path(fast_path)
+        threads, per_thread = 8, 5000
+
+        def route():
+            for i in range(per_thread):
+                fast_path.route(observation("task_start", "A", f"e{i}"))
+                fast_path.route(observation("task_progress", "A", f"e{i}"))
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # Switch threads often enough for a lost update to show
+        try:
+            workers = [threading.Thread(target=route) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        fast_path.flush()
+
+        total = threads * per_thread
+        stats = fast_path.stats()
+        self.assertEqual(stats["aggregated"], total)
+        self.assertEqual(stats["sampled_in"] + stats["sampled_out"], total)
+        self.assertEqual(sum(emitted), total)
+        self.assertIn('outcome="aggregated"} %d' % total, metrics.registry.render_prometheus())
+
+    def test_draining_while_windows_close_loses_no_summaries(self):
+        fast_path = FastPath.from_spec("task_start=aggregate", window_s=0.001)
+        threads, per_thread = 4, 5000
+        drained, done = [], threading.Event()
+
+        def route():
+            for i in range(per_thread):
+                fast_path.route(observation("task_start", "A", f"e{i}"))
+
+        def drain():
+            while not done.is_set():
+                drained.extend(s.count for s in fast_path.drain_summaries())
+                fast_path.stats()
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            drainer = threading.Thread(target=drain)
+            drainer.start()
+            workers = [threading.Thread(target=route) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            done.set()
+            drainer.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        fast_path.flush()
+        drained.extend(s.count for s in fast_path.drain_summaries())
+
+        self.assertEqual(sum(drained), threads * per_thread)
+        stats = fast_path.stats()
+        self.assertEqual((stats["open_summaries"], stats["closed_summaries"], stats["dropped_summaries"]), (0, 0, 0))
+
+    def test_set_rules_keeps_counts(self):
+        fast_path = FastPath.from_spec("task_start=aggregate")
+        fast_path.route(observation("task_start", "A"))
+        fast_path.set_rules([])
+        self.assertIsNone(fast_path.route(observation("task_start", "A")))
+        self.assertEqual(fast_path.stats()["aggregated"], 1)
+
+
+class TestServicerFastPath(unittest.TestCase):
+
+    def test_batch_mixes_canned_and_decided_actions(self):
+        store = SessionStore()
+        servicer = AiActionServiceServicer(lambda message: None, store, FastPath.from_spec("task_start=aggregate"))
+        batch = servicer._process_batch([observation("task_start", "A", "e1", task_id_num=1),
+                                         observation("task_complete", "A", "e2", task_id_num=2)])
+        self.assertEqual([a.observation_event_id for a in batch.actions], ["e1", "e2"])
+        self.assertEqual(batch.actions[0].action_details, "fast_path:aggregate")
+        self.assertTrue(batch.actions[0].success)
+        self.assertNotIn("fast_path", batch.actions[1].action_details)
+        self.assertEqual(store.stats()["tasks"], 2)  # The fast-pathed observation still reached the store
+
+    def test_streamer_skips_the_decision(self):
+        servicer = AiActionServicer(fast_path=FastPath.from_spec("task_start=aggregate"))
+        with mock.patch.object(servicer, "_decide", side_effect=AssertionError("decided")):
+            batch = servicer._process_batch([observation("task_start", "A", "e1")])
+        self.assertEqual(batch.actions[0].policy_version, "")
+        self.assertEqual(batch.actions[0].action_details, "fast_path:aggregate")
+
+    def test_fast_pathed_starts_keep_scheduling_and_session_state(self):
+        store, advisor = SessionStore(), SchedulingAdvisor()
+        servicer = AiActionServicer(session_store=store, scheduling_advisor=advisor,
+                                    fast_path=FastPath.from_spec("task_start=aggregate"))
+        servicer._process_batch([observation("task_submit", "A", f"s{task_id}", task_id_num=task_id)
+                                 for task_id in (1, 2, 3, 4)])
+        batch = servicer._process_batch([observation("task_start", "A", f"b{task_id}", task_id_num=task_id)
+                                         for task_id in (1, 2)])
+        self.assertEqual({a.action_details for a in batch.actions}, {"fast_path:aggregate"})
+        self.assertEqual(advisor.advise("p1"), [3, 4])
+        self.assertEqual(store.get("p1").processes["A"].running, 2)
+        servicer._process_batch([observation("task_complete", "A", "c1", task_id_num=1, realtime_ms=10)])
+        self.assertEqual(store.get("p1").processes["A"].running, 1)
+        self.assertEqual(advisor.advise("p1"), [3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
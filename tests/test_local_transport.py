@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.utilities.ai_server import AiServer
+from bioworkflowml.utilities.aio_client import AsyncAiClient
+from bioworkflowml.utilities.nf_client import channel_target, send_task_observation
+from bioworkflowml.utilities.shm_transport import (RING_DIRECTORY, RING_PREFIX, GrpcBatchClient, ShmBatchClient, ShmBatchServer,
+                                     ShmCallError, ShmRing, batch_method_handler, connect_batch_client)
+
+
+def observations(count, prefix="e"):
+    return [nf_ai_comms_pb2.TaskObservation(event_id=f"{prefix}{i}", event_type="task_complete") for i in range(count)]
+
+
+class TestShmRing(unittest.TestCase):
+
+    def test_records_wrap_around_in_order(self):
+        ring = ShmRing(size=1024, create=True)
+        self.addCleanup(ring.close)
+        self.addCleanup(ring.unlink)
+        reader = ShmRing(ring.path)
+        self.addCleanup(reader.close)
+
+        for i in range(200):
+            payload = bytes([i % 256]) * (i % 300)
+            self.assertTrue(ring.try_write(payload))
+            self.assertEqual(reader.try_read(), payload)
+        self.assertIsNone(reader.try_read())
+
+    def test_full_ring_refuses_writes(self):
+        ring = ShmRing(size=1024, create=True)
+        self.addCleanup(ring.close)
+        self.addCleanup(ring.unlink)
+        self.assertTrue(ring.try_write(b"x" * 400))
+        self.assertTrue(ring.try_write(b"x" * 400))
+        self.assertFalse(ring.try_write(b"x" * 400))
+        with self.assertRaises(ValueError):
+            ring.try_write(b"x" * 1024)
+
+
+class TestLocalTransports(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.uds_path = os.path.join(self.tmp_dir.name, "ai.sock")
+        self.shm_path = os.path.join(self.tmp_dir.name, "ai.shm.sock")
+        self.server = AiServer(port=None, log_file=os.path.join(self.tmp_dir.name, "ai_server.log"),
+                               uds_path=self.uds_path, shm_path=self.shm_path)
+        self.server.start()
+        self.addCleanup(self.server.stop, 0)
+
+    def test_address_scheme(self):
+        self.assertEqual(channel_target("/tmp/ai.sock"), "unix:/tmp/ai.sock")
+        self.assertEqual(channel_target("unix:///tmp/ai.sock"), "unix:///tmp/ai.sock")
+        self.assertEqual(channel_target("localhost:50052"), "localhost:50052")
+
+    def test_unix_domain_socket_clients(self):
+        action = send_task_observation({"event_id": "uds"}, self.uds_path).result(timeout=10)
+        self.assertEqual(action.observation_event_id, "uds")
+
+        async def send_batch():
+            async with AsyncAiClient(f"unix:{self.uds_path}") as client:
+                return await client.send_many(observations(10), batch_size=4)
+        self.assertEqual([a.observation_event_id for a in asyncio.run(send_batch())], [f"e{i}" for i in range(10)])
+
+    def test_shared_memory_batches(self):
+        with ShmBatchClient(self.shm_path, ring_bytes=64 * 1024) as client:
+            self.assertEqual([a.observation_event_id for a in client.send_batch(observations(3))], ["e0", "e1", "e2"])
+            # Enough batches to wrap both rings several times.
+            actions = client.send_many(observations(5000), batch_size=100)
+        self.assertEqual([a.observation_event_id for a in actions], [f"e{i}" for i in range(5000)])
+        self.assertIn('ai_server_observations_total{event_type="task_complete",pipeline_name=""} 5003',
+                      self.server.metrics.registry.render_prometheus())
+
+    def test_shared_memory_errors_are_reported(self):
+        class FailingServicer:
+            def SendTaskObservationBatch(self, request, context):
+                context.abort(grpc.StatusCode.FAILED_PRECONDITION, "not ready")
+
+        control_path = os.path.join(self.tmp_dir.name, "failing.sock")
+        server = ShmBatchServer(batch_method_handler(FailingServicer())[1], control_path)
+        server.start()
+        self.addCleanup(server.stop)
+        with ShmBatchClient(control_path, ring_bytes=64 * 1024) as client:
+            with self.assertRaises(ShmCallError) as raised:
+                client.send_batch(observations(1))
+            self.assertEqual(raised.exception.code(), grpc.StatusCode.FAILED_PRECONDITION)
+            results = client.send_many(observations(5), batch_size=2, return_exceptions=True)
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(isinstance(r, ShmCallError) for r in results))
+
+    def test_timed_out_client_does_not_take_a_late_reply_for_the_next_call(self):
+        release = threading.Event()
+
+        class SlowServicer:
+            def SendTaskObservationBatch(self, request, context):
+                release.wait(5)
+                return nf_ai_comms_pb2.ActionBatch(actions=[
+                    nf_ai_comms_pb2.Action(observation_event_id=o.event_id) for o in request.observations])
+
+        control_path = os.path.join(self.tmp_dir.name, "slow.sock")
+        server = ShmBatchServer(batch_method_handler(SlowServicer())[1], control_path)
+        server.start()
+        self.addCleanup(server.stop)
+        self.addCleanup(release.set)
+        with ShmBatchClient(control_path, ring_bytes=64 * 1024, timeout=0.1) as client:
+            with self.assertRaises(ShmCallError) as raised:
+                client.send_batch(observations(1, prefix="late"))
+            self.assertEqual(raised.exception.code(), grpc.StatusCode.DEADLINE_EXCEEDED)
+            release.set()
+            with self.assertRaises(ShmCallError) as raised:
+                client.send_batch(observations(1))
+            self.assertEqual(raised.exception.code(), grpc.StatusCode.UNAVAILABLE)
+
+    def handshake(self, request_ring, response_ring):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(self.shm_path)
+            sock.sendall(json.dumps({"request_ring": request_ring, "response_ring": response_ring}).encode() + b"\n")
+            return sock.recv(3)
+
+    def test_ring_paths_outside_the_ring_directory_are_refused(self):
+        ring = ShmRing(size=1024, create=True)
+        self.addCleanup(ring.close)
+        self.addCleanup(ring.unlink)
+        victim = os.path.join(self.tmp_dir.name, f"{RING_PREFIX}victim")
+        with open(victim, "wb") as f:
+            f.write(b"\0" * 4096)
+        self.assertEqual(self.handshake(victim, ring.path), b"no\n")
+        self.assertEqual(self.handshake(ring.path, os.path.join(RING_DIRECTORY, "..", "etc", "passwd")), b"no\n")
+
+        link = os.path.join(RING_DIRECTORY, f"{RING_PREFIX}link-{os.getpid()}")
+        os.symlink(victim, link)
+        self.addCleanup(os.unlink, link)
+        self.assertEqual(self.handshake(link, ring.path), b"")  # Not followed: the server hangs up
+        with open(victim, "rb") as f:
+            self.assertEqual(f.read(), b"\0" * 4096)
+
+    def test_grpc_fallback_where_shared_memory_is_unsupported(self):
+        with mock.patch("bioworkflowml.utilities.shm_transport.SHM_SUPPORTED", False):
+            with self.assertRaises(OSError):
+                ShmBatchClient(self.shm_path)
+            with connect_batch_client(self.shm_path, self.uds_path) as client:
+                self.assertIsInstance(client, GrpcBatchClient)
+                actions = client.send_many(observations(10), batch_size=4)
+        self.assertEqual([a.observation_event_id for a in actions], [f"e{i}" for i in range(10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
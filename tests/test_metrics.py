@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import unittest
+import urllib.request
+from concurrent import futures
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.metrics import MetricsRegistry, ServerMetrics
+from bioworkflowml.utilities.reply_cache import ReplyCache
+from bioworkflowml.utilities.wire_format import encode_batch
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def test_counter_and_gauge_rendering(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("events_total", "Events.", ("kind",))
+        counter.labels("a").inc()
+        counter.labels("a").inc(2)
+        counter.labels('quote"d').inc()
+        gauge = registry.gauge("depth", "Depth.")
+        gauge.set_function(lambda: 7)
+
+        text = registry.render_prometheus()
+        self.assertIn("# TYPE events_total counter", text)
+        self.assertIn('events_total{kind="a"} 3', text)
+        self.assertIn('events_total{kind="quote\\"d"} 1', text)
+        self.assertIn("depth 7", text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+
+        text = registry.render_prometheus()
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4', text)
+        self.assertIn("latency_seconds_count 4", text)
+
+    def test_histogram_quantile(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("q_seconds", "Q.", buckets=(1.0, 2.0, 3.0, 4.0))
+        self.assertIsNone(histogram.labels().quantile(0.5))
+        for value in (0.5, 1.5, 2.5, 3.5):
+            histogram.observe(value)
+        self.assertAlmostEqual(histogram.labels().quantile(0.5), 2.0)
+        self.assertAlmostEqual(histogram.labels().quantile(1.0), 4.0)
+
+    def test_reregistering_returns_same_metric(self):
+        registry = MetricsRegistry()
+        self.assertIs(registry.counter("c", "C."), registry.counter("c", "C."))
+        with self.assertRaises(ValueError):
+            registry.gauge("c", "C.")
+
+
+class TestServerMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = ServerMetrics()
+        executor = futures.ThreadPoolExecutor(max_workers=2)
+        self.server = grpc.server(executor)
+        self.metrics.set_handler_capacity(2)
+        self.metrics.add_servicer_to_server(
+            AiActionServiceServicer(lambda message: None, metrics=self.metrics),
+            nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server,
+            self.server,
+        )
+        port = self.server.add_insecure_port("localhost:0")
+        self.server.start()
+        self.channel = grpc.insecure_channel(f"localhost:{port}")
+        self.stub = nf_ai_comms_pb2_grpc.AiActionServiceStub(self.channel)
+
+    def tearDown(self):
+        self.channel.close()
+        self.server.stop(0)
+        self.metrics.stop()
+
+    def test_rpcs_are_instrumented_and_scrapeable(self):
+        for event_type in ("task_start", "task_complete", "task_complete"):
+            self.stub.SendTaskObservation(nf_ai_comms_pb2.TaskObservation(
+                event_id="e", event_type=event_type, pipeline_name="p"))
+
+        port = self.metrics.start_http_server(port=0, host="localhost")
+        with urllib.request.urlopen(f"http://localhost:{port}/metrics", timeout=5) as response:
+            text = response.read().decode("utf-8")
+
+        self.assertIn('ai_server_rpc_latency_seconds_count{method="SendTaskObservation"} 3', text)
+        self.assertIn('ai_server_rpc_in_flight{method="SendTaskObservation"} 0', text)
+        self.assertIn('ai_server_observations_total{event_type="task_complete",pipeline_name="p"} 2', text)
+        # The codecs are re-run on the first request after each fold, and the scrape folds once
+        self.assertIn(
+            'ai_server_serialization_seconds_count{method="SendTaskObservation",direction="deserialize"} 1', text)
+        self.assertIn("ai_server_handlers_in_flight 0", text)
+        self.assertIn("ai_server_handler_capacity 2", text)
+
+    def test_encoded_batches_are_counted_after_decoding(self):
+        observations = [nf_ai_comms_pb2.TaskObservation(event_id=f"e{i}", event_type="task_start", pipeline_name="p")
+                        for i in range(3)]
+        self.stub.SendEncodedObservationBatch(encode_batch(observations))
+        self.stub.SendTaskObservationBatch(nf_ai_comms_pb2.TaskObservationBatch(observations=observations[:1]))
+        self.metrics.fold()
+        text = self.metrics.registry.render_prometheus()
+        self.assertIn('ai_server_observations_total{event_type="task_start",pipeline_name="p"} 4', text)
+        self.assertNotIn('event_type=""', text)
+
+    def test_concurrent_handlers_lose_no_updates(self):
+        handler = grpc.unary_unary_rpc_method_handler(
+            lambda request, context: request, request_deserializer=nf_ai_comms_pb2.TaskObservation.FromString)
+        instrumented = self.metrics.wrap_handler("/bench.Service/Echo", handler).unary_unary
+        request = nf_ai_comms_pb2.TaskObservation(event_type="task_start", pipeline_name="threads")
+
+        def hammer():
+            for _ in range(5000):
+                instrumented(request, None)
+
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        text = self.metrics.registry.render_prometheus()
+        self.assertIn('ai_server_observations_total{event_type="task_start",pipeline_name="threads"} 40000', text)
+        self.assertIn('ai_server_rpc_latency_seconds_count{method="Echo"} 40000', text)
+        self.assertIn('ai_server_rpc_in_flight{method="Echo"} 0', text)
+
+    def test_reply_cache_lookups_are_exported(self):
+        cache = ReplyCache(max_entries=1)
+        self.metrics.track_reply_cache(cache)
+        cache.begin("e1")
+        cache.complete("e1", nf_ai_comms_pb2.Action(action_id="a1"))
+        cache.begin("e1")
+        cache.begin("e2")  # Evicts e1
+        cache.begin("e2")
+        text = self.metrics.registry.render_prometheus()
+        self.assertIn('ai_server_cache_requests_total{cache="reply",result="hit"} 1', text)
+        self.assertIn('ai_server_cache_requests_total{cache="reply",result="miss"} 2', text)
+        self.assertIn('ai_server_cache_requests_total{cache="reply",result="in_progress"} 1', text)
+        self.assertIn('ai_server_cache_evictions_total{cache="reply"} 1', text)
+
+    def test_queue_depth_counts_work_waiting_for_a_thread(self):
+        executor = futures.ThreadPoolExecutor(max_workers=1)
+        self.metrics.track_executor(executor)
+        release = threading.Event()
+        blocked = executor.submit(release.wait)
+        queued = [executor.submit(lambda: None) for _ in range(2)]
+        self.assertIn("ai_server_queue_depth 2", self.metrics.registry.render_prometheus())
+        release.set()
+        for future in [blocked] + queued:
+            future.result(timeout=5)
+        executor.shutdown()
+        self.assertIn("ai_server_queue_depth 0", self.metrics.registry.render_prometheus())
+
+
+class TestAioQueueDepth(unittest.TestCase):
+
+    def test_rpcs_leave_the_queue_when_their_handler_starts(self):
+        metrics = ServerMetrics()
+        depths = []  # Queue depth seen by each handler: its own RPC must no longer be counted
+
+        async def echo(request, context):
+            depths.append(metrics.queue_depth.labels().get())
+            return request
+
+        async def run():
+            server = grpc.aio.server(interceptors=[metrics.aio_interceptor()])
+            handler = grpc.unary_unary_rpc_method_handler(
+                echo, request_deserializer=nf_ai_comms_pb2.TaskObservation.FromString,
+                response_serializer=nf_ai_comms_pb2.TaskObservation.SerializeToString)
+            server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(
+                "bench.Service", {"Echo": metrics.wrap_handler("/bench.Service/Echo", handler)}),))
+            port = server.add_insecure_port("localhost:0")
+            await server.start()
+            try:
+                async with grpc.aio.insecure_channel(f"localhost:{port}") as channel:
+                    call = channel.unary_unary(
+                        "/bench.Service/Echo", request_serializer=nf_ai_comms_pb2.TaskObservation.SerializeToString,
+                        response_deserializer=nf_ai_comms_pb2.TaskObservation.FromString)
+                    for _ in range(3):
+                        await call(nf_ai_comms_pb2.TaskObservation(event_id="e"))
+            finally:
+                await server.stop(0)
+
+        asyncio.run(run())
+        self.assertEqual(depths, [0, 0, 0])
+        self.assertIn("ai_server_queue_depth 0", metrics.registry.render_prometheus())
+
+
+if __name__ == '__main__':
+    unittest.main()
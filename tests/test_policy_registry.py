@@ -0,0 +1,105 @@
+import asyncio
+import os
+import pickle
+import tempfile
+import unittest
+
+from bioworkflowml.ai_action_streamer.policy_registry import PolicyRegistry
+
+
+class ConstantPolicy:
+    def __init__(self, details):
+        self.details = details
+        self.calls = 0
+
+    def compute_action(self, observation):
+        self.calls += 1
+        return self.details
+
+
+class TaskAwarePolicy:
+    def compute_action(self, observation, task=None):
+        return f"attempt_{task.attempt}" if task is not None else "no_task"
+
+
+class BrokenPolicy:
+    def compute_action(self, observation):
+        raise RuntimeError("warm-up failure")
+
+
+class TestPolicyRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_checkpoint(self, name, policy):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "wb") as f:
+            pickle.dump(policy, f)
+        return path
+
+    def test_starts_with_echo_policy(self):
+        registry = PolicyRegistry()
+        details, version = registry.decide(object())
+        self.assertEqual(details, "echo_received_and_processed")
+        self.assertEqual(version, "echo-0")
+
+    def test_load_swaps_active_policy_and_tags_version(self):
+        registry = PolicyRegistry(warmup_observations=["obs"])
+        path = self.write_checkpoint("v1.pkl", ConstantPolicy("scale_up"))
+        asyncio.run(registry.load("v1", path))
+        self.assertEqual(registry.decide("obs"), ("scale_up", "v1"))
+        # One warm-up call happened before the policy went live, plus the decide() above.
+        self.assertEqual(registry.active.policy.calls, 2)
+
+    def test_task_is_passed_only_to_policies_that_accept_it(self):
+        registry = PolicyRegistry(warmup_observations=["obs"])
+
+        class Task:
+            attempt = 2
+        self.assertEqual(registry.decide("obs", Task()), ("echo_received_and_processed", "echo-0"))
+        asyncio.run(registry.load("v2", self.write_checkpoint("v2.pkl", TaskAwarePolicy())))
+        self.assertEqual(registry.decide("obs", Task()), ("attempt_2", "v2"))
+        self.assertEqual(registry.decide("obs"), ("no_task", "v2"))
+
+    def test_failed_warmup_keeps_previous_policy(self):
+        registry = PolicyRegistry(warmup_observations=["obs"])
+        path = self.write_checkpoint("broken.pkl", BrokenPolicy())
+        with self.assertRaises(RuntimeError):
+            asyncio.run(registry.load("broken", path))
+        self.assertEqual(registry.active.version, "echo-0")
+
+    def test_shadow_evaluation_records_agreement_and_promotes(self):
+        registry = PolicyRegistry()
+        path = self.write_checkpoint("cand.pkl", ConstantPolicy("echo_received_and_processed"))
+
+        async def scenario():
+            await registry.load("cand", path, activate=False, shadow_fraction=1.0)
+            for _ in range(5):
+                details, _ = registry.decide("obs")
+                await registry.maybe_shadow("obs", details)
+
+        asyncio.run(scenario())
+        status = registry.status()
+        self.assertEqual(status["shadow_version"], "cand")
+        self.assertEqual(status["shadow_stats"], {"evaluated": 5, "agreed": 5, "errors": 0})
+        self.assertEqual(registry.promote_shadow(), "cand")
+        self.assertEqual(registry.active.version, "cand")
+        self.assertIsNone(registry.shadow)
+
+    def test_shadow_fraction_zero_never_samples(self):
+        registry = PolicyRegistry()
+        path = self.write_checkpoint("cand.pkl", ConstantPolicy("other"))
+
+        async def scenario():
+            await registry.load("cand", path, activate=False, shadow_fraction=0.0)
+            return [registry.maybe_shadow("obs", "x") for _ in range(10)]
+
+        self.assertEqual(asyncio.run(scenario()), [None] * 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
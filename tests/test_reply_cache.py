@@ -0,0 +1,86 @@
+import unittest
+from unittest import mock
+
+from bioworkflowml.ai_action_streamer.ai_action_streamer_server import AiActionServicer
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.reply_cache import DONE, IN_PROGRESS, NEW, ReplyCache
+
+
+def observation(event_id, task_id_num=1):
+    return nf_ai_comms_pb2.TaskObservation(event_id=event_id, event_type="task_complete", pipeline_name="p1",
+                                           process_name="ALIGN", task_id_num=task_id_num)
+
+
+class TestReplyCache(unittest.TestCase):
+
+    def test_begin_complete_and_abandon(self):
+        cache = ReplyCache()
+        self.assertEqual(cache.begin("e1"), (NEW, None))
+        self.assertEqual(cache.begin("e1"), (IN_PROGRESS, None))
+        action = nf_ai_comms_pb2.Action(observation_event_id="e1", action_id="a1")
+        cache.complete("e1", action)
+        action.action_id = "changed"  # The cache keeps its own copy
+        state, cached = cache.begin("e1")
+        self.assertEqual((state, cached.action_id), (DONE, "a1"))
+
+        self.assertEqual(cache.begin("e2"), (NEW, None))
+        cache.abandon("e2")
+        self.assertEqual(cache.begin("e2"), (NEW, None))
+
+    def test_empty_event_ids_are_never_cached(self):
+        cache = ReplyCache()
+        self.assertEqual(cache.begin(""), (NEW, None))
+        cache.complete("", nf_ai_comms_pb2.Action())
+        self.assertEqual(cache.begin(""), (NEW, None))
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_seen_are_evicted(self):
+        cache = ReplyCache(max_entries=2)
+        for event_id in ("e1", "e2"):
+            cache.begin(event_id)
+            cache.complete(event_id, nf_ai_comms_pb2.Action(action_id=event_id))
+        cache.begin("e1")  # Seen again: e2 is now the oldest
+        cache.begin("e3")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.begin("e2"), (NEW, None))
+        self.assertEqual(cache.stats["evicted"], 2)
+
+
+class TestServicerReplyCache(unittest.TestCase):
+
+    def test_retried_batch_is_not_decided_twice(self):
+        session_store = mock.Mock()
+        servicer = AiActionServiceServicer(lambda message: None, session_store, reply_cache=ReplyCache())
+        batch = [observation("e1", 1), observation("e2", 2)]
+        first = servicer._process_batch(batch)
+        retried = servicer._process_batch(batch + [observation("e3", 3)])
+        self.assertEqual([a.action_id for a in retried.actions[:2]], [a.action_id for a in first.actions])
+        self.assertEqual(session_store.observe.call_count, 3)
+
+    def test_duplicate_in_progress_is_refused(self):
+        cache = ReplyCache()
+        servicer = AiActionServiceServicer(lambda message: None, reply_cache=cache)
+        cache.begin("e1")  # Another thread is deciding e1
+        context = mock.Mock()
+        context.abort.side_effect = Exception("aborted")  # As grpc's does
+        with self.assertRaises(Exception):
+            servicer.SendTaskObservation(observation("e1"), context)
+        self.assertEqual(context.abort.call_args[0][0].name, "ABORTED")
+        action = servicer._process_batch([observation("e1")]).actions[0]
+        self.assertFalse(action.success)
+
+    def test_failed_decision_is_decided_again(self):
+        servicer = AiActionServicer(reply_cache=ReplyCache())
+        with mock.patch.object(servicer, "_decide", side_effect=RuntimeError("policy failed")):
+            with self.assertRaises(RuntimeError):
+                servicer._process_batch([observation("e1")])
+        first = servicer._process_batch([observation("e1")]).actions[0]
+        with mock.patch.object(servicer, "_decide", side_effect=AssertionError("decided twice")):
+            retried = servicer._process_batch([observation("e1")]).actions[0]
+        self.assertTrue(first.success)
+        self.assertEqual(retried, first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import threading
+import time
+import unittest
+from concurrent import futures
+from unittest import mock
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.reply_cache import ReplyCache
+from bioworkflowml.utilities.resilient_client import ClientClosedError, ResilientAiClient, _Scheduler
+
+
+class ScriptedServicer(AiActionServiceServicer):
+    """Fails the first `failures` calls with `code`, and sleeps `delay_s` before answering."""
+    def __init__(self, failures=0, code=grpc.StatusCode.UNAVAILABLE, delay_s=0.0):
+        super().__init__(lambda message: None)
+        self.failures = failures
+        self.code = code
+        self.delay_s = delay_s
+        self.calls = 0
+
+    def SendTaskObservation(self, request, context):
+        self.calls += 1
+        if self.calls <= self.failures:
+            context.abort(self.code, "scripted failure")
+        time.sleep(self.delay_s)
+        return super().SendTaskObservation(request, context)
+
+
+class LostReplyServicer(AiActionServiceServicer):
+    """Processes the first call but fails it with UNAVAILABLE, as if the reply was lost on the way back."""
+    def __init__(self, session_store):
+        super().__init__(lambda message: None, session_store, reply_cache=ReplyCache())
+        self.calls = 0
+        self.first_action_id = None
+
+    def SendTaskObservation(self, request, context):
+        self.calls += 1
+        action = super().SendTaskObservation(request, context)
+        if self.calls == 1:
+            self.first_action_id = action.action_id
+            context.abort(grpc.StatusCode.UNAVAILABLE, "reply lost")
+        return action
+
+
+class TestResilientAiClient(unittest.TestCase):
+
+    def start_server(self, servicer):
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=8))
+        nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server(servicer, server)
+        port = server.add_insecure_port("localhost:0")
+        server.start()
+        self.addCleanup(server.stop, 0)
+        return f"localhost:{port}"
+
+    def client(self, addresses, **kwargs):
+        client = ResilientAiClient(addresses, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_transient_failures_are_retried(self):
+        servicer = ScriptedServicer(failures=2)
+        client = self.client(self.start_server(servicer), initial_backoff_s=0.01)
+
+        action = client.send({"event_id": "retried"}).result(timeout=10)
+        self.assertEqual(action.observation_event_id, "retried")
+        self.assertEqual(servicer.calls, 3)
+        self.assertEqual(client.stats["retries"], 2)
+
+    def test_retry_of_a_processed_observation_gets_the_cached_reply(self):
+        session_store = mock.Mock()
+        servicer = LostReplyServicer(session_store)
+        client = self.client(self.start_server(servicer), initial_backoff_s=0.01)
+
+        action = client.send({"event_id": "lost"}).result(timeout=10)
+        self.assertEqual(servicer.calls, 2)
+        self.assertEqual(action.action_id, servicer.first_action_id)
+        self.assertEqual(session_store.observe.call_count, 1)  # Decided once, not once per attempt
+
+    def test_observations_without_event_id_get_one(self):
+        servicer = ScriptedServicer()
+        client = self.client(self.start_server(servicer))
+
+        observation = nf_ai_comms_pb2.TaskObservation(event_type="task_start")
+        action = client.send(observation).result(timeout=10)
+        self.assertTrue(action.observation_event_id)
+        self.assertEqual(observation.event_id, "")  # The caller's message is left alone
+
+    def test_permanent_failures_are_not_retried(self):
+        servicer = ScriptedServicer(failures=10, code=grpc.StatusCode.INVALID_ARGUMENT)
+        client = self.client(self.start_server(servicer))
+
+        with self.assertRaises(grpc.RpcError) as raised:
+            client.send({"event_id": "bad"}).result(timeout=10)
+        self.assertEqual(raised.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+        self.assertEqual(servicer.calls, 1)
+
+    def test_dead_address_is_avoided(self):
+        # Nothing listens on port 1.
+        client = self.client(["localhost:1", self.start_server(ScriptedServicer())], initial_backoff_s=0.01)
+        for i in range(20):
+            self.assertEqual(client.send({"event_id": f"e{i}"}).result(timeout=10).observation_event_id, f"e{i}")
+        self.assertFalse(client.endpoints[0].healthy)
+
+    def test_slow_server_is_hedged(self):
+        slow = self.start_server(ScriptedServicer(delay_s=2.0))
+        fast = self.start_server(ScriptedServicer())
+        client = self.client([slow, fast], initial_hedge_delay_s=0.02)
+
+        started = time.monotonic()
+        results = [client.send({"event_id": f"e{i}"}) for i in range(10)]
+        for i, result in enumerate(results):
+            self.assertEqual(result.result(timeout=10).observation_event_id, f"e{i}")
+        self.assertLess(time.monotonic() - started, 1.5)
+
+    def test_deadline_bounds_the_whole_operation(self):
+        client = self.client(self.start_server(ScriptedServicer(delay_s=2.0)), timeout=0.2)
+
+        started = time.monotonic()
+        with self.assertRaises(grpc.RpcError) as raised:
+            client.send({"event_id": "late"}).result(timeout=10)
+        self.assertEqual(raised.exception.code(), grpc.StatusCode.DEADLINE_EXCEEDED)
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_lost_retry_still_fails_at_the_deadline(self):
+        client = self.client(self.start_server(ScriptedServicer(failures=1)), timeout=0.3)
+
+        with mock.patch.object(client, "_schedule_retry"):  # The retry is never started
+            with self.assertRaises(grpc.RpcError) as raised:
+                client.send({"event_id": "orphan"}).result(timeout=5)
+        self.assertEqual(raised.exception.code(), grpc.StatusCode.DEADLINE_EXCEEDED)
+
+    def test_close_fails_pending_observations(self):
+        spool = mock.Mock()
+        client = ResilientAiClient(self.start_server(ScriptedServicer(delay_s=2.0)), timeout=10, spool=spool)
+        pending = client.send({"event_id": "pending"})
+        client.close()
+
+        self.assertIsInstance(pending.exception(timeout=1), ClientClosedError)
+        self.assertEqual(spool.append.call_args[0][0].event_id, "pending")
+        with self.assertRaises(RuntimeError):
+            client.send({"event_id": "after_close"})
+
+    def test_scheduler_survives_a_failing_callback(self):
+        scheduler = _Scheduler()
+        self.addCleanup(scheduler.stop)
+        ran = threading.Event()
+        with self.assertLogs("bioworkflowml.utilities.resilient_client", "ERROR"):
+            scheduler.call_at(time.monotonic(), lambda: 1 / 0)
+            scheduler.call_at(time.monotonic() + 0.01, ran.set)
+            self.assertTrue(ran.wait(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
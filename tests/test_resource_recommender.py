@@ -0,0 +1,117 @@
+import asyncio
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import unittest
+
+from bioworkflowml.ai_action_streamer.ai_action_streamer_server import AiActionServicer
+from bioworkflowml.ai_action_streamer.resource_recommender import MIB, QuantileSketch, ResourceRecommender, parse_cpu_percent
+from bioworkflowml.ai_action_streamer.state_checkpoint import StateCheckpointer, encode_record
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.utilities.session_store import SessionStore
+
+
+def completed(process_name="ALIGN", peak_rss_bytes=1000 * MIB, cpu_percent="150.0%", realtime_ms=60_000, **fields):
+    fields.setdefault("status", "COMPLETED")
+    return nf_ai_comms_pb2.TaskObservation(event_type="task_complete", process_name=process_name,
+                                           peak_rss_bytes=peak_rss_bytes, cpu_percent=cpu_percent,
+                                           realtime_ms=realtime_ms, **fields)
+
+
+class TestResourceRecommender(unittest.TestCase):
+
+    def test_sketch_quantiles_are_within_precision(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(20, 1) for _ in range(5000)]
+        sketch = QuantileSketch(precision=0.01)
+        for value in values:
+            sketch.add(value)
+        values.sort()
+        for q in (0.5, 0.9, 0.99):
+            exact = values[math.ceil(q * len(values)) - 1]
+            self.assertAlmostEqual(sketch.quantile(q) / exact, 1.0, delta=0.011)
+
+    def test_recommendation_covers_the_quantile_with_headroom(self):
+        recommender = ResourceRecommender(quantile=0.9, headroom=0.1, min_samples=5, refresh_every=1)
+        for i in range(4):
+            self.assertIsNone(recommender.observe(completed(peak_rss_bytes=(i + 1) * 100 * MIB)))
+        for i in range(4, 10):
+            recommendation = recommender.observe(completed(peak_rss_bytes=(i + 1) * 100 * MIB))
+        self.assertEqual(recommendation.sample_count, 10)
+        self.assertGreaterEqual(recommendation.memory_bytes, 900 * MIB * 1.1)
+        self.assertLess(recommendation.memory_bytes, 900 * MIB * 1.1 * 1.02)
+        self.assertEqual(recommendation.memory_bytes % MIB, 0)
+        self.assertEqual(recommendation.cpus, 2)  # 1.5 cores plus headroom, rounded up
+        self.assertEqual(recommendation.time_ms % 1000, 0)
+        self.assertIs(recommender.recommend("ALIGN"), recommendation)
+        self.assertIsNone(recommender.recommend("OTHER"))
+
+    def test_oom_kills_raise_memory_and_other_failures_are_ignored(self):
+        recommender = ResourceRecommender(quantile=0.5, headroom=0.0, min_samples=1, refresh_every=1)
+        recommender.observe(completed(peak_rss_bytes=100 * MIB))
+        recommender.observe(completed(peak_rss_bytes=50 * MIB, status="FAILED", exit_code=1))
+        self.assertEqual(recommender.recommend("ALIGN").sample_count, 1)
+        for _ in range(2):
+            recommendation = recommender.observe(completed(peak_rss_bytes=100 * MIB, status="FAILED", exit_code=137))
+        self.assertGreaterEqual(recommendation.memory_bytes, 150 * MIB)
+        self.assertIsNone(parse_cpu_percent(""))
+
+    def test_servicer_attaches_recommendations(self):
+        recommender = ResourceRecommender(min_samples=1)
+        servicer = AiActionServicer(resource_recommender=recommender)
+
+        async def send():
+            action = await servicer.SendTaskObservation(completed(event_id="e1"), None)
+            batch = await servicer.SendTaskObservationBatch(nf_ai_comms_pb2.TaskObservationBatch(
+                observations=[completed(process_name="NEW", event_id="e2", status="RUNNING")]), None)
+            return action, batch.actions[0]
+
+        action, unknown = asyncio.run(send())
+        self.assertTrue(action.HasField("resource_recommendation"))
+        self.assertEqual(action.resource_recommendation.process_name, "ALIGN")
+        self.assertFalse(unknown.HasField("resource_recommendation"))
+
+    def test_models_are_checkpointed(self):
+        recommender = ResourceRecommender(min_samples=2, refresh_every=1)
+        for i in range(3):
+            recommender.observe(completed(peak_rss_bytes=(i + 1) * 100 * MIB))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            directory = os.path.join(tmp_dir, "checkpoints")
+            checkpointer = StateCheckpointer(directory, SessionStore(), resource_recommender=recommender)
+            checkpointer.checkpoint()
+            checkpointer.checkpoint()  # Unchanged models are left out of the incremental record
+            restored = ResourceRecommender(min_samples=2, refresh_every=1)
+            asyncio.run(StateCheckpointer(directory, SessionStore(), resource_recommender=restored).restore())
+        self.assertEqual(restored.recommend("ALIGN"), recommender.recommend("ALIGN"))
+
+    def test_state_is_safe_while_learning(self):
+        recommender = ResourceRecommender(half_life=50)
+        done = threading.Event()
+
+        def learn():
+            for i in range(20_000):
+                recommender.observe(completed(process_name=f"P{i % 500}", peak_rss_bytes=random.randint(1, 1 << 30)))
+            done.set()
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # Switch threads often enough for a torn snapshot to show
+        try:
+            learner = threading.Thread(target=learn)
+            learner.start()
+            while not done.is_set():
+                # What the checkpointer thread does; iterating a dict the learner grows would raise.
+                state = recommender.state()
+                encode_record(state)
+                for data in state["models"].values():
+                    self.assertAlmostEqual(data["memory"]["total"], sum(data["memory"]["counts"].values()), places=6)
+            learner.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertEqual(len(recommender.state()["models"]), 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
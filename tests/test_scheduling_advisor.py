@@ -0,0 +1,116 @@
+import asyncio
+import random
+import unittest
+
+from bioworkflowml.ai_action_streamer.ai_action_streamer_server import AiActionServicer
+from bioworkflowml.ai_action_streamer.scheduling_advisor import IndexedHeap, SchedulingAdvisor
+from bioworkflowml.proto import nf_ai_comms_pb2
+from state_simulation.cloudy.workflow_sim import FifoDispatcher, Workflow, simulate
+
+
+def event(event_type, task_id_num, process_name, **fields):
+    return nf_ai_comms_pb2.TaskObservation(event_type=event_type, pipeline_name="p1", process_name=process_name,
+                                           task_id_num=task_id_num, **fields)
+
+
+def run_chain(advisor):
+    """One run of a pipeline where LONG -> NEXT is the critical path and SHORT feeds nothing."""
+    advisor.observe(event("task_submit", 1, "SHORT"))
+    advisor.observe(event("task_submit", 2, "LONG"))
+    order = advisor.advise("p1")
+    advisor.observe(event("task_submit", 3, "NEXT", upstream_processes=["LONG"]))
+    for task_id, process_name, realtime_ms in ((1, "SHORT", 1000), (2, "LONG", 60_000), (3, "NEXT", 60_000)):
+        advisor.observe(event("task_start", task_id, process_name))
+        advisor.observe(event("task_complete", task_id, process_name, realtime_ms=realtime_ms))
+    advisor.observe(nf_ai_comms_pb2.TaskObservation(event_type="workflow_complete", pipeline_name="p1"))
+    return order
+
+
+class TestIndexedHeap(unittest.TestCase):
+
+    def test_matches_a_sorted_reference_under_updates_and_removals(self):
+        rng = random.Random(3)
+        heap = IndexedHeap()
+        reference = {}
+        for _ in range(2000):
+            key = rng.randrange(100)
+            operation = rng.random()
+            if operation < 0.5:
+                reference[key] = rng.random()
+                heap.push(key, reference[key])
+            elif operation < 0.8 and key in reference:
+                reference[key] = rng.random()
+                heap.update(key, reference[key])
+            else:
+                self.assertEqual(heap.remove(key), reference.pop(key, None) is not None)
+            self.assertEqual(len(heap), len(reference))
+        expected = sorted(reference, key=reference.get)
+        self.assertEqual(list(heap.ordered()), expected)
+        self.assertEqual(list(heap.ordered()), expected)  # ordered() leaves the heap as it was
+
+
+class TestSchedulingAdvisor(unittest.TestCase):
+
+    def test_first_run_in_submission_order_then_by_critical_path(self):
+        advisor = SchedulingAdvisor()
+        self.assertEqual(run_chain(advisor), [1, 2])
+        self.assertEqual(run_chain(advisor), [2, 1])
+        queue = advisor.pipelines["p1"]
+        self.assertEqual(queue.critical_path["LONG"], 120_000)
+        self.assertEqual(queue.runs, 2)
+        self.assertEqual(len(queue.heap), 0)
+
+    def test_pending_tasks_are_rekeyed_when_durations_change(self):
+        advisor = SchedulingAdvisor(min_runs=0)
+        advisor.observe(event("task_submit", 1, "A"))
+        advisor.observe(event("task_submit", 2, "B"))
+        self.assertEqual(advisor.advise("p1"), [1, 2])  # Both unknown: submission order
+        advisor.observe(event("task_submit", 3, "B"))
+        advisor.observe(event("task_start", 3, "B"))
+        advice = advisor.observe(event("task_complete", 3, "B", realtime_ms=600_000))
+        self.assertEqual(list(advice.dispatch_order), [2, 1])
+        self.assertEqual(advice.priority_ms, 600_000)
+        self.assertEqual(advice.pending_tasks, 2)
+        self.assertEqual(advisor.stats["rekeyed"], 1)
+
+    def test_tasks_that_do_not_fit_are_skipped(self):
+        advisor = SchedulingAdvisor(min_runs=0)
+        advisor.set_capacity("p1", cpus=8, memory_bytes=10 << 30)
+        advisor.observe(event("task_submit", 1, "RUNNING", cpus=4, memory_limit_bytes=1 << 30))
+        advisor.observe(event("task_start", 1, "RUNNING"))
+        advisor.observe(event("task_complete", 9, "BIG", realtime_ms=600_000))
+        advisor.observe(event("task_submit", 2, "BIG", cpus=8, memory_limit_bytes=1 << 30))
+        advisor.observe(event("task_submit", 3, "SMALL", cpus=2, memory_limit_bytes=1 << 30))
+        advisor.observe(event("task_submit", 4, "SMALL", cpus=2, memory_limit_bytes=9 << 30))
+        advisor.observe(event("task_submit", 5, "SMALL", cpus=2, memory_limit_bytes=1 << 30))
+        # BIG ranks first but needs 8 CPUs with 4 free; task 4 would exceed the memory left
+        self.assertEqual(advisor.advise("p1"), [3, 5])
+        advisor.observe(event("task_complete", 1, "RUNNING"))
+        self.assertEqual(advisor.advise("p1"), [2])
+
+    def test_servicer_attaches_scheduling_advice(self):
+        servicer = AiActionServicer(scheduling_advisor=SchedulingAdvisor())
+
+        async def send():
+            return await servicer.SendTaskObservation(event("task_submit", 7, "ALIGN", event_id="e1"), None)
+
+        action = asyncio.run(send())
+        self.assertEqual(list(action.scheduling_advice.dispatch_order), [7])
+        self.assertEqual(action.scheduling_advice.pending_tasks, 1)
+
+
+class TestWorkflowSim(unittest.TestCase):
+
+    def test_fifo_makespan(self):
+        workflow = Workflow("w")
+        first = workflow.add("A", 10, 2, 1)
+        workflow.add("B", 5, 2, 1)
+        workflow.add("C", 20, 2, 1, [first])
+        # Two CPUs: A (0-10) and B (10-15) in ready order, then C (15-35) once B frees the CPUs
+        result = simulate(workflow, cpus=2, memory_bytes=1, dispatcher=FifoDispatcher())
+        self.assertEqual(result.makespan_ms, 35)
+        self.assertEqual(result.cpu_utilization, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.utilities import session_store
+from bioworkflowml.utilities.session_store import COMPLETED, FAILED, RUNNING, SessionStore
+
+
+def observation(event_type, task_id_num=0, task_hash="", pipeline_name="p1", process_name="ALIGN", **fields):
+    return nf_ai_comms_pb2.TaskObservation(event_type=event_type, task_id_num=task_id_num, task_hash=task_hash,
+                                           pipeline_name=pipeline_name, process_name=process_name, **fields)
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def test_start_and_complete_are_correlated(self):
+        store = SessionStore()
+        started = store.observe(observation("task_start", 1, "h1"))
+        self.assertEqual(started.state, RUNNING)
+        self.assertEqual(started.session.processes["ALIGN"].running, 1)
+
+        completed = store.observe(observation("task_complete", 1, status="COMPLETED", duration_ms=1500))
+        self.assertIs(completed, started)
+        self.assertEqual(completed.state, COMPLETED)
+        self.assertEqual(completed.duration_ms, 1500)
+        counters = store.get("p1").processes["ALIGN"]
+        self.assertEqual((counters.running, counters.completed, counters.failed), (0, 1, 0))
+        self.assertEqual(counters.mean_duration_ms(), 1500)
+
+    def test_retries_of_a_task_hash_are_counted(self):
+        store = SessionStore()
+        store.observe(observation("task_start", 1, "h1"))
+        store.observe(observation("task_complete", 1, "h1", status="FAILED"))
+        retry = store.observe(observation("task_start", 2, "h1"))
+
+        session = store.get("p1")
+        self.assertEqual(retry.attempt, 2)
+        self.assertIs(session.latest_attempt("h1"), retry)
+        self.assertEqual(session.task(1).state, FAILED)
+        counters = session.processes["ALIGN"]
+        self.assertEqual((counters.running, counters.failed, counters.retried), (1, 1, 1))
+
+    def test_duplicate_events_do_not_skew_counters(self):
+        store = SessionStore()
+        for _ in range(2):
+            store.observe(observation("task_start", 1))
+            store.observe(observation("task_complete", 1, status="COMPLETED"))
+        counters = store.get("p1").processes["ALIGN"]
+        self.assertEqual((counters.running, counters.completed), (0, 1))
+
+    def test_finished_idle_and_excess_pipelines_are_evicted(self):
+        store = SessionStore(max_pipelines=2, idle_timeout_s=100, finished_retention_s=10)
+        store.observe(observation("task_start", 1, pipeline_name="finished"))
+        store.observe(observation("pipeline_complete", pipeline_name="finished"))
+        store.observe(observation("task_start", 1, pipeline_name="active"))
+        self.assertEqual(store.evict_expired(now=time.time() + 11), 1)
+        self.assertIsNone(store.get("finished"))
+
+        store.observe(observation("task_start", 1, pipeline_name="second"))
+        store.observe(observation("task_start", 1, pipeline_name="third"))  # Over max_pipelines
+        self.assertIsNone(store.get("active"))
+        self.assertEqual(store.evict_expired(now=time.time() + 101), 2)
+        self.assertEqual(store.evicted, 4)
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "sessions.json")
+            store = SessionStore(snapshot_path=path)
+            store.observe(observation("task_start", 1, "h1"))
+            store.observe(observation("task_complete", 1, status="FAILED", exit_code=137))
+            store.observe(observation("task_start", 2, "h1"))
+            store.stop()
+
+            restored = SessionStore(snapshot_path=path)
+        session = restored.get("p1")
+        self.assertEqual(session.task(1).exit_code, 137)
+        self.assertIs(session.latest_attempt("h1"), session.task(2))
+        self.assertIs(session.task(2).session, session)
+        self.assertEqual(session.processes["ALIGN"].to_dict(), store.get("p1").processes["ALIGN"].to_dict())
+        self.assertEqual(restored.stats()["tasks"], 2)
+
+    def test_task_rows_are_built_outside_the_lock(self):
+        store = SessionStore()
+        for i in range(1, 4):
+            store.observe(observation("task_start", i, f"h{i}"))
+        task_row = session_store._task_row
+
+        def unlocked_task_row(record):
+            self.assertFalse(store._lock.locked())
+            return task_row(record)
+        with mock.patch.object(session_store, "_task_row", unlocked_task_row):
+            sessions, _ = store.take_changes(full=True)
+            store.observe(observation("task_complete", 2, "h2", status="COMPLETED"))
+            changes, _ = store.take_changes()
+            snapshot = store.to_dict()
+        self.assertEqual(len(sessions[0]["tasks"]), 3)
+        self.assertEqual([row[0] for row in changes[0]["tasks"]], [2])
+        self.assertEqual(len(snapshot["sessions"][0]["tasks"]), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
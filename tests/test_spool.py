@@ -0,0 +1,176 @@
+import os
+import tempfile
+import time
+import unittest
+from concurrent import futures
+from unittest import mock
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.nf_client import send_task_observation
+from bioworkflowml.utilities.spool import ObservationSpool, SpoolDrainer, read_records, spool_on_failure
+
+
+def observation(event_id):
+    return nf_ai_comms_pb2.TaskObservation(event_id=event_id, event_type="task_complete", pipeline_name="p")
+
+
+class RecordingServicer(AiActionServiceServicer):
+    def __init__(self):
+        super().__init__(lambda message: None)
+        self.received = []
+
+    def SendTaskObservationBatch(self, request, context):
+        self.received.extend(o.event_id for o in request.observations)
+        return super().SendTaskObservationBatch(request, context)
+
+
+class TestObservationSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.tmp_dir.name
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_appends_survive_reopen(self):
+        spool = ObservationSpool(self.directory)
+        for i in range(5):
+            spool.append(observation(f"e{i}"))
+        spool.close()
+
+        reopened = ObservationSpool(self.directory)
+        self.assertEqual(reopened.pending_observations(), 5)
+        [segment] = reopened.sealed_segments()
+        ids = [nf_ai_comms_pb2.TaskObservation.FromString(p).event_id for _, p in read_records(segment)]
+        self.assertEqual(ids, [f"e{i}" for i in range(5)])
+        reopened.close()
+
+    def test_torn_tail_record_is_ignored(self):
+        spool = ObservationSpool(self.directory)
+        spool.append(observation("intact"))
+        spool.close()
+        [segment] = [os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".seg")]
+        with open(segment, "ab") as f:
+            f.write(b"\x00\x00\x00\x50\x00\x00")  # Header of a record that was never fully written
+
+        self.assertEqual(len(list(read_records(segment))), 1)
+
+    def test_disk_usage_is_bounded(self):
+        record_size = len(observation("e0000").SerializeToString()) + 8
+        spool = ObservationSpool(self.directory, max_bytes=record_size * 20, segment_bytes=record_size * 5)
+        for i in range(100):
+            spool.append(observation(f"e{i:04d}"))
+        spool.flush()
+
+        on_disk = sum(os.path.getsize(os.path.join(self.directory, n)) for n in os.listdir(self.directory))
+        self.assertLessEqual(on_disk, record_size * 20)
+        self.assertEqual(spool.pending_observations() + spool.dropped_observations, 100)
+        self.assertGreater(spool.dropped_segments, 0)
+        spool.close()
+
+
+class TestSpoolDrainer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.spool = ObservationSpool(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.spool.close()
+        self.tmp_dir.cleanup()
+
+    def start_server(self):
+        servicer = RecordingServicer()
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+        nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server(servicer, server)
+        port = server.add_insecure_port("localhost:0")
+        server.start()
+        self.addCleanup(server.stop, 0)
+        return servicer, port
+
+    def test_failed_sends_are_spooled_and_replayed_once(self):
+        # Nothing listens on port 1: the call fails with UNAVAILABLE and lands in the spool.
+        future = send_task_observation({"event_id": "lost"}, "localhost:1", spool=self.spool)
+        with self.assertRaises(grpc.RpcError):
+            future.result(timeout=10)
+        self.spool.append(observation("lost"))  # The same event spooled twice
+        self.spool.append(observation("other"))
+
+        servicer, port = self.start_server()
+        actions = []
+        drainer = SpoolDrainer(self.spool, f"localhost:{port}", batch_size=2, on_action=actions.append)
+        self.assertEqual(drainer.drain_once(), 2)
+        drainer.stop()
+
+        self.assertEqual(servicer.received, ["lost", "other"])
+        self.assertEqual([a.observation_event_id for a in actions], ["lost", "other"])
+        self.assertEqual(drainer.duplicates_skipped, 1)
+        self.assertEqual(self.spool.pending_observations(), 0)
+        self.assertEqual(self.spool.sealed_segments(), [])
+
+    def test_unreachable_server_keeps_spool_intact(self):
+        self.spool.append(observation("kept"))
+        drainer = SpoolDrainer(self.spool, "localhost:1", timeout=5)
+        with self.assertRaises(grpc.RpcError):
+            drainer.drain_once()
+        drainer.stop()
+        self.assertEqual(self.spool.pending_observations(), 1)
+
+    def test_segment_evicted_while_draining_counts_as_consumed(self):
+        record_size = len(observation("e0000").SerializeToString()) + 8
+        spool = ObservationSpool(os.path.join(self.tmp_dir.name, "small"), max_bytes=record_size * 10,
+                                 segment_bytes=record_size * 5)
+        self.addCleanup(spool.close)
+        for i in range(10):
+            spool.append(observation(f"e{i:04d}"))
+        listed = spool.sealed_segments()
+        for i in range(10, 15):
+            spool.append(observation(f"e{i:04d}"))  # Evicts the oldest listed segment
+
+        servicer, port = self.start_server()
+        drainer = SpoolDrainer(spool, f"localhost:{port}")
+        with mock.patch.object(spool, "sealed_segments", return_value=listed):
+            drainer.drain_once()
+        drainer.stop()
+        self.assertEqual(drainer.vanished_segments, 1)
+        self.assertEqual(servicer.received, [f"e{i:04d}" for i in range(5, 10)])
+        self.assertEqual(spool.dropped_observations, 5)
+
+    def test_drainer_thread_survives_unexpected_errors(self):
+        self.spool.append(observation("kept"))
+        servicer, port = self.start_server()
+        drainer = SpoolDrainer(self.spool, f"localhost:{port}", idle_interval_s=0.01)
+        original = drainer._drain_segment
+        failures = [OSError("No space left on device")]
+
+        def flaky(path):
+            if failures:
+                raise failures.pop()
+            return original(path)
+
+        with mock.patch.object(drainer, "_drain_segment", side_effect=flaky), self.assertLogs("bioworkflowml.utilities.spool"):
+            drainer.start()
+            deadline = time.monotonic() + 10
+            while not servicer.received and time.monotonic() < deadline:
+                time.sleep(0.01)
+        drainer.stop()
+        self.assertEqual(drainer.errors, 1)
+        self.assertEqual(servicer.received, ["kept"])
+
+    def test_cancelled_calls_are_not_spooled(self):
+        for code, spooled in ((grpc.StatusCode.CANCELLED, 0), (grpc.StatusCode.UNAVAILABLE, 1)):
+            call = mock.Mock()
+            call.code.return_value = code
+            call.add_done_callback.side_effect = lambda callback: callback(call)
+            before = self.spool.pending_observations()
+            spool_on_failure(call, observation(code.name), self.spool)
+            self.assertEqual(self.spool.pending_observations() - before, spooled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import pickle
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from bioworkflowml.ai_action_streamer.failure_scorer import FailureScorer
+from bioworkflowml.ai_action_streamer.policy_registry import PolicyRegistry
+from bioworkflowml.ai_action_streamer.scheduling_advisor import SchedulingAdvisor
+from bioworkflowml.ai_action_streamer.state_checkpoint import StateCheckpointer, decode_payload, encode_record
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.utilities.reply_cache import DONE, IN_PROGRESS, NEW, ReplyCache
+from bioworkflowml.utilities.session_store import COMPLETED, RUNNING, SessionStore
+
+
+class ConstantPolicy:
+    def __init__(self, details):
+        self.details = details
+
+    def compute_action(self, observation):
+        return self.details
+
+
+def observation(event_type, task_id_num, pipeline_name="p1", **fields):
+    return nf_ai_comms_pb2.TaskObservation(event_type=event_type, task_id_num=task_id_num, task_hash=f"h{task_id_num}",
+                                           pipeline_name=pipeline_name, process_name="ALIGN", **fields)
+
+
+class TestStateCheckpointer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp_dir.name, "checkpoints")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def restore(self, policy_registry=None):
+        store = SessionStore()
+        checkpointer = StateCheckpointer(self.directory, store, policy_registry)
+        records = asyncio.run(checkpointer.restore())
+        return store, records
+
+    def test_incremental_checkpoints_replay_on_top_of_the_base(self):
+        store = SessionStore(finished_retention_s=0)
+        checkpointer = StateCheckpointer(self.directory, store)
+        for i in range(1, 101):
+            store.observe(observation("task_start", i))
+        base_size = checkpointer.checkpoint()
+
+        store.observe(observation("task_complete", 1, status="COMPLETED", duration_ms=1200))
+        store.observe(observation("task_start", 1, pipeline_name="p2"))
+        store.observe(observation("pipeline_complete", 0, pipeline_name="p2"))
+        store.evict_expired()
+        delta_size = checkpointer.checkpoint()
+        self.assertLess(delta_size, base_size)  # Only task 1 of p1 changed
+        self.assertEqual(checkpointer.stats["incremental"], 1)
+
+        restored, records = self.restore()
+        self.assertEqual(records, 2)
+        session = restored.get("p1")
+        self.assertEqual(session.task(1).state, COMPLETED)
+        self.assertEqual(session.task(1).duration_ms, 1200)
+        self.assertEqual(session.task(100).state, RUNNING)
+        self.assertIs(session.latest_attempt("h1"), session.task(1))
+        self.assertEqual(session.processes["ALIGN"].to_dict(), store.get("p1").processes["ALIGN"].to_dict())
+        self.assertIsNone(restored.get("p2"))
+        self.assertEqual(restored.evicted, 1)
+
+    def test_torn_journal_record_ends_the_replay(self):
+        store = SessionStore()
+        checkpointer = StateCheckpointer(self.directory, store)
+        for i in range(1, 101):
+            store.observe(observation("task_start", i, pipeline_name="p0"))
+        store.observe(observation("task_start", 1))
+        checkpointer.checkpoint()
+        store.observe(observation("task_complete", 1, status="COMPLETED"))
+        checkpointer.checkpoint()
+        store.observe(observation("task_start", 2))
+        checkpointer.checkpoint()
+        journal = os.path.join(self.directory, "state-000000000001.journal")
+        with open(journal, "r+b") as f:
+            f.truncate(os.path.getsize(journal) - 3)
+
+        restored, records = self.restore()
+        self.assertEqual(records, 2)
+        self.assertEqual(restored.get("p1").task(1).state, COMPLETED)
+        self.assertIsNone(restored.get("p1").task(2))
+        self.assertEqual(len(restored.get("p0").tasks_by_id), 100)
+
+    def test_full_checkpoint_replaces_the_previous_one(self):
+        store = SessionStore()
+        checkpointer = StateCheckpointer(self.directory, store, full_every=2)
+        for i in range(1, 5):
+            store.observe(observation("task_start", i))
+            checkpointer.checkpoint()
+        checkpointer.stop()
+        self.assertEqual(checkpointer.stats["full"], 3)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["state-000000000003.base", "state-000000000003.journal"])
+        restored, records = self.restore()
+        self.assertEqual((records, len(restored.get("p1").tasks_by_id)), (1, 4))
+
+    def test_failed_checkpoint_is_followed_by_a_full_one(self):
+        store = SessionStore()
+        checkpointer = StateCheckpointer(self.directory, store)
+        store.observe(observation("task_start", 1))
+        checkpointer.checkpoint()
+        store.observe(observation("task_start", 2))
+        with mock.patch.object(checkpointer, "_append_incremental", side_effect=OSError("No space left on device")):
+            with self.assertRaises(OSError):
+                checkpointer.checkpoint()
+        store.observe(observation("task_start", 3))
+        checkpointer.checkpoint()
+        self.assertEqual((checkpointer.stats["full"], checkpointer.stats["failed"]), (2, 1))
+        # Task 2's change was taken by the failed checkpoint; the full one after it still has it.
+        restored, _ = self.restore()
+        self.assertEqual(sorted(restored.get("p1").tasks_by_id), [1, 2, 3])
+        checkpointer.stop()
+
+    def test_background_checkpoints_survive_failures(self):
+        store = SessionStore()
+        checkpointer = StateCheckpointer(self.directory, store, interval_s=0.01)
+        store.observe(observation("task_start", 1))
+        with mock.patch.object(checkpointer, "_capture", side_effect=RuntimeError("dictionary changed size")):
+            with self.assertLogs("bioworkflowml.ai_action_streamer.state_checkpoint", "ERROR"):
+                checkpointer.start()
+                deadline = time.monotonic() + 5
+                while checkpointer.stats["failed"] < 2 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+        deadline = time.monotonic() + 5
+        while checkpointer.stats["full"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        checkpointer.stop()
+        self.assertGreaterEqual(checkpointer.stats["failed"], 2)
+        self.assertGreaterEqual(checkpointer.stats["full"], 2)  # The thread's, then stop()'s
+
+    def test_policies_are_reloaded(self):
+        path = os.path.join(self.tmp_dir.name, "v2.pkl")
+        with open(path, "wb") as f:
+            pickle.dump(ConstantPolicy("retry"), f)
+
+        async def checkpoint_registry():
+            registry = PolicyRegistry()
+            await registry.load("v2", path)
+            StateCheckpointer(self.directory, SessionStore(), registry).checkpoint()
+
+        asyncio.run(checkpoint_registry())
+        registry = PolicyRegistry()
+        self.restore(registry)
+        self.assertEqual(registry.decide(observation("task_start", 1)), ("retry", "v2"))
+
+    def test_advisor_scorer_and_reply_cache_are_restored(self):
+        advisor, scorer, cache = SchedulingAdvisor(), FailureScorer(), ReplyCache()
+        checkpointer = StateCheckpointer(self.directory, SessionStore(), scheduling_advisor=advisor,
+                                         failure_scorer=scorer, reply_cache=cache)
+        advisor.set_capacity("p1", cpus=8)
+        advisor.observe(observation("task_submit", 1, upstream_processes=["INDEX"]))
+        advisor.observe(observation("task_complete", 1, realtime_ms=30_000))
+        advisor.observe(observation("pipeline_complete", 0))
+        for realtime_ms in (10_000, 20_000):
+            scorer.observe(observation("task_progress", 2, realtime_ms=realtime_ms, rss_bytes=realtime_ms * 1000,
+                                       memory_limit_bytes=1 << 30))
+        for event_id in ("e1", "e2"):
+            cache.begin(event_id)
+        cache.complete("e1", nf_ai_comms_pb2.Action(action_id="first"))
+        checkpointer.checkpoint()
+        cache.complete("e2", nf_ai_comms_pb2.Action(action_id="second"))
+        cache.begin("e3")  # Still being decided at the crash
+        checkpointer.checkpoint()
+        self.assertEqual(checkpointer.stats["incremental"], 1)
+
+        restored_advisor, restored_scorer, restored_cache = SchedulingAdvisor(), FailureScorer(), ReplyCache()
+        asyncio.run(StateCheckpointer(self.directory, SessionStore(), scheduling_advisor=restored_advisor,
+                                      failure_scorer=restored_scorer, reply_cache=restored_cache).restore())
+        self.assertEqual(restored_advisor.state(), advisor.state())
+        self.assertEqual(restored_advisor.durations["ALIGN"], 30_000)
+        self.assertEqual(restored_advisor.pipelines["p1"].runs, 1)  # So the next run is ranked
+        task = restored_scorer.tasks["p1", 2]
+        self.assertEqual((task.readings, task.rss_bytes), (2, 20_000_000))
+        self.assertEqual(restored_cache.begin("e1")[1].action_id, "first")
+        self.assertEqual(restored_cache.begin("e2"), (DONE, nf_ai_comms_pb2.Action(action_id="second")))
+        self.assertEqual(restored_cache.begin("e3"), (NEW, None))
+        self.assertEqual(restored_cache.begin("e3"), (IN_PROGRESS, None))
+
+    def test_records_only_hold_plain_data(self):
+        payload = encode_record(ConstantPolicy("x"))[8:]
+        with self.assertRaises(pickle.UnpicklingError):
+            decode_payload(payload)
+        self.assertEqual(decode_payload(encode_record({"a": [1, 2.5, None]})[8:]), {"a": [1, 2.5, None]})
+
+
+if __name__ == '__main__':
+    unittest.main()
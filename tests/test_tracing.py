@@ -0,0 +1,102 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities import trace_tools
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.nf_client import send_task_observation
+from bioworkflowml.utilities.tracing import JsonlSpanExporter, Tracer, format_traceparent, parse_traceparent, to_otlp_json
+
+
+class TestTraceContext(unittest.TestCase):
+
+    def test_traceparent_round_trip(self):
+        header = format_traceparent("a" * 32, "b" * 16)
+        self.assertEqual(parse_traceparent(header), ("a" * 32, "b" * 16, True))
+        self.assertFalse(parse_traceparent(format_traceparent("a" * 32, "b" * 16, sampled=False))[2])
+        self.assertIsNone(parse_traceparent("garbage"))
+
+    def test_otlp_json_round_trip(self):
+        span = {"traceId": "a" * 32, "spanId": "b" * 16, "name": "network",
+                "startTimeUnixNano": 1, "endTimeUnixNano": 5, "attributes": {"derived": True, "bytes": 3}}
+        self.assertEqual(trace_tools.from_otlp_json(to_otlp_json([span], "svc")), [span])
+
+    def test_unsampled_client_is_not_traced(self):
+        tracer = Tracer("client", JsonlSpanExporter(os.devnull), sample_rate=0.0)
+        self.assertIsNone(tracer.start_client_trace())
+
+
+class TestEndToEndTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.client_spans = os.path.join(self.tmp_dir.name, "client.jsonl")
+        self.server_spans = os.path.join(self.tmp_dir.name, "server.jsonl")
+        self.client_tracer = Tracer("nf_client", JsonlSpanExporter(self.client_spans), sample_rate=1.0)
+        self.server_tracer = Tracer("ai_server", JsonlSpanExporter(self.server_spans))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def summarize(self):
+        self.client_tracer.close()
+        self.server_tracer.close()
+        return trace_tools.summarize(trace_tools.load_spans([self.client_spans, self.server_spans]))
+
+    def test_sync_server_reports_every_stage(self):
+        server = grpc.server(self.server_tracer.thread_pool(max_workers=2))
+        add = self.server_tracer.instrument(nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server)
+        add(AiActionServiceServicer(lambda message: None), server)
+        port = server.add_insecure_port("localhost:0")
+        server.start()
+        try:
+            for i in range(3):
+                action = send_task_observation({"event_id": f"e{i}"}, f"localhost:{port}",
+                                               tracer=self.client_tracer).result(timeout=10)
+                self.assertEqual(action.observation_event_id, f"e{i}")
+        finally:
+            server.stop(0)
+
+        summary = self.summarize()
+        self.assertEqual(summary["traces"], 3)
+        self.assertEqual(set(summary["stages"]), set(trace_tools.STAGES))
+        self.assertIn("Traces with complete client and server spans: 3", trace_tools.format_summary(summary))
+
+    def test_aio_server_records_policy_stage(self):
+        from bioworkflowml.ai_action_streamer.ai_action_streamer_server import AiActionServicer
+
+        async def serve_and_call():
+            server = grpc.aio.server()
+            add = self.server_tracer.instrument(nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server)
+            add(AiActionServicer(), server)
+            port = server.add_insecure_port("localhost:0")
+            await server.start()
+            try:
+                future = send_task_observation({"event_id": "aio"}, f"localhost:{port}", tracer=self.client_tracer)
+                return await asyncio.wrap_future(_as_concurrent_future(future))
+            finally:
+                await server.stop(0)
+
+        action = asyncio.run(serve_and_call())
+        self.assertEqual(action.observation_event_id, "aio")
+        summary = self.summarize()
+        self.assertEqual(summary["traces"], 1)
+        self.assertGreater(summary["stages"]["server.policy"]["mean_ms"], 0)
+        self.assertGreater(summary["stages"]["response"]["mean_ms"], 0)
+
+
+def _as_concurrent_future(grpc_future):
+    from concurrent.futures import Future
+    future = Future()
+    grpc_future.add_done_callback(
+        lambda f: future.set_exception(f.exception()) if f.exception() else future.set_result(f.result()))
+    return future
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import asyncio
+import unittest
+from concurrent import futures
+from unittest import mock
+
+import grpc
+
+from bioworkflowml.proto import nf_ai_comms_pb2
+from bioworkflowml.proto import nf_ai_comms_pb2_grpc
+from bioworkflowml.utilities.ai_server import AiActionServiceServicer
+from bioworkflowml.utilities.aio_client import AsyncAiClient
+from bioworkflowml.utilities.nf_client import send_task_observation
+from bioworkflowml.utilities.wire_format import (COMPRESS_MIN_ACTIONS, compression_algorithm, compression_metadata,
+                                   decode_observations, encode_batch, set_response_compression)
+
+
+def make_observations(count):
+    return [
+        nf_ai_comms_pb2.TaskObservation(
+            event_id=f"e{i}", event_type="task_complete", pipeline_name="rnaseq", process_name=f"PROC_{i % 3}",
+            task_id_num=i, task_hash=f"ab/{i:06x}", task_name=f"PROC_{i % 3} ({i})", status="COMPLETED",
+            cpu_percent="" if i % 2 else "98.5%", duration_ms=1000 + i,
+        )
+        for i in range(count)
+    ]
+
+
+class TestWireFormat(unittest.TestCase):
+
+    def test_encoded_batch_round_trips_and_is_smaller(self):
+        observations = make_observations(100)
+        encoded = encode_batch(observations)
+        self.assertEqual(encoded.strings[0], "")
+        self.assertLess(encoded.ByteSize(), nf_ai_comms_pb2.TaskObservationBatch(observations=observations).ByteSize())
+
+        decoded = decode_observations(nf_ai_comms_pb2.EncodedObservationBatch.FromString(encoded.SerializeToString()))
+        self.assertEqual(list(decoded), observations)
+        self.assertEqual(observations[0].pipeline_name, "rnaseq")  # The inputs are left untouched
+
+    def test_malformed_batches_are_rejected(self):
+        encoded = encode_batch(make_observations(2))
+        del encoded.string_refs[-1]
+        with self.assertRaises(ValueError):
+            decode_observations(encoded)
+        encoded = encode_batch(make_observations(2))
+        encoded.string_refs[0] = len(encoded.strings)
+        with self.assertRaises(ValueError):
+            decode_observations(encoded)
+        encoded = encode_batch(make_observations(2))
+        encoded.string_fields[0] = "duration_ms"
+        with self.assertRaises(ValueError):
+            decode_observations(encoded)
+
+    def test_compression_algorithm(self):
+        self.assertIs(compression_algorithm("GZIP"), grpc.Compression.Gzip)
+        self.assertIs(compression_algorithm(grpc.Compression.Deflate), grpc.Compression.Deflate)
+        self.assertIsNone(compression_algorithm(None))
+        with self.assertRaises(ValueError):
+            compression_algorithm("brotli")
+
+    def test_response_compression_follows_the_client(self):
+        def context(compression=None):
+            context = mock.Mock()
+            context.invocation_metadata.return_value = compression_metadata(compression)
+            return context
+
+        small, large = context("gzip"), context("deflate")
+        set_response_compression(small, COMPRESS_MIN_ACTIONS - 1, grpc.Compression.Gzip)
+        set_response_compression(large, COMPRESS_MIN_ACTIONS, grpc.Compression.Gzip)
+        small.set_compression.assert_not_called()  # Too small to gain from compression
+        large.set_compression.assert_called_once_with(grpc.Compression.Deflate)  # The client's choice wins
+
+        default, uncompressed = context(), context("none")
+        set_response_compression(default, 100, grpc.Compression.Gzip)
+        set_response_compression(uncompressed, 100, grpc.Compression.Gzip)
+        default.set_compression.assert_called_once_with(grpc.Compression.Gzip)
+        uncompressed.set_compression.assert_called_once_with(grpc.Compression.NoCompression)
+
+
+class RecordingServicer(AiActionServiceServicer):
+    """Records the compression each batch reply was given."""
+    def __init__(self, compression=None):
+        super().__init__(lambda message: None, compression=compression)
+        self.reply_compression = []
+
+    def SendTaskObservationBatch(self, request, context):
+        with mock.patch.object(context, "set_compression", wraps=context.set_compression) as set_compression:
+            response = super().SendTaskObservationBatch(request, context)
+        self.reply_compression.append(set_compression.call_args[0][0] if set_compression.called else None)
+        return response
+
+
+class TestCompressedCalls(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = grpc.server(futures.ThreadPoolExecutor(max_workers=4), compression=grpc.Compression.Gzip)
+        nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server(AiActionServiceServicer(lambda message: None), cls.server)
+        cls.address = f"localhost:{cls.server.add_insecure_port('localhost:0')}"
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop(0)
+
+    def test_deduplicated_and_compressed_batches(self):
+        observations = make_observations(300)
+
+        async def run():
+            async with AsyncAiClient(self.address, compression="gzip", dedup_strings=True) as client:
+                return (await client.send_many(observations, batch_size=128),
+                        await client.send_batch(observations[:5], compression="deflate"))
+
+        actions, overridden = asyncio.run(run())
+        self.assertEqual([a.observation_event_id for a in actions], [o.event_id for o in observations])
+        self.assertEqual(len(overridden), 5)
+
+    def test_malformed_encoded_batch_is_invalid_argument(self):
+        encoded = encode_batch(make_observations(2))
+        del encoded.string_refs[-1]
+        with grpc.insecure_channel(self.address) as channel:
+            stub = nf_ai_comms_pb2_grpc.AiActionServiceStub(channel)
+            with self.assertRaises(grpc.RpcError) as raised:
+                stub.SendEncodedObservationBatch(encoded, timeout=5)
+        self.assertEqual(raised.exception.code(), grpc.StatusCode.INVALID_ARGUMENT)
+
+    def test_batch_replies_are_compressed_like_the_batch(self):
+        servicer = RecordingServicer()
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+        nf_ai_comms_pb2_grpc.add_AiActionServiceServicer_to_server(servicer, server)
+        address = f"localhost:{server.add_insecure_port('localhost:0')}"
+        server.start()
+        self.addCleanup(server.stop, 0)
+
+        async def run():
+            async with AsyncAiClient(address, compression="gzip") as client:
+                large = await client.send_batch(make_observations(100))
+                await client.send_batch(make_observations(2))
+                await client.send_batch(make_observations(100), compression="none")
+                return large
+
+        self.assertEqual(len(asyncio.run(run())), 100)
+        self.assertEqual(servicer.reply_compression, [grpc.Compression.Gzip, None, grpc.Compression.NoCompression])
+
+    def test_nf_client_per_call_compression(self):
+        action = send_task_observation({"event_id": "gz"}, self.address, timeout=5, compression="gzip").result()
+        self.assertEqual(action.observation_event_id, "gz")
+
+
+if __name__ == '__main__':
+    unittest.main()